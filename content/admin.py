@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DeadLetterSubmission
+
+
+@admin.register(DeadLetterSubmission)
+class DeadLetterSubmissionAdmin(admin.ModelAdmin):
+    list_display = ("page", "accepted_at", "failed_at", "attempts")
+    readonly_fields = ("page", "form_data", "submission", "accepted_at", "failed_at", "attempts", "error")
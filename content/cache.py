@@ -0,0 +1,239 @@
+"""
+Full-page response cache and HTTP caching headers for public Wagtail pages.
+
+Anonymous GET responses are stored under a key made of the page id, its live
+revision, the site, the request path and the query parameters the page
+reads (``cache_query_params``). Each page also has a version in the
+cache, the time it was last purged; ``purge_page`` updates it (see
+``signal_handlers.py``) so every variant of that page is invalidated at once
+without having to enumerate keys. ``purge_all_pages`` does the same for every
+page.
+
+The same revision and version make up the ``ETag``, and ``Last-Modified`` is
+the later of the last publish and the last purge, so conditional requests are
+answered with 304 before anything is rendered. Anonymous responses may be
+kept by shared caches (``s-maxage``, ``stale-while-revalidate``); editors'
+responses are ``private, no-store``.
+
+Versions must be seen by every process that serves or purges pages, so the
+cache is only used with ``PAGE_CACHE_ENABLED``, which needs a shared cache
+(redis) as soon as there is more than one process (see core/checks.py).
+Validators are always sent; without a shared cache they only follow the
+live revision and ``last_published_at``.
+"""
+import hashlib
+import math
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from wagtail.models import Site
+
+from core.checks import cache_is_shared
+
+HIT_KEY = "page_cache:hits"
+MISS_KEY = "page_cache:misses"
+ALL_PAGES_VERSION_KEY = "page_cache:v:all"
+
+
+def get_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def _incr(key, delta=1):
+    cache = get_cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key, delta)
+
+
+def _version_key(page_id):
+    return f"page_cache:v:{page_id}"
+
+
+def purge_page(page_id):
+    get_cache().set(_version_key(page_id), time.time(), None)
+
+
+def purge_all_pages():
+    get_cache().set(ALL_PAGES_VERSION_KEY, time.time(), None)
+
+
+def page_version(page):
+    """When ``page`` was last purged, individually or with all pages."""
+    versions = get_cache().get_many([_version_key(page.id), ALL_PAGES_VERSION_KEY])
+    return max(versions.values(), default=0)
+
+
+def versions_are_shared():
+    """Whether every process reads the page versions this one would."""
+    return settings.PAGE_CACHE_ENABLED or cache_is_shared(settings.PAGE_CACHE_ALIAS)
+
+
+def page_validators(page, version):
+    """``(etag, last_modified)`` of the live version of ``page``."""
+    etag = '"%s-%s-%x"' % (page.id, page.live_revision_id, int(version * 1000))
+    published = page.last_published_at.timestamp() if page.last_published_at else 0
+    # rounded up, so a purge is never hidden inside the previous second
+    return etag, math.ceil(max(published, version)) or None
+
+
+def cache_stats():
+    cache = get_cache()
+    hits = cache.get(HIT_KEY, 0)
+    misses = cache.get(MISS_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HIT_KEY, MISS_KEY])
+
+
+def is_public_request(request):
+    return (
+        request.method in ("GET", "HEAD")
+        and not getattr(request, "is_preview", False)
+        and not request.user.is_authenticated
+    )
+
+
+def cache_variant(page, request):
+    """
+    The request path and the query parameters ``page`` reads, so junk query
+    strings share one cached copy instead of storing another.
+    """
+    params = sorted(
+        (name, value)
+        for name in getattr(page, "cache_query_params", ())
+        for value in request.GET.getlist(name)
+    )
+    return request.path + ("?" + urlencode(params) if params else "")
+
+
+def page_cache_key(page, request, version):
+    site = Site.find_for_request(request)
+    path = hashlib.md5(cache_variant(page, request).encode()).hexdigest()
+    return "page_cache:%s:%s:%s:%s:%s" % (
+        page.id,
+        version,
+        page.live_revision_id,
+        site.id if site else 0,
+        path,
+    )
+
+
+def is_shareable(request, response):
+    """Whether a rendered response is the same for every anonymous visitor."""
+    return not (
+        response.status_code != 200
+        or response.cookies
+        or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        or request.META.get("CSRF_COOKIE_USED")
+    )
+
+
+def _set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+
+
+def _set_public_cache_control(response):
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.PAGE_BROWSER_MAX_AGE,
+        s_maxage=settings.PAGE_SHARED_MAX_AGE,
+        stale_while_revalidate=settings.PAGE_STALE_WHILE_REVALIDATE,
+    )
+
+
+def _store(key, request, response):
+    if not is_shareable(request, response):
+        return
+    headers = {
+        name: value
+        for name, value in response.items()
+        if name.lower() not in ("set-cookie", "vary")
+    }
+    get_cache().set(key, (response.content, headers), settings.PAGE_CACHE_TIMEOUT)
+
+
+def _after_render(response, callback):
+    if hasattr(response, "add_post_render_callback"):
+        response.add_post_render_callback(callback)
+    else:
+        callback(response)
+
+
+class CachedPageMixin:
+    """
+    Answer anonymous conditional GETs with 304 and serve the rest from the
+    page cache, with validators and shared-cache headers. Logged-in editors,
+    previews and POSTs always get a freshly rendered page.
+    """
+
+    # query parameters that change the page's output
+    cache_query_params = ()
+
+    def serve(self, request, *args, **kwargs):
+        if not is_public_request(request):
+            response = super().serve(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_store=True)
+            return response
+        version = page_version(self) if versions_are_shared() else 0
+        etag, last_modified = page_validators(self, version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            _set_validators(response, etag, last_modified)
+            _set_public_cache_control(response)
+            return response
+
+        if not settings.PAGE_CACHE_ENABLED:
+            response = super().serve(request, *args, **kwargs)
+
+            def uncached(rendered):
+                if is_shareable(request, rendered):
+                    _set_validators(rendered, etag, last_modified)
+                    _set_public_cache_control(rendered)
+
+            _after_render(response, uncached)
+            return response
+
+        key = page_cache_key(self, request, version)
+        cached = get_cache().get(key)
+        if cached is not None:
+            _incr(HIT_KEY)
+            content, headers = cached
+            response = HttpResponse(content, headers=headers)
+            response["X-Page-Cache"] = "HIT"
+            return response
+        _incr(MISS_KEY)
+
+        response = super().serve(request, *args, **kwargs)
+
+        def finish(rendered):
+            # only known to be the same for everyone once rendered
+            if not is_shareable(request, rendered):
+                return
+            _set_validators(rendered, etag, last_modified)
+            _set_public_cache_control(rendered)
+            rendered["X-Page-Cache"] = "MISS"
+            _store(key, request, rendered)
+
+        _after_render(response, finish)
+        return response
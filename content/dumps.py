@@ -0,0 +1,235 @@
+"""
+Streaming export and import of site content.
+
+The files are in ``dumpdata``'s JSON format (natural foreign keys, explicit
+primary keys), so ``loaddata`` still reads them and ``import_content`` reads
+the existing ``db_backup`` dumps. Unlike ``dumpdata``/``loaddata``:
+
+- ``export_objects`` writes each object as soon as it is serialised,
+  reading every table in primary-key order in chunks;
+- ``iter_json_array`` parses the file one object at a time with
+  ``JSONDecoder.raw_decode``;
+- ``import_objects`` inserts consecutive objects of a model in batches with
+  one ``INSERT ... ON CONFLICT UPDATE`` each, without ``save()`` or signals.
+  For multi-table models (every page type) only the model's own table is
+  written; the ``wagtailcore.page`` rows come from their own entries. Page
+  ``depth``/``numchild`` are then fixed with treebeard's set-based
+  ``fix_tree`` instead of per-node updates.
+"""
+import gzip
+import itertools
+import json
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.constants import OnConflict
+from wagtail.models import Page
+
+# the page tree, what pages point to (revisions, images, documents, users)
+# and the content app
+DEFAULT_LABELS = [
+    "auth.group",
+    "auth.user",
+    "taggit",
+    "wagtailcore",
+    "wagtailimages",
+    "wagtaildocs",
+    "wagtailembeds",
+    "content",
+]
+# derived (rebuilt by update_index / rebuild_references_index) or
+# short-lived; also skipped when importing older full dumps
+DEFAULT_EXCLUDE = [
+    "wagtailcore.referenceindex",
+    "wagtailsearch",
+    "wagtailadmin.editingsession",
+    "sessions",
+]
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def open_dump(path, mode="rt"):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def resolve_models(labels, exclude=()):
+    """Models for ``app_label`` / ``app_label.Model`` labels, in dependency order."""
+    excluded = set()
+    for label in exclude:
+        if "." in label:
+            excluded.add(apps.get_model(label))
+        else:
+            excluded.update(apps.get_app_config(label).get_models())
+
+    app_list = {}
+    for label in labels:
+        if "." in label:
+            model = apps.get_model(label)
+            app_list.setdefault(model._meta.app_config, []).append(model)
+        else:
+            app_config = apps.get_app_config(label)
+            app_list.setdefault(app_config, []).extend(app_config.get_models())
+
+    models = serializers.sort_dependencies(app_list.items(), allow_cycles=True)
+    return [
+        model for model in dict.fromkeys(models)
+        if model not in excluded and not model._meta.proxy and model._meta.managed
+    ]
+
+
+def export_objects(out, models, batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Write ``models`` to the text stream ``out`` as a JSON array. Returns the
+    number of objects written per model label.
+    """
+    counts = {}
+    out.write("[")
+    first = True
+    for model in models:
+        queryset = model._base_manager.using(using).order_by(model._meta.pk.name)
+        m2m = [
+            field.name for field in model._meta.many_to_many
+            if field.remote_field.through._meta.auto_created
+        ]
+        if m2m:
+            queryset = queryset.prefetch_related(*m2m)
+
+        count = 0
+        objects = queryset.iterator(chunk_size=batch_size)
+        while chunk := list(itertools.islice(objects, batch_size)):
+            for item in serializers.serialize("python", chunk, use_natural_foreign_keys=True):
+                out.write("\n" if first else ",\n")
+                out.write(json.dumps(item, cls=DjangoJSONEncoder, ensure_ascii=False))
+                first = False
+            count += len(chunk)
+        counts[model._meta.label_lower] = count
+    out.write("\n]\n")
+    return counts
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """
+    Yield the objects of a top-level JSON array read from ``file`` in chunks
+    of ``chunk_size`` characters, keeping only the unparsed tail in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        # whitespace, the opening bracket and the commas between items
+        while pos < len(buffer) and buffer[pos] in " \t\r\n[,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos < len(buffer):
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                continue
+        elif eof:
+            return
+
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def _insert(model, objects, batch_size, using):
+    meta = model._meta
+    fields = meta.local_concrete_fields
+    update_fields = [field for field in fields if not field.primary_key]
+    size = max(1, min(batch_size, connections[using].ops.bulk_batch_size(fields, objects)))
+    for start in range(0, len(objects), size):
+        model._base_manager.using(using)._insert(
+            objects[start:start + size],
+            fields=fields,
+            using=using,
+            raw=True,
+            on_conflict=OnConflict.UPDATE if update_fields else OnConflict.IGNORE,
+            update_fields=update_fields or None,
+            unique_fields=[meta.pk] if update_fields else None,
+        )
+
+
+def _set_m2m(model, deserialized, using):
+    for field in model._meta.many_to_many:
+        if field.name not in (deserialized[0].m2m_data or {}):
+            continue
+        rows = [
+            (item.object.pk, value)
+            for item in deserialized
+            for value in item.m2m_data.get(field.name, ())
+        ]
+        through = field.remote_field.through
+        source = field.m2m_field_name() + "_id"
+        target = field.m2m_reverse_field_name() + "_id"
+        through._base_manager.using(using).filter(
+            **{source + "__in": [item.object.pk for item in deserialized]}
+        ).delete()
+        through._base_manager.using(using).bulk_create(
+            [through(**{source: pk, target: value}) for pk, value in rows],
+            batch_size=1000,
+        )
+
+
+def _excluded(label, exclude):
+    return label in exclude or label.partition(".")[0] in exclude
+
+
+def import_objects(items, batch_size=500, using=DEFAULT_DB_ALIAS, exclude=DEFAULT_EXCLUDE):
+    """
+    Insert or update the objects of the serialised ``items`` (dicts in
+    ``dumpdata`` format), skipping the app or model labels in ``exclude``.
+    Returns the number of objects per model label.
+    """
+    items = (item for item in items if not _excluded(item["model"].lower(), exclude))
+    connection = connections[using]
+    counts = {}
+    deferred = []
+
+    def flush(batch):
+        model = type(batch[0].object)
+        _insert(model, [item.object for item in batch], batch_size, using)
+        _set_m2m(model, batch, using)
+        label = model._meta.label_lower
+        counts[label] = counts.get(label, 0) + len(batch)
+
+    with transaction.atomic(using=using):
+        with connection.constraint_checks_disabled():
+            # natural foreign keys are looked up while deserialising, so each
+            # batch is only deserialised once the previous one is written
+            for _, group in itertools.groupby(items, key=lambda item: item["model"].lower()):
+                while batch := list(itertools.islice(group, batch_size)):
+                    batch = list(serializers.deserialize(
+                        "python", batch, using=using,
+                        ignorenonexistent=True, handle_forward_references=True,
+                    ))
+                    flush(batch)
+                    deferred += [item for item in batch if item.deferred_fields]
+            # natural keys of objects that came later in the file
+            for item in deferred:
+                item.save_deferred_fields(using=using)
+
+        models = [apps.get_model(label) for label in counts]
+        connection.check_constraints(table_names=[model._meta.db_table for model in models])
+        if any(issubclass(model, Page) for model in models):
+            Page.fix_tree()
+
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+    return counts
@@ -0,0 +1,138 @@
+"""
+Embeds without network I/O at render time.
+
+Wagtail expands ``<embed embedtype="media">`` in rich text by calling the
+oEmbed provider whenever the ``Embed`` table has no fresh row for the URL.
+Here that lookup happens ahead of time instead: publishing a page enqueues
+``resolve_page_embeds`` (see tasks.py) for any URL not stored yet, and the
+``resolve_embeds`` command re-resolves in bulk. ``render_embed`` only reads
+the table, ignoring expiry, and falls back to a click-to-load placeholder.
+Block and rich text caches never store HTML with a placeholder in it, so the
+next render picks up the embed once it is stored, whichever process
+resolved it.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.template.loader import render_to_string
+from django.utils import timezone
+from wagtail.embeds.embeds import get_embed, get_embed_hash, get_finder_for_embed
+from wagtail.embeds.exceptions import EmbedException
+from wagtail.embeds.models import Embed
+from wagtail.embeds.rich_text import MediaEmbedHandler
+from wagtail.fields import RichTextField, StreamField
+from wagtail.rich_text.rewriters import FIND_EMBED_TAG, extract_attrs
+
+
+def stored_embed(url):
+    return Embed.objects.filter(hash=get_embed_hash(url)).first()
+
+
+PLACEHOLDER_CLASS = 'class="embed-placeholder"'
+
+
+def has_placeholder(html):
+    return PLACEHOLDER_CLASS in html
+
+
+def render_embed(url):
+    embed = stored_embed(url)
+    if embed is not None and embed.html:
+        return render_to_string("wagtailembeds/embed_frontend.html", {"embed": embed})
+    return render_to_string("content/includes/embed_placeholder.html", {"url": url})
+
+
+class StoredMediaEmbedHandler(MediaEmbedHandler):
+    """Front-end handler for ``embedtype="media"`` that never fetches."""
+
+    @staticmethod
+    def expand_db_attributes(attrs):
+        return render_embed(attrs["url"])
+
+
+def _iter_strings(data):
+    if isinstance(data, str):
+        yield data
+    elif isinstance(data, dict):
+        for value in data.values():
+            yield from _iter_strings(value)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            yield from _iter_strings(value)
+
+
+def page_embed_urls(page):
+    """The media embed URLs in a page's rich text and StreamFields."""
+    urls = []
+    for field in page._meta.get_fields():
+        if isinstance(field, StreamField):
+            data = list(getattr(page, field.name).raw_data)
+        elif isinstance(field, RichTextField):
+            data = getattr(page, field.name)
+        else:
+            continue
+        for text in _iter_strings(data):
+            for match in FIND_EMBED_TAG.finditer(text):
+                attrs = extract_attrs(match.group(1))
+                if attrs.get("embedtype") == "media" and attrs.get("url"):
+                    urls.append(attrs["url"])
+    return list(dict.fromkeys(urls))
+
+
+def missing_embed_urls(urls):
+    stored = set(
+        Embed.objects.filter(hash__in=[get_embed_hash(url) for url in urls])
+        .values_list("hash", flat=True)
+    )
+    return [url for url in urls if get_embed_hash(url) not in stored]
+
+
+class RateLimiter:
+    """Spaces calls from any number of threads at least ``1 / rate`` apart."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def resolve_embeds(urls, workers=4, rate=None, refresh=False):
+    """
+    Fetch ``urls`` from their oEmbed providers and store them. Only the
+    provider calls run in the ``workers`` threads, at most ``rate`` per
+    second; rows are written from the calling thread. Without ``refresh``
+    URLs that are already stored are skipped. Returns ``(resolved, errors)``.
+    """
+    if not refresh:
+        urls = missing_embed_urls(urls)
+    limiter = RateLimiter(rate)
+
+    def find(url):
+        limiter.wait()
+        try:
+            return url, get_finder_for_embed(url), None
+        except EmbedException as exc:
+            return url, None, exc
+
+    resolved = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for url, embed_dict, error in pool.map(find, urls):
+            if error is not None:
+                errors.append((url, repr(error)))
+                continue
+            # an expired row makes get_embed replace it rather than return it
+            Embed.objects.filter(hash=get_embed_hash(url)).update(cache_until=timezone.now())
+            embed_dict.setdefault("cache_until", None)
+            get_embed(url, finder=lambda *args: embed_dict)
+            resolved.append(url)
+    return resolved, errors
@@ -0,0 +1,135 @@
+"""
+Render cache for StreamField blocks.
+
+Each block is cached under its stream block id and a hash of its raw JSON, so
+a block that did not change is reused by every later revision and by
+previews, while an edited block gets a new key. Rendered blocks only see
+their own value (no page or request in the context), which is what makes
+them shareable.
+
+On a miss, all images referenced by the stream's blocks are loaded in one
+query, and their renditions in another, before anything is rendered.
+
+Changing an image (a new file or focal point changes its rendition URLs) or
+resolving embeds that were rendered as placeholders bumps a global version
+that is part of every key. Blocks with rich text also have the versions of
+the pages, documents and images it links to in their key, and their rich
+text is expanded in one batch (see richtext.py).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.safestring import mark_safe
+from wagtail.images.blocks import ImageChooserBlock
+from wagtail.images.models import Image
+
+from .cache import _incr, get_cache
+from .embeds import has_placeholder
+from .renditions import responsive_filters
+from .richtext import (
+    expand_richtext,
+    prefetched,
+    purge_all_richtext,
+    reference_versions,
+    references,
+    references_digest,
+    rich_strings,
+)
+
+IMAGES_VERSION_KEY = "block_cache:images"
+
+
+def purge_block_fragments():
+    _incr(IMAGES_VERSION_KEY)
+    # images and refreshed embeds in rich text outside blocks, too
+    purge_all_richtext()
+
+
+def block_cache_key(raw_block, images_version, references=""):
+    digest = hashlib.sha1(
+        json.dumps(raw_block.get("value"), sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return "block_cache:%s:%s:%s:%s%s" % (
+        images_version,
+        raw_block.get("type"),
+        raw_block.get("id"),
+        digest,
+        f":{references}" if references else "",
+    )
+
+
+def prefetch_block_images(bound_blocks, filters=None):
+    """
+    Prefetch the renditions (``filters``, by default the responsive set) of
+    every image chosen in the given StructBlock values, in one query.
+    """
+    images = []
+    for bound_block in bound_blocks:
+        child_blocks = getattr(bound_block.block, "child_blocks", {})
+        for name, child_block in child_blocks.items():
+            image = bound_block.value.get(name)
+            if isinstance(child_block, ImageChooserBlock) and image is not None:
+                images.append(image)
+    if not images:
+        return
+    renditions = Image.get_rendition_model().objects.filter(
+        filter_spec__in=filters or responsive_filters()
+    )
+    prefetch_related_objects(
+        images,
+        Prefetch("renditions", queryset=renditions, to_attr="prefetched_renditions"),
+    )
+
+
+def _render_blocks(bound_blocks, raw_blocks, expanded):
+    sources = [s for raw in raw_blocks for s in rich_strings(raw.get("value"))]
+    missing = [s for s in sources if s not in (expanded or {})]
+    with prefetched({**(expanded or {}), **expand_richtext(missing)}):
+        return [block.render() for block in bound_blocks]
+
+
+def render_stream(stream_value, expanded_richtext=None):
+    """
+    Render every block of ``stream_value`` through its block template, taking
+    unchanged blocks from the cache. ``expanded_richtext`` is the page's
+    already expanded rich text, if any (see richtext.py).
+    """
+    raw_blocks = list(stream_value.raw_data)
+    if not raw_blocks:
+        return ""
+    if not settings.BLOCK_CACHE_ENABLED:
+        return mark_safe("".join(
+            _render_blocks(list(stream_value), raw_blocks, expanded_richtext)
+        ))
+
+    block_refs = [references(rich_strings(raw.get("value"))) for raw in raw_blocks]
+    versions = reference_versions(
+        (ref for refs in block_refs for ref in refs), extra_keys=[IMAGES_VERSION_KEY]
+    )
+    images_version = versions.get(IMAGES_VERSION_KEY, 0)
+    keys = [
+        block_cache_key(raw, images_version, references_digest(refs, versions) if refs else "")
+        for raw, refs in zip(raw_blocks, block_refs)
+    ]
+    cache = get_cache()
+    rendered = cache.get_many(keys)
+
+    missing = [i for i, key in enumerate(keys) if key not in rendered]
+    if missing:
+        # converting one block converts all blocks of its type, with one
+        # query per chooser; renditions are fetched here in one more
+        bound_blocks = [stream_value[i] for i in missing]
+        prefetch_block_images(bound_blocks)
+        fresh = dict(zip(
+            (keys[i] for i in missing),
+            _render_blocks(bound_blocks, [raw_blocks[i] for i in missing], expanded_richtext),
+        ))
+        cache.set_many(
+            {key: html for key, html in fresh.items() if not has_placeholder(html)},
+            settings.BLOCK_CACHE_TIMEOUT,
+        )
+        rendered.update(fresh)
+
+    return mark_safe("".join(rendered[key] for key in keys))
@@ -0,0 +1,105 @@
+"""
+Cursor pagination for the photo gallery pages.
+
+Both the page templates and the JSON endpoints in ``views.py`` use these
+helpers, so the first batch rendered into the HTML and the batches fetched
+while scrolling are built the same way.
+"""
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.urls import reverse
+from wagtail.images.models import Image
+
+from .renditions import srcset
+
+
+def srcset_filters():
+    # 4:3 crops, matching the fill-400x300 thumbnails
+    return [f"fill-{width}x{width * 3 // 4}" for width in settings.GALLERY_SRCSET_WIDTHS]
+
+
+def image_data(image, alt=""):
+    renditions = list(image.get_renditions(*srcset_filters()).values())
+    thumbnail = renditions[0]
+    return {
+        "id": image.id,
+        "alt": alt or image.default_alt_text,
+        "src": thumbnail.url,
+        "width": thumbnail.width,
+        "height": thumbnail.height,
+        "srcset": srcset(renditions),
+    }
+
+
+def _page_size(size):
+    return min(size or settings.GALLERY_PAGE_SIZE, settings.GALLERY_MAX_PAGE_SIZE)
+
+
+def paginate_images(event, after=None, size=None):
+    """
+    One batch of an event's photos, ordered by ``PhotoGalleryImage.pk`` and
+    starting after the ``after`` cursor.
+    """
+    size = _page_size(size)
+    queryset = event.get_gallery_images(filters=srcset_filters())
+    if after:
+        queryset = queryset.filter(pk__gt=after)
+    batch = list(queryset[: size + 1])
+
+    items = [
+        dict(image_data(item.image, item.caption), caption=item.caption)
+        for item in batch[:size]
+    ]
+    next_cursor = batch[size - 1].pk if len(batch) > size else None
+    return {
+        "items": items,
+        "next": next_cursor,
+        "next_url": (
+            "%s?after=%s" % (reverse("gallery_images", args=[event.id]), next_cursor)
+            if next_cursor else None
+        ),
+    }
+
+
+def paginate_events(index, after=None, size=None, request=None):
+    """
+    One batch of an index page's events in tree order (cursor = page path),
+    each with a cover photo: the event's first gallery image.
+    """
+    from .models import PhotoGalleryImage
+
+    size = _page_size(size)
+    cover = PhotoGalleryImage.objects.filter(page=OuterRef("pk")).order_by("pk")
+    queryset = index.get_events().annotate(
+        cover_image_id=Subquery(cover.values("image_id")[:1])
+    )
+    if after:
+        queryset = queryset.filter(path__gt=after)
+    batch = list(queryset[: size + 1])
+    events = batch[:size]
+
+    covers = (
+        Image.objects.filter(id__in=[e.cover_image_id for e in events if e.cover_image_id])
+        .prefetch_renditions(*srcset_filters())
+        .in_bulk()
+    )
+    items = []
+    for event in events:
+        image = covers.get(event.cover_image_id)
+        items.append({
+            "id": event.id,
+            "title": event.title,
+            "url": event.get_url(request),
+            "event_date": event.event_date,
+            "cover": image_data(image, event.title) if image else None,
+        })
+
+    next_cursor = batch[size - 1].path if len(batch) > size else None
+    return {
+        "items": items,
+        "next": next_cursor,
+        "next_url": (
+            "%s?after=%s" % (reverse("gallery_events", args=[index.id]), next_cursor)
+            if next_cursor else None
+        ),
+    }
@@ -0,0 +1,127 @@
+"""
+Highlights from the Wagtail tree for the home page (``core.views.home``).
+
+The latest achievements, media updates and gallery events are gathered into
+plain data with a fixed number of queries and cached under ``home_state``,
+read from the database, so a publish, unpublish or delete is seen by every
+process whatever the cache. Page moves and image changes bump a version number
+instead (``purge_home``, see ``signal_handlers.py``), which other processes
+only see with a shared cache.
+"""
+from django.conf import settings
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from wagtail.images.models import Image
+from wagtail.models import Page
+
+from .cache import _incr, get_cache
+from .fragments import prefetch_block_images
+from .gallery import image_data, srcset_filters
+from .richtext import expand_richtext, render_richtext
+
+HOME_VERSION_KEY = "home:v"
+
+
+def highlight_page_types():
+    from .models import AchievementPage, MediaUpdatesPage, PhotoGalleryEventPage
+
+    return (AchievementPage, MediaUpdatesPage, PhotoGalleryEventPage)
+
+
+def purge_home():
+    _incr(HOME_VERSION_KEY)
+
+
+def home_version():
+    return get_cache().get(HOME_VERSION_KEY, 0)
+
+
+def home_state():
+    """
+    ``(count, last_published)`` of the live highlighted pages, in one query.
+    """
+    state = (
+        Page.objects.live().public().type(*highlight_page_types())
+        .aggregate(count=Count("id"), latest=Max("last_published_at"))
+    )
+    return state["count"], state["latest"]
+
+
+def _excerpt(html, words=25):
+    return Truncator(strip_tags(html)).words(words)
+
+
+def _latest_blocks(model, field_name, count):
+    """The first ``count`` blocks of the most recently published pages."""
+    pages = model.objects.live().public().order_by("-last_published_at")
+    blocks = []
+    for page in pages.iterator():
+        for block in getattr(page, field_name):
+            blocks.append((page, block))
+            if len(blocks) == count:
+                return blocks
+    return blocks
+
+
+def _block_items(model, field_name, image_name, count):
+    blocks = _latest_blocks(model, field_name, count)
+    prefetch_block_images([block for _, block in blocks], srcset_filters())
+    items = []
+    for page, block in blocks:
+        value = block.value
+        image = value.get(image_name)
+        items.append({
+            "title": value["title"],
+            "url": page.url,
+            "image": image_data(image, value["title"]) if image else None,
+            "value": value,
+        })
+    return items
+
+
+def _events(count):
+    from .models import PhotoGalleryEventPage, PhotoGalleryImage
+
+    cover = PhotoGalleryImage.objects.filter(page=OuterRef("pk")).order_by("pk")
+    events = list(
+        PhotoGalleryEventPage.objects.live().public()
+        .annotate(cover_image_id=Subquery(cover.values("image_id")[:1]))
+        .order_by(F("event_date").desc(nulls_last=True), "-first_published_at")[:count]
+    )
+    covers = (
+        Image.objects.filter(id__in=[e.cover_image_id for e in events if e.cover_image_id])
+        .prefetch_renditions(*srcset_filters())
+        .in_bulk()
+    )
+    return [
+        {
+            "title": event.title,
+            "url": event.url,
+            "event_date": event.event_date,
+            "image": (
+                image_data(covers[event.cover_image_id], event.title)
+                if event.cover_image_id in covers else None
+            ),
+        }
+        for event in events
+    ]
+
+
+def build_highlights(count=None):
+    from .models import AchievementPage, MediaUpdatesPage
+
+    count = count or settings.HOME_HIGHLIGHTS_COUNT
+    achievements = _block_items(AchievementPage, "achievements", "image", count)
+    descriptions = [item.pop("value")["description"].source for item in achievements]
+    expanded = expand_richtext(descriptions)
+    for item, description in zip(achievements, descriptions):
+        item["excerpt"] = _excerpt(render_richtext(description, expanded))
+    media_updates = _block_items(MediaUpdatesPage, "media_updates", "thumbnail", count)
+    for item in media_updates:
+        item["link"] = item.pop("value")["media_link"]
+    return {
+        "achievements": achievements,
+        "media_updates": media_updates,
+        "events": _events(count),
+    }
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from wagtail.documents.models import Document
+
+
+class Command(BaseCommand):
+    help = "Store the content hash and size of documents uploaded without them."
+
+    def handle(self, *args, **options):
+        updated = 0
+        missing = Document.objects.filter(Q(file_hash="") | Q(file_size__isnull=True))
+        for doc in missing.iterator():
+            try:
+                doc._set_document_file_metadata()
+            except FileNotFoundError:
+                self.stderr.write(f"document {doc.id}: {doc.file.name} is missing")
+                continue
+            doc.save(update_fields=["file_hash", "file_size"])
+            updated += 1
+        self.stdout.write(f"updated {updated} documents")
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from content.models import QueuedSubmission
+from content.recaptcha import reset_verifier
+from content.seed import seed_site, seeded_pages
+from core.bench import format_summary, start_siteverify_stub, summarize
+
+PAGE_LABELS = [
+    "simple", "achievements", "media_updates", "objectives", "gr", "rti",
+    "gallery_index", "gallery_event", "contact",
+]
+MODES = ("wsgi", "asgi")
+
+
+def _workload(pages, requests, contact_every):
+    """``(kind, method, url, data)`` for each request, in order."""
+    urls = ["/"] + [pages[label].url for label in PAGE_LABELS]
+    contact = pages["contact"]
+    data = {field.clean_name: "benchmark" for field in contact.get_form_fields()}
+    submit_url = reverse("contact_submit", args=[contact.id])
+    tokens = itertools.count()
+    urls = itertools.cycle(urls)
+    for i in range(requests):
+        if contact_every and i % contact_every == contact_every - 1:
+            # a fresh token each time, or the verifier rejects it as replayed
+            yield "contact", "post", submit_url, dict(
+                data, **{"g-recaptcha-response": f"bench-{next(tokens)}"}
+            )
+        else:
+            yield "page", "get", next(urls), None
+
+
+def _check(method, url, response):
+    if response.status_code != 200:
+        raise CommandError(f"{method.upper()} {url}: {response.status_code}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and tail latency of the site under WSGI (sync "
+        "views, a fixed number of worker threads) and ASGI (ASYNC_VIEWS) "
+        "with a mix of page views and contact form posts, while a local stub "
+        "of reCAPTCHA's siteverify answers slowly. Each mode runs in its own "
+        "process against the small seeded site (see seed_content)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument(
+            "--concurrency", type=int, default=32, help="Simultaneous clients."
+        )
+        parser.add_argument(
+            "--threads", type=int, default=8,
+            help="WSGI worker threads, e.g. gunicorn --threads (default 8).",
+        )
+        parser.add_argument(
+            "--contact-every", type=int, default=5,
+            help="Every Nth request is a contact form post (0: none).",
+        )
+        parser.add_argument(
+            "--upstream-delay", type=float, default=0.3,
+            help="Seconds the stub verifier takes to answer (default 0.3).",
+        )
+        parser.add_argument("--mode", choices=MODES, help="Run one mode in this process.")
+        parser.add_argument("--verify-url", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            return self.run_mode(options)
+
+        if seeded_pages("small") is None:
+            self.stdout.write("seeding small ...")
+            seed_site("small")
+
+        server, verify_url = start_siteverify_stub(options["upstream_delay"])
+        try:
+            for mode in MODES:
+                env = dict(
+                    os.environ,
+                    SERVER_MODE=mode,
+                    ASYNC_VIEWS=str(mode == "asgi"),
+                    # connection pooling needs PostgreSQL; keep both modes alike
+                    DB_POOL=os.environ.get("DB_POOL", "False"),
+                )
+                command = [
+                    sys.executable, str(settings.BASE_DIR / "manage.py"), "bench_asgi",
+                    "--mode", mode, "--verify-url", verify_url,
+                    *(f"--{name.replace('_', '-')}={options[name]}" for name in (
+                        "requests", "concurrency", "threads", "contact_every",
+                    )),
+                ]
+                result = subprocess.run(command, env=env, capture_output=True, text=True)
+                if result.returncode:
+                    raise CommandError(f"{mode} run failed:\n{result.stderr}")
+                for label, summary in json.loads(result.stdout.splitlines()[-1]).items():
+                    self.stdout.write(format_summary(f"{mode} {label}", summary))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def run_mode(self, options):
+        if settings.ASYNC_VIEWS != (options["mode"] == "asgi"):
+            raise CommandError("Set ASYNC_VIEWS to match --mode.")
+        pages = seeded_pages("small")
+        if pages is None:
+            raise CommandError("Run seed_content small first.")
+        workload = list(_workload(pages, options["requests"], options["contact_every"]))
+
+        with override_settings(
+            ALLOWED_HOSTS=["*"],
+            RECAPTCHA_VERIFY_URL=options["verify_url"],
+            TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}},
+        ):
+            reset_verifier()
+            run = self.run_wsgi if options["mode"] == "wsgi" else self.run_asgi
+            latencies, wall_time = run(workload, options)
+            reset_verifier()
+        QueuedSubmission.objects.filter(page=pages["contact"]).delete()
+
+        summaries = {
+            label: summarize(values, wall_time)
+            for label, values in latencies.items() if values
+        }
+        summaries["all"] = summarize(sum(latencies.values(), []), wall_time)
+        self.stdout.write(json.dumps(summaries))
+
+    def run_wsgi(self, workload, options):
+        """
+        ``concurrency`` clients sharing ``threads`` workers: a request's
+        latency includes the wait for a free worker, as behind gunicorn.
+        """
+        jobs = iter(workload)
+        jobs_lock = threading.Lock()
+        workers = threading.Semaphore(options["threads"])
+        latencies = {"page": [], "contact": []}
+
+        def client_loop(_):
+            client = Client()
+            while True:
+                with jobs_lock:
+                    job = next(jobs, None)
+                if job is None:
+                    return
+                kind, method, url, data = job
+                started = time.perf_counter()
+                with workers:
+                    response = getattr(client, method)(url, data, **_headers(kind))
+                latencies[kind].append(time.perf_counter() - started)
+                _check(method, url, response)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            list(pool.map(client_loop, range(options["concurrency"])))
+        return latencies, time.perf_counter() - started
+
+    def run_asgi(self, workload, options):
+        """``concurrency`` clients on one event loop, as one ASGI worker."""
+        latencies = {"page": [], "contact": []}
+
+        async def client_loop(jobs):
+            client = AsyncClient()
+            for kind, method, url, data in jobs:
+                started = time.perf_counter()
+                response = await getattr(client, method)(url, data, **_headers(kind))
+                latencies[kind].append(time.perf_counter() - started)
+                _check(method, url, response)
+
+        async def main():
+            jobs = iter(workload)
+            await asyncio.gather(*(
+                client_loop(jobs) for _ in range(options["concurrency"])
+            ))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return latencies, time.perf_counter() - started
+
+
+def _headers(kind):
+    return {"headers": {"x-requested-with": "XMLHttpRequest"}} if kind == "contact" else {}
+
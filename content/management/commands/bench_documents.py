@@ -0,0 +1,79 @@
+import os
+import tempfile
+import tracemalloc
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from wagtail.documents.models import Document
+from wagtail.documents.views.serve import serve as wagtail_serve_document
+
+from content.views import serve_document
+from core.bench import format_summary, run_concurrent, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent downloads of a large document through wagtail's "
+        "serve view and through content.views.serve_document."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=40)
+        parser.add_argument("--concurrency", type=int, default=8)
+
+    def handle(self, *args, **options):
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(options["size_mb"]):
+                tmp.write(chunk)
+            tmp.flush()
+            tmp.seek(0)
+            doc = Document.objects.create(
+                title="Benchmark document", file=File(tmp, name="benchmark.pdf")
+            )
+
+        try:
+            self.run(doc, options)
+        finally:
+            doc.file.delete(save=False)
+            doc.delete()
+
+    def run(self, doc, options):
+        factory = RequestFactory()
+        etag = '"%s"' % doc.file_hash
+        scenarios = [
+            ("full download (wagtail)", wagtail_serve_document, {}),
+            ("full download (streaming)", serve_document, {}),
+            ("revalidate (wagtail)", wagtail_serve_document, {"If-None-Match": etag}),
+            ("revalidate (streaming)", serve_document, {"If-None-Match": etag}),
+            ("range 1MB (streaming)", serve_document, {"Range": "bytes=0-1048575"}),
+        ]
+
+        self.stdout.write(
+            f"{options['size_mb']}MB document, {options['requests']} requests, "
+            f"concurrency {options['concurrency']}"
+        )
+        for label, view, headers in scenarios:
+
+            def download():
+                request = factory.get(doc.url, headers=headers)
+                request.user = AnonymousUser()
+                response = view(request, doc.id, doc.filename)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                response.close()
+
+            tracemalloc.start()
+            latencies, wall_time = run_concurrent(
+                download, options["requests"], options["concurrency"]
+            )
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(
+                format_summary(label, summarize(latencies, wall_time))
+                + f"  peak {peak / 1024 / 1024:6.1f}MB"
+            )
@@ -0,0 +1,165 @@
+import itertools
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from content.models import QueuedSubmission
+from content.recaptcha import reset_verifier
+from content.seed import SCALES, seed_site, seeded_pages
+from core.bench import measure, regressions, start_siteverify_stub
+
+BASELINE = Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"
+
+PAGE_LABELS = [
+    "simple", "achievements", "media_updates", "objectives", "gr", "rti",
+    "gallery_index", "gallery_event", "contact",
+]
+
+
+def _get(client, url, **headers):
+    def request():
+        response = client.get(url, headers=headers)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url}: {response.status_code}")
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+    return request
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency, SQL queries and peak memory of every page type, the "
+        "home page, search, document downloads and the contact form on "
+        "seeded content (see seed_content), with and without the page and "
+        "block caches, and compare with a baseline file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scales", nargs="*", help="Any of %s (default: small)." % ", ".join(SCALES)
+        )
+        parser.add_argument("--requests", type=int, default=20)
+        parser.add_argument("--baseline", default=str(BASELINE))
+        parser.add_argument(
+            "--write-baseline", action="store_true",
+            help="Store these results as the baseline instead of comparing.",
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=0.5,
+            help="Allowed slowdown or memory growth over the baseline, as a "
+                 "fraction (default 0.5). Any extra query is a regression.",
+        )
+        parser.add_argument(
+            "--reseed", action="store_true", help="Seed again even if present."
+        )
+
+    def handle(self, *args, **options):
+        scales = options["scales"] or ["small"]
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise CommandError("Unknown scale: %s" % ", ".join(sorted(unknown)))
+
+        server, verify_url = start_siteverify_stub()
+        overrides = override_settings(
+            ALLOWED_HOSTS=["*"],
+            RECAPTCHA_VERIFY_URL=verify_url,
+            # the request path only; no task rows or emails
+            TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}},
+        )
+        results = {}
+        try:
+            with overrides:
+                reset_verifier()
+                for scale in scales:
+                    results.update(self.run_scale(scale, options))
+        finally:
+            reset_verifier()
+            server.shutdown()
+            server.server_close()
+
+        self.report(results, options)
+
+    def run_scale(self, scale, options):
+        pages = None if options["reseed"] else seeded_pages(scale)
+        if pages is None:
+            self.stdout.write(f"seeding {scale} ...")
+            pages = seed_site(scale)
+
+        client = Client()
+        event = pages["gallery_event"]
+        scenarios = [("home", _get(client, "/"))]
+        scenarios += [(label, _get(client, pages[label].url)) for label in PAGE_LABELS]
+        scenarios += [
+            ("gr filtered", _get(client, pages["gr"].url + "?q=circular&sort=-title&page=2")),
+            ("gallery images json", _get(client, reverse("gallery_images", args=[event.id]))),
+            ("search", _get(client, reverse("search") + "?q=admissions")),
+        ]
+
+        results = {}
+        for mode, cached in (("cached", True), ("uncached", False)):
+            with override_settings(
+                PAGE_CACHE_ENABLED=cached, BLOCK_CACHE_ENABLED=cached, RICHTEXT_CACHE_ENABLED=cached
+            ):
+                for label, request in scenarios:
+                    name = f"{scale}/{label} ({mode})"
+                    results[name] = measure(request, options["requests"])
+                    self.write_result(name, results[name])
+
+        name = f"{scale}/document download"
+        results[name] = measure(_get(client, pages["document"].url), options["requests"])
+        self.write_result(name, results[name])
+
+        name = f"{scale}/contact submit"
+        results[name] = measure(self.contact_submit(client, pages["contact"]), options["requests"])
+        self.write_result(name, results[name])
+        QueuedSubmission.objects.filter(page=pages["contact"]).delete()
+        return results
+
+    def contact_submit(self, client, page):
+        url = reverse("contact_submit", args=[page.id])
+        data = {field.clean_name: "benchmark" for field in page.get_form_fields()}
+        tokens = itertools.count()
+
+        def request():
+            # a fresh token each time, or the verifier rejects it as replayed
+            response = client.post(
+                url,
+                dict(data, **{"g-recaptcha-response": f"bench-{next(tokens)}"}),
+                headers={"x-requested-with": "XMLHttpRequest"},
+            )
+            if response.status_code != 200:
+                raise CommandError(f"POST {url}: {response.status_code} {response.content!r}")
+        return request
+
+    def write_result(self, name, result):
+        self.stdout.write(
+            f"{name:45} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+            f"{result['queries']:>4} queries  peak {result['peak_kb']:>7}KB"
+        )
+
+    def report(self, results, options):
+        path = Path(options["baseline"])
+        baseline = json.loads(path.read_text()) if path.exists() else {}
+
+        if options["write_baseline"]:
+            baseline.update(results)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + "\n")
+            self.stdout.write(f"wrote {len(results)} results to {path}")
+            return
+
+        if not baseline:
+            self.stdout.write(f"no baseline at {path}; run with --write-baseline")
+            return
+        found = regressions(results, baseline, options["tolerance"])
+        if found:
+            raise CommandError(
+                "%d regressions against %s:\n  %s" % (len(found), path, "\n  ".join(found))
+            )
+        self.stdout.write(f"no regressions against {path}")
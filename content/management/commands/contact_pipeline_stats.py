@@ -0,0 +1,56 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.models import DeadLetterSubmission, QueuedSubmission
+from core.bench import percentile
+
+
+class Command(BaseCommand):
+    help = "Show p50/p99 latency of the contact form pipeline per stage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=int, default=24,
+            help="Only look at submissions accepted in the last N hours.",
+        )
+        parser.add_argument(
+            "--prune-days", type=int,
+            help="Delete delivered rows older than N days afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(hours=options["hours"])
+        rows = QueuedSubmission.objects.filter(accepted_at__gte=since).values_list(
+            "accepted_at", "stored_at", "delivered_at"
+        )
+
+        stages = {"accept-to-stored": [], "accept-to-delivered": []}
+        pending = 0
+        for accepted_at, stored_at, delivered_at in rows:
+            if stored_at:
+                stages["accept-to-stored"].append((stored_at - accepted_at).total_seconds())
+            if delivered_at:
+                stages["accept-to-delivered"].append((delivered_at - accepted_at).total_seconds())
+            else:
+                pending += 1
+
+        for stage, values in stages.items():
+            if not values:
+                self.stdout.write(f"{stage:22} no data")
+                continue
+            self.stdout.write(
+                f"{stage:22} n={len(values):<6} "
+                f"p50={percentile(values, 50):.2f}s p99={percentile(values, 99):.2f}s"
+            )
+
+        dead = DeadLetterSubmission.objects.filter(failed_at__gte=since).count()
+        self.stdout.write(f"pending={pending} dead-lettered={dead}")
+
+        if options["prune_days"] is not None:
+            cutoff = timezone.now() - datetime.timedelta(days=options["prune_days"])
+            deleted, _ = QueuedSubmission.objects.filter(
+                delivered_at__lt=cutoff
+            ).delete()
+            self.stdout.write(f"pruned {deleted} delivered rows")
@@ -0,0 +1,66 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from wagtail.images.models import Image
+
+from content.models import DocumentPreview
+from content.previews import _refresh_pages
+from content.signal_handlers import purge_images
+from core.storage import dedupe_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Find files in MEDIA_ROOT with the same content, point the images, "
+        "documents, renditions and previews using a copy at a single file "
+        "and delete the copies. Also indexes every file, so later uploads "
+        "with the same content share it (MEDIA_STORAGE=dedupe)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report what would be reclaimed; change nothing.",
+        )
+        parser.add_argument(
+            "--workers", type=int, help="Threads hashing files (default: Python's choice)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            default_storage.path("")
+        except NotImplementedError:
+            raise CommandError("dedupe_media needs the media files on local disk.")
+
+        started = time.monotonic()
+        report = dedupe_files(
+            default_storage, dry_run=options["dry_run"], workers=options["workers"]
+        )
+        verb = "would reclaim" if options["dry_run"] else "reclaimed"
+        self.stdout.write(
+            f"{report['files']} files, {report['duplicates']} duplicates: {verb} "
+            f"{filesizeformat(report['bytes_reclaimed'])} in {time.monotonic() - started:.1f}s"
+        )
+        for label, count in sorted(report["rows"].items()):
+            self.stdout.write(f"  {label}: {count} rows repointed")
+
+        if report["rows"] and not options["dry_run"]:
+            # saving images and documents purged the pages showing them;
+            # renditions and previews have no such signals
+            repointed = report["repointed"]
+            Rendition = Image.get_rendition_model()
+            image_ids = set(
+                Rendition.objects.filter(pk__in=repointed.get(Rendition._meta.label, []))
+                .values_list("image_id", flat=True)
+            )
+            if image_ids:
+                purge_images(image_ids)
+            document_ids = set(
+                DocumentPreview.objects.filter(pk__in=repointed.get(DocumentPreview._meta.label, []))
+                .values_list("document_id", flat=True)
+            )
+            if document_ids:
+                _refresh_pages(document_ids)
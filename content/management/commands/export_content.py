@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from content.dumps import DEFAULT_EXCLUDE, DEFAULT_LABELS, export_objects, open_dump, resolve_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream the page tree and content models to a JSON file in dumpdata "
+        "format (.gz to compress), without loading whole tables into memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "labels", nargs="*", default=DEFAULT_LABELS,
+            help="app_label or app_label.Model (default: %s)" % " ".join(DEFAULT_LABELS),
+        )
+        parser.add_argument("-o", "--output", required=True)
+        parser.add_argument("-e", "--exclude", action="append", default=list(DEFAULT_EXCLUDE))
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        models = resolve_models(options["labels"], options["exclude"])
+        started = time.perf_counter()
+        with open_dump(options["output"], "wt") as out:
+            counts = export_objects(out, models, batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - started
+
+        for label, count in counts.items():
+            if count:
+                self.stdout.write(f"{label:40} {count:>8}")
+        total = sum(counts.values())
+        self.stdout.write(
+            f"Exported {total} objects in {elapsed:.2f}s "
+            f"({total / elapsed if elapsed else 0:.0f} objects/s)"
+        )
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.documents.models import Document
+
+from content.previews import generate_previews_in_pool, pending_documents, previews_available
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract the text, page count and first-page thumbnail of PDF "
+        "documents in a process pool. Documents whose current file already "
+        "has a preview are skipped, so an interrupted run can be restarted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("document_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: one per core)."
+        )
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument(
+            "--retry-failed", action="store_true",
+            help="Also retry documents whose last attempt failed.",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Redo existing previews too."
+        )
+
+    def handle(self, *args, **options):
+        if not previews_available():
+            raise CommandError("Neither pypdf nor pdftoppm is installed.")
+
+        if options["force"]:
+            documents = Document.objects.filter(file__iendswith=".pdf")
+        else:
+            documents = pending_documents(retry_failed=options["retry_failed"])
+        if options["document_ids"]:
+            documents = documents.filter(id__in=options["document_ids"])
+        document_ids = list(documents.order_by("id").values_list("id", flat=True))
+        self.stdout.write(f"{len(document_ids)} documents to process")
+
+        started = time.monotonic()
+        done = 0
+
+        def progress(created, errors):
+            nonlocal done
+            done += created + len(errors)
+            for document_id, error in errors:
+                self.stderr.write(f"document {document_id}: {error}")
+            self.stdout.write(f"  {done}/{len(document_ids)}")
+
+        created, errors = generate_previews_in_pool(
+            document_ids,
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            force=options["force"] or options["retry_failed"],
+            on_batch=progress,
+        )
+        self.stdout.write(
+            f"created {created} previews in {time.monotonic() - started:.1f}s "
+            f"({len(errors)} documents failed)"
+        )
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from wagtail.images.models import Image
+
+from content.renditions import generate_renditions_in_pool, rendition_filters
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-generate the configured rendition set for all (or the given) "
+        "images in a process pool. Existing renditions are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("image_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: one per core)."
+        )
+        parser.add_argument("--batch-size", type=int, default=20)
+
+    def handle(self, *args, **options):
+        image_ids = options["image_ids"] or list(
+            Image.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.stdout.write(
+            f"{len(image_ids)} images x {len(rendition_filters())} filters"
+        )
+
+        started = time.monotonic()
+
+        def progress(created, errors):
+            for image_id, error in errors:
+                self.stderr.write(f"image {image_id}: {error}")
+
+        created, errors = generate_renditions_in_pool(
+            image_ids,
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            on_batch=progress,
+        )
+        self.stdout.write(
+            f"created {created} renditions in {time.monotonic() - started:.1f}s "
+            f"({len(errors)} images failed)"
+        )
@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from content.cache import purge_all_pages
+from content.dumps import import_objects, iter_json_array, open_dump
+from content.fragments import purge_block_fragments
+from content.highlights import purge_home
+
+
+class Command(BaseCommand):
+    help = (
+        "Load JSON dumps (export_content or dumpdata output, optionally .gz) "
+        "by streaming them and inserting in batches. Existing rows with the "
+        "same primary key are updated. Signals are not sent, so run "
+        "reindex_search afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            started = time.perf_counter()
+            with open_dump(path) as file:
+                counts = import_objects(
+                    iter_json_array(file), batch_size=options["batch_size"]
+                )
+            elapsed = time.perf_counter() - started
+
+            for label, count in counts.items():
+                self.stdout.write(f"{label:40} {count:>8}")
+            total = sum(counts.values())
+            size = os.path.getsize(path) / 1024 / 1024
+            self.stdout.write(
+                f"{path}: {total} objects in {elapsed:.2f}s "
+                f"({total / elapsed if elapsed else 0:.0f} objects/s, "
+                f"{size / elapsed if elapsed else 0:.1f}MB/s)"
+            )
+
+        purge_all_pages()
+        purge_block_fragments()
+        purge_home()
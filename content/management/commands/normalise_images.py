@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from wagtail.images.models import Image
+
+from content.originals import normalise_images_in_pool
+from content.renditions import generate_renditions_in_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Normalise the originals of all (or the given) images in a process "
+        "pool: convert HEIC to JPEG, cap them at IMAGE_ORIGINAL_MAX_DIMENSION "
+        "and strip EXIF, then regenerate their renditions. Reports the bytes "
+        "and full decode time saved. Originals that already fit are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("image_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--workers", type=int, help="Worker processes (default: one per core)."
+        )
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report what would be saved; change nothing.",
+        )
+
+    def handle(self, *args, **options):
+        image_ids = options["image_ids"] or list(
+            Image.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.stdout.write(
+            f"{len(image_ids)} images, max {settings.IMAGE_ORIGINAL_MAX_DIMENSION}px"
+        )
+
+        started = time.monotonic()
+
+        def progress(totals, errors):
+            for image_id, error in errors:
+                self.stderr.write(f"image {image_id}: {error}")
+
+        totals, errors = normalise_images_in_pool(
+            image_ids,
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            write=not options["dry_run"],
+            on_batch=progress,
+        )
+        normalised = totals.get("normalised", 0)
+        before, after = totals.get("bytes_before", 0), totals.get("bytes_after", 0)
+        decode_before, decode_after = totals.get("decode_before", 0), totals.get("decode_after", 0)
+        verb = "would normalise" if options["dry_run"] else "normalised"
+        self.stdout.write(
+            f"{verb} {normalised} originals in {time.monotonic() - started:.1f}s "
+            f"({len(errors)} images failed)"
+        )
+        if normalised:
+            self.stdout.write(
+                f"size {filesizeformat(before)} -> {filesizeformat(after)} "
+                f"(saved {filesizeformat(before - after)})"
+            )
+            self.stdout.write(
+                f"decode {decode_before:.2f}s -> {decode_after:.2f}s "
+                f"(saved {decode_before - decode_after:.2f}s, "
+                f"{(decode_before - decode_after) / normalised * 1000:.0f}ms per image)"
+            )
+
+        if normalised and not options["dry_run"]:
+            # their renditions went with the old originals
+            created, errors = generate_renditions_in_pool(
+                image_ids, workers=options["workers"], batch_size=options["batch_size"]
+            )
+            self.stdout.write(f"created {created} renditions ({len(errors)} images failed)")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from content.cache import cache_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the hit ratio of the full-page cache. Counters are kept in the "
+        "cache itself, so this needs a shared backend (file or redis)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters afterwards."
+        )
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        self.stdout.write(
+            "hits={hits} misses={misses} hit_ratio={hit_ratio:.1%}".format(**stats)
+        )
+        if options["reset"]:
+            reset_stats()
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from content.tasks import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the site search index in the task worker, e.g. after "
+        "import_content or a change to search_fields."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--now", action="store_true",
+            help="Rebuild in this process instead of enqueueing a task.",
+        )
+
+    def handle(self, *args, **options):
+        if options["now"]:
+            rebuild_search_index.call()
+            self.stdout.write("Search index rebuilt.")
+        else:
+            result = rebuild_search_index.enqueue()
+            self.stdout.write(f"Enqueued search index rebuild ({result.id}).")
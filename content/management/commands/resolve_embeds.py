@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from wagtail.embeds.models import Embed
+from wagtail.models import Page
+
+from content.cache import purge_page
+from content.embeds import page_embed_urls, resolve_embeds
+from content.fragments import purge_block_fragments
+from content.snapshot import refresh_snapshot_on_commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch the media embeds used by live pages from their oEmbed providers "
+        "and store them, so pages render them without network calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--rate", type=float, default=settings.EMBED_RESOLVE_RATE,
+            help="Provider calls per second across all workers (0: no limit).",
+        )
+        parser.add_argument(
+            "--refresh", action="store_true",
+            help="Re-fetch embeds that are already stored, including ones no "
+                 "live page uses any more.",
+        )
+
+    def handle(self, *args, **options):
+        pages_by_url = {}
+        for page in Page.objects.live().specific().iterator():
+            for url in page_embed_urls(page):
+                pages_by_url.setdefault(url, set()).add(page.id)
+
+        urls = list(pages_by_url)
+        if options["refresh"]:
+            stored = Embed.objects.filter(max_width=None).values_list("url", flat=True)
+            urls += [url for url in stored if url not in pages_by_url]
+
+        resolved, errors = resolve_embeds(
+            urls,
+            workers=options["workers"],
+            rate=options["rate"],
+            refresh=options["refresh"],
+        )
+        for url, error in errors:
+            self.stderr.write(f"{url}: {error}")
+
+        if resolved:
+            purge_block_fragments()
+            page_ids = set().union(*(pages_by_url.get(url, ()) for url in resolved))
+            for page_id in page_ids:
+                purge_page(page_id)
+            refresh_snapshot_on_commit(page_ids)
+        self.stdout.write(f"Resolved {len(resolved)} embeds, {len(errors)} failed.")
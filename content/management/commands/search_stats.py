@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from content.search import reset_search_stats, search_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the number and latency of site searches. Counters are kept in "
+        "the cache itself, so this needs a shared backend (file or redis)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters afterwards."
+        )
+
+    def handle(self, *args, **options):
+        stats = search_stats()
+        self.stdout.write(
+            "searches={count} mean={mean_ms:.1f}ms p50<={p50_ms}ms "
+            "p95<={p95_ms}ms p99<={p99_ms}ms".format(**stats)
+        )
+        for bound, count in stats["buckets"].items():
+            self.stdout.write(f"  <= {bound}ms: {count}")
+        if options["reset"]:
+            reset_search_stats()
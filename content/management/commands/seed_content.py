@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from content.seed import SCALES, delete_seeded, root_slug, seed_site
+
+
+class Command(BaseCommand):
+    help = (
+        "Create synthetic content for benchmarking under /bench-<scale>/ of "
+        "the default site (replacing an earlier run). Meant for a local "
+        "database, not production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("scales", nargs="*", help="Default: %s." % ", ".join(SCALES))
+        parser.add_argument(
+            "--delete", action="store_true", help="Only remove the seeded content."
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["scales"]) - set(SCALES)
+        if unknown:
+            raise CommandError("Unknown scale: %s" % ", ".join(sorted(unknown)))
+        for scale in options["scales"] or SCALES:
+            if options["delete"]:
+                delete_seeded(scale)
+                self.stdout.write(f"removed /{root_slug(scale)}/")
+                continue
+            pages = seed_site(scale)
+            self.stdout.write(f"seeded /{root_slug(scale)}/: {SCALES[scale]}")
+            for label, page in pages.items():
+                self.stdout.write(f"  {label:15} {page.url}")
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from content.snapshot import refresh_snapshot, snapshot_site
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the home page and every live, public page to static HTML "
+        "under SNAPSHOT_ROOT in a process pool, then switch SNAPSHOT_ROOT/"
+        "current to the new build atomically. With page ids, re-render only "
+        "those pages and the pages listing them into the current build."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("page_ids", nargs="*", type=int)
+        parser.add_argument(
+            "--workers", type=int,
+            help="Worker processes (default: one per core; 0: this process).",
+        )
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument(
+            "--slowest", type=int, default=10, help="How many of the slowest pages to list."
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        if options["page_ids"]:
+            results, errors = refresh_snapshot(options["page_ids"])
+            if not results and not errors:
+                raise CommandError("No snapshot yet; run snapshot_site without page ids first.")
+            for url, error in errors:
+                self.stderr.write(f"{url}: {error}")
+            self.report(results, errors, started, options)
+            return
+
+        def progress(results, errors):
+            for url, error in errors:
+                self.stderr.write(f"{url}: {error}")
+            if options["verbosity"] > 1:
+                for result in results:
+                    self.stdout.write(f"{result['ms']:8.1f}ms  {result['url']}")
+
+        build, results, errors = snapshot_site(
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            on_batch=progress,
+        )
+        self.stdout.write(f"built {build}")
+        self.report(results, errors, started, options)
+
+    def report(self, results, errors, started, options):
+        written = [result for result in results if not result.get("skipped")]
+        skipped = len(results) - len(written)
+        self.stdout.write(
+            f"wrote {len(written)} pages ({filesizeformat(sum(r['bytes'] for r in written))}) "
+            f"in {time.monotonic() - started:.1f}s; {skipped} not shareable, "
+            f"{len(errors)} failed"
+        )
+        if written:
+            times = sorted(result["ms"] for result in written)
+            self.stdout.write(
+                f"per page: p50 {times[len(times) // 2]:.1f}ms, max {times[-1]:.1f}ms"
+            )
+        for result in sorted(written, key=lambda r: r["ms"], reverse=True)[:options["slowest"]]:
+            self.stdout.write(f"{result['ms']:8.1f}ms  {result['url']}")
@@ -0,0 +1,111 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:52
+
+from django.db import migrations, models
+from django.urls import reverse
+
+
+def copy_document_fields(apps, schema_editor):
+    # historical models have no custom save(), so mirror
+    # ListedDocument.copy_document_fields here
+    for model_name in ("GRDocument", "RTIDocument"):
+        model = apps.get_model("content", model_name)
+        rows = list(model.objects.select_related("document"))
+        for row in rows:
+            document = row.document
+            filename = document.file.name.rsplit("/", 1)[-1]
+            row.document_url = reverse("wagtaildocs_serve", args=[document.id, filename])
+            row.file_size = document.file_size
+            row.file_extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+            row.uploaded_at = document.created_at
+            row.year = document.created_at.year if document.created_at else None
+        model.objects.bulk_update(
+            rows,
+            ["document_url", "file_size", "file_extension", "uploaded_at", "year"],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_contact_submission_pipeline'),
+        ('wagtaildocs', '0014_alter_document_file_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grdocument',
+            name='document_url',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='grdocument',
+            name='file_extension',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='grdocument',
+            name='file_size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='grdocument',
+            name='uploaded_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='grdocument',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='rtidocument',
+            name='document_url',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='rtidocument',
+            name='file_extension',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='rtidocument',
+            name='file_size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='rtidocument',
+            name='uploaded_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='rtidocument',
+            name='year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='grdocument',
+            index=models.Index(fields=['page', 'year'], name='grdocument_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grdocument',
+            index=models.Index(fields=['page', 'title'], name='grdocument_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grdocument',
+            index=models.Index(fields=['page', 'uploaded_at'], name='grdocument_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rtidocument',
+            index=models.Index(fields=['page', 'year'], name='rtidocument_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rtidocument',
+            index=models.Index(fields=['page', 'title'], name='rtidocument_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rtidocument',
+            index=models.Index(fields=['page', 'uploaded_at'], name='rtidocument_uploaded_idx'),
+        ),
+        migrations.RunPython(copy_document_fields, migrations.RunPython.noop),
+    ]
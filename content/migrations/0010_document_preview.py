@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0009_document_listing'),
+        ('wagtaildocs', '0014_alter_document_file_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(blank=True, max_length=40)),
+                ('page_count', models.PositiveIntegerField(null=True)),
+                ('text', models.TextField(blank=True)),
+                ('excerpt', models.CharField(blank=True, max_length=300)),
+                ('thumbnail', models.FileField(blank=True, upload_to='document_previews/')),
+                ('error', models.TextField(blank=True)),
+                ('processed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='preview', to='wagtaildocs.document')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0010_document_preview'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentpreview',
+            name='thumbnail',
+            field=models.FileField(blank=True, db_index=True, upload_to='document_previews/'),
+        ),
+    ]
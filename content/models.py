@@ -1,4 +1,3 @@
-import requests
 from django.conf import settings
 from wagtail.models import Page,Orderable
 from wagtail.fields import StreamField, RichTextField
@@ -7,14 +6,29 @@ from wagtail.images.models import Image
 from modelcluster.models import ClusterableModel
 from wagtail.snippets.models import register_snippet
 from django.http import JsonResponse
+from django.urls import reverse
 from wagtail.images.blocks import ImageChooserBlock
 from wagtail.admin.panels import FieldPanel,InlinePanel
-from wagtail.contrib.forms.models import AbstractEmailForm, AbstractFormField
+from wagtail.contrib.forms.models import AbstractEmailForm, AbstractFormField, FormSubmission
 from wagtail.contrib.forms.panels import FormSubmissionsPanel
 from wagtail.blocks import StructBlock, CharBlock, RichTextBlock,URLBlock,TextBlock
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
 from wagtail.documents.models import Document
+from wagtail.search import index
 from modelcluster.fields import ParentalKey
+
+from core.concurrency import run_sync
+
+from .cache import CachedPageMixin
+from .gallery import paginate_events, paginate_images
+from .recaptcha import get_verifier
+from .richtext import RichTextPrefetchMixin
+
+
 class HomePage(Page):
     """
     CMS container home page.
@@ -25,9 +39,13 @@ class HomePage(Page):
 
     content_panels = Page.content_panels
 
-class SimplePage(Page):
+class SimplePage(RichTextPrefetchMixin, CachedPageMixin, Page):
     body = RichTextField()
 
+    search_fields = Page.search_fields + [
+        index.SearchField("body"),
+    ]
+
     content_panels = Page.content_panels + [
         FieldPanel("body"),
     ]
@@ -60,7 +78,7 @@ class AchievementBlock(blocks.StructBlock):
         template = "blocks/achievement_block.html"
 
 
-class AchievementPage(Page):
+class AchievementPage(RichTextPrefetchMixin, CachedPageMixin, Page):
     intro = RichTextField(
         blank=True,
         features=["bold", "italic", "link"]
@@ -79,6 +97,11 @@ class AchievementPage(Page):
         FieldPanel("achievements"),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField("intro"),
+        index.SearchField("achievements"),
+    ]
+
     parent_page_types = ["wagtailcore.Page"]
     subpage_types = []
 
@@ -107,9 +130,10 @@ class MediaUpdateBlock(StructBlock):
     class Meta:
         icon = "media"
         label = "Media Update"
+        template = "blocks/media_update_block.html"
 
 
-class MediaUpdatesPage(Page):
+class MediaUpdatesPage(RichTextPrefetchMixin, CachedPageMixin, Page):
     intro = RichTextField(
         blank=True,
         features=["bold", "italic", "link"]
@@ -128,15 +152,20 @@ class MediaUpdatesPage(Page):
         FieldPanel("media_updates"),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField("intro"),
+        index.SearchField("media_updates"),
+    ]
+
     parent_page_types = ["wagtailcore.Page"]
     subpage_types = []
-class GRDocument(Orderable):
-    page = ParentalKey(
-        'GRPage',
-        on_delete=models.CASCADE,
-        related_name='gr_documents'
-    )
-
+class ListedDocument(Orderable):
+    """
+    A document row on a GRPage / RTIPage. Besides the editor-facing title and
+    document it keeps a denormalised copy of the document's URL, size,
+    extension and upload date, refreshed on save and whenever the document
+    itself changes, so listings never need to touch wagtaildocs_document.
+    """
     title = models.CharField(
         max_length=255,
         help_text="Document title shown to users"
@@ -148,12 +177,170 @@ class GRDocument(Orderable):
         related_name='+'
     )
 
+    document_url = models.CharField(max_length=255, blank=True, editable=False)
+    file_size = models.PositiveBigIntegerField(null=True, editable=False)
+    file_extension = models.CharField(max_length=16, blank=True, editable=False)
+    uploaded_at = models.DateTimeField(null=True, editable=False)
+    year = models.PositiveSmallIntegerField(null=True, editable=False)
+
+    listing_fields = ["document_url", "file_size", "file_extension", "uploaded_at", "year"]
+
     panels = [
         FieldPanel('title'),
         FieldPanel('document'),
     ]
 
-class GRPage(Page):
+    class Meta(Orderable.Meta):
+        abstract = True
+        indexes = [
+            models.Index(fields=["page", "year"], name="%(class)s_year_idx"),
+            models.Index(fields=["page", "title"], name="%(class)s_title_idx"),
+            models.Index(fields=["page", "uploaded_at"], name="%(class)s_uploaded_idx"),
+        ]
+
+    @cached_property
+    def preview(self):
+        """The document's ``DocumentPreview``, or None if it has none yet."""
+        return DocumentPreview.objects.filter(document_id=self.document_id).first()
+
+    @property
+    def document_text(self):
+        # indexed through the pages' RelatedFields; bulk indexing annotates
+        # it (see DocumentListingMixin.get_indexed_objects)
+        if hasattr(self, "preview_text"):
+            return self.preview_text or ""
+        preview = self.preview
+        return preview.text if preview else ""
+
+    def copy_document_fields(self, document=None):
+        document = document or self.document
+        self.document_url = document.url
+        self.file_size = document.file_size
+        self.file_extension = document.file_extension.lower()
+        self.uploaded_at = document.created_at
+        self.year = document.created_at.year if document.created_at else None
+
+    def save(self, *args, **kwargs):
+        self.copy_document_fields()
+        super().save(*args, **kwargs)
+
+
+class DocumentPreview(models.Model):
+    """
+    Text, page count and first-page thumbnail extracted from a document's
+    file by ``content.previews``. ``file_hash`` is the hash of the file they
+    were made from, so a document is processed again only when its file
+    changes.
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name="preview"
+    )
+    file_hash = models.CharField(max_length=40, blank=True)
+    page_count = models.PositiveIntegerField(null=True)
+    text = models.TextField(blank=True)
+    excerpt = models.CharField(max_length=300, blank=True)
+    # indexed for the media storage's reference lookups (core/storage.py)
+    thumbnail = models.FileField(upload_to="document_previews/", blank=True, db_index=True)
+    error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Preview of {self.document}"
+
+
+class DocumentListingMixin:
+    """
+    Paginated, filterable, sortable listing of a page's ``ListedDocument``
+    rows: ``?q=`` keyword, ``?year=``, ``?sort=`` and ``?page=``.
+    """
+    documents_relation = None
+    cache_query_params = ("q", "year", "sort", "page")
+
+    sort_options = {
+        "": ("sort_order", "Default order"),
+        "title": ("title", "Title (A-Z)"),
+        "-title": ("-title", "Title (Z-A)"),
+        "newest": ("-uploaded_at", "Newest first"),
+        "oldest": ("uploaded_at", "Oldest first"),
+    }
+
+    @classmethod
+    def get_indexed_objects(cls):
+        rows = cls._meta.get_field(cls.documents_relation).related_model.objects.annotate(
+            preview_text=models.F("document__preview__text")
+        )
+        # replaces the plain prefetch of the RelatedFields, so indexing does
+        # not query each row's preview
+        return super().get_indexed_objects().prefetch_related(None).prefetch_related(
+            models.Prefetch(cls.documents_relation, queryset=rows)
+        )
+
+    def get_documents(self):
+        # the related manager sets each row's page, which would load a
+        # deferred page_id one row at a time
+        return getattr(self, self.documents_relation).only(
+            "id", "title", "document_url", "file_size", "file_extension",
+            "uploaded_at", "sort_order", "document_id", "page",
+        )
+
+    def get_context(self, request, *args, **kwargs):
+        context = super().get_context(request, *args, **kwargs)
+        documents = self.get_documents()
+
+        query = request.GET.get("q", "").strip()
+        if query:
+            documents = documents.filter(title__icontains=query)
+
+        year = request.GET.get("year", "")
+        if year.isdigit():
+            documents = documents.filter(year=int(year))
+
+        sort = request.GET.get("sort", "")
+        if sort not in self.sort_options:
+            sort = ""
+        documents = documents.order_by(self.sort_options[sort][0], "pk")
+
+        paginator = Paginator(documents, settings.DOCUMENT_LIST_PAGE_SIZE)
+        documents = paginator.get_page(request.GET.get("page"))
+        # one query for the previews of the listed documents
+        previews = DocumentPreview.objects.filter(
+            document_id__in=[item.document_id for item in documents]
+        ).only("document_id", "page_count", "excerpt", "thumbnail").in_bulk(
+            field_name="document_id"
+        )
+        for item in documents:
+            item.preview = previews.get(item.document_id)
+
+        context.update({
+            "documents": documents,
+            "document_years": (
+                getattr(self, self.documents_relation)
+                .exclude(year=None)
+                .order_by("-year")
+                .values_list("year", flat=True)
+                .distinct()
+            ),
+            "document_query": query,
+            "document_year": year,
+            "document_sort": sort,
+            "document_sort_options": [
+                (key, label) for key, (_, label) in self.sort_options.items()
+            ],
+        })
+        return context
+
+
+class GRDocument(ListedDocument):
+    page = ParentalKey(
+        'GRPage',
+        on_delete=models.CASCADE,
+        related_name='gr_documents'
+    )
+
+
+class GRPage(DocumentListingMixin, CachedPageMixin, Page):
     custom_title = models.CharField(
         max_length=255,
         help_text="Title displayed on the page"
@@ -164,34 +351,29 @@ class GRPage(Page):
         InlinePanel('gr_documents', label="GR Documents"),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField('custom_title'),
+        index.RelatedFields('gr_documents', [
+            index.SearchField('title'),
+            index.SearchField('document_text'),
+        ]),
+    ]
+
     parent_page_types = ["wagtailcore.Page"]
     subpage_types = []
 
+    documents_relation = "gr_documents"
+
 
-class RTIDocument(Orderable):
+class RTIDocument(ListedDocument):
     page = ParentalKey(
         'RTIPage',
         on_delete=models.CASCADE,
         related_name='rti_documents'
     )
 
-    title = models.CharField(
-        max_length=255,
-        help_text="Document title shown to users"
-    )
 
-    document = models.ForeignKey(
-        Document,
-        on_delete=models.CASCADE,
-        related_name='+'
-    )
-
-    panels = [
-        FieldPanel('title'),
-        FieldPanel('document'),
-    ]
-    
-class RTIPage(Page):
+class RTIPage(DocumentListingMixin, CachedPageMixin, Page):
     custom_title = models.CharField(
         max_length=255,
         help_text="Title displayed on the page"
@@ -201,6 +383,18 @@ class RTIPage(Page):
         FieldPanel('custom_title'),
         InlinePanel('rti_documents', label="RTI Documents"),
     ]
+
+    search_fields = Page.search_fields + [
+        index.SearchField('custom_title'),
+        index.RelatedFields('rti_documents', [
+            index.SearchField('title'),
+            index.SearchField('document_text'),
+        ]),
+    ]
+
+    documents_relation = "rti_documents"
+
+
 class ContactFormField(AbstractFormField):
     page = ParentalKey(
         'ContactPage',
@@ -247,61 +441,210 @@ class ContactPage(AbstractEmailForm):
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
         context["RECAPTCHA_PUBLIC_KEY"] = settings.RECAPTCHA_PUBLIC_KEY
+        context["contact_submit_url"] = reverse("contact_submit", args=[self.id])
         return context
 
-    # ✅ Only override serve for AJAX logic
-    def serve(self, request):
-        if (
+    def is_ajax_submission(self, request):
+        return (
             request.method == "POST"
             and request.headers.get("x-requested-with") == "XMLHttpRequest"
-        ):
-            recaptcha_response = request.POST.get("g-recaptcha-response")
-
-            data = {
-                "secret": settings.RECAPTCHA_PRIVATE_KEY,
-                "response": recaptcha_response,
-                "remoteip": request.META.get("REMOTE_ADDR"),
-            }
-
-            r = requests.post(
-                "https://www.google.com/recaptcha/api/siteverify",
-                data=data,
-                timeout=5,
-            )
-            result = r.json()
+        )
+
+    def handle_submission(self, request):
+        # DB save + email happen in the background
+        from .tasks import queue_submission
 
-            if not result.get("success"):
+        form = self.get_form(
+            request.POST, request.FILES, page=self, user=request.user
+        )
+        if form.is_valid():
+            queue_submission(self, form.cleaned_data)
+
+    # ✅ Only override serve for AJAX logic
+    def serve(self, request):
+        if self.is_ajax_submission(request):
+            verified = get_verifier().verify(
+                request.POST.get("g-recaptcha-response"),
+                request.META.get("REMOTE_ADDR"),
+            )
+            if not verified:
                 return JsonResponse(
                     {"success": False, "error": "Invalid reCAPTCHA"},
                     status=400,
                 )
 
-            # process form normally (email + DB save)
-            super().serve(request)
+            self.handle_submission(request)
 
             return JsonResponse({"success": True})
 
         # ✅ NORMAL Wagtail rendering
         return super().serve(request)
-class PhotoGalleryIndexPage(Page):
+
+    async def aserve(self, request):
+        """
+        Async counterpart of ``serve`` for AJAX submissions: the reCAPTCHA
+        round trip no longer holds a worker thread, and the blocking rest
+        runs in the ``contact`` pool.
+        """
+        if not self.is_ajax_submission(request):
+            return await run_sync("contact", self.serve, request)
+
+        verified = await get_verifier().averify(
+            request.POST.get("g-recaptcha-response"),
+            request.META.get("REMOTE_ADDR"),
+        )
+        if not verified:
+            return JsonResponse(
+                {"success": False, "error": "Invalid reCAPTCHA"},
+                status=400,
+            )
+
+        await run_sync("contact", self.handle_submission, request)
+
+        return JsonResponse({"success": True})
+class QueuedSubmission(models.Model):
+    """
+    A validated contact form submission waiting to be stored as a
+    ``FormSubmission`` and emailed by the background pipeline.
+    """
+    page = models.ForeignKey(
+        ContactPage,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    form_data = models.JSONField(encoder=DjangoJSONEncoder)
+    submission = models.ForeignKey(
+        FormSubmission,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+"
+    )
+
+    accepted_at = models.DateTimeField(default=timezone.now)
+    stored_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(delivered_at__isnull=True),
+                name="queuedsubmission_pending_idx",
+            ),
+        ]
+
+
+class DeadLetterSubmission(models.Model):
+    """Submissions that still failed after the last retry."""
+    page = models.ForeignKey(
+        ContactPage,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+"
+    )
+    form_data = models.JSONField(encoder=DjangoJSONEncoder)
+    submission = models.ForeignKey(
+        FormSubmission,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+"
+    )
+    accepted_at = models.DateTimeField()
+    failed_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField()
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.page} @ {self.accepted_at:%Y-%m-%d %H:%M}"
+
+
+class PhotoGalleryIndexPage(CachedPageMixin, Page):
     intro = models.TextField(blank=True)
 
+    cache_query_params = ("after",)
+
     content_panels = Page.content_panels + [
         FieldPanel("intro"),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField("intro"),
+    ]
+
     subpage_types = ["content.PhotoGalleryEventPage"]
-class PhotoGalleryEventPage(Page):
+
+    def get_events(self):
+        # one query for the live children, already as PhotoGalleryEventPage;
+        # restricted events would give away their cover photo
+        return PhotoGalleryEventPage.objects.child_of(self).live().public()
+
+    def get_context(self, request, *args, **kwargs):
+        context = super().get_context(request, *args, **kwargs)
+        context["events"] = paginate_events(
+            self, after=request.GET.get("after"), request=request
+        )
+        return context
+
+
+class PhotoGalleryEventPage(CachedPageMixin, Page):
     event_date = models.DateField(null=True, blank=True)
     description = models.TextField(blank=True)
 
+    cache_query_params = ("after",)
+
     content_panels = Page.content_panels + [
         FieldPanel("event_date"),
         FieldPanel("description"),
         InlinePanel("gallery_images", label="Event Photos"),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField("description"),
+        index.RelatedFields("gallery_images", [
+            index.SearchField("caption"),
+        ]),
+    ]
+
     parent_page_types = ["content.PhotoGalleryIndexPage"]
+
+    # filter spec used for the photo grid in photo_gallery_event_page.html
+    thumbnail_filter = "fill-400x300"
+
+    def get_gallery_images(self, filters=None):
+        """
+        Gallery images with their image and renditions fetched up front, so
+        the grid costs the same number of queries for any size.
+        """
+        renditions = Image.get_rendition_model().objects.filter(
+            filter_spec__in=filters or [self.thumbnail_filter]
+        )
+        return (
+            self.gallery_images.select_related("image")
+            .prefetch_related(
+                models.Prefetch(
+                    "image__renditions",
+                    queryset=renditions,
+                    to_attr="prefetched_renditions",
+                )
+            )
+            .order_by("pk")
+        )
+
+    def get_context(self, request, *args, **kwargs):
+        context = super().get_context(request, *args, **kwargs)
+        after = request.GET.get("after")
+        context["gallery"] = paginate_images(
+            self, after=int(after) if after and after.isdigit() else None
+        )
+        return context
+
+
 class PhotoGalleryImage(models.Model):
     page = ParentalKey(
         PhotoGalleryEventPage,
@@ -330,9 +673,10 @@ class ObjectiveBlock(StructBlock):
     class Meta:
         icon = "target"
         label = "Objective"
+        template = "blocks/objective_block.html"
 
 
-class ObjectivesPage(Page):
+class ObjectivesPage(RichTextPrefetchMixin, CachedPageMixin, Page):
     intro = RichTextField(blank=True)
 
     objectives = StreamField(
@@ -348,4 +692,9 @@ class ObjectivesPage(Page):
         FieldPanel("objectives"),
     ]
 
+    search_fields = Page.search_fields + [
+        index.SearchField("intro"),
+        index.SearchField("objectives"),
+    ]
+
     template = "content/objectives_page.html"
\ No newline at end of file
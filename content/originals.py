@@ -0,0 +1,228 @@
+"""
+Upload-time normalisation of original images.
+
+Editors upload phone photos as they come off the phone: 12-50 megapixel
+JPEGs or HEICs, with EXIF (GPS position included) and an orientation tag.
+Every rendition decodes the whole original, so before any are generated the
+original is replaced by a bounded one: HEIC/HEIF converted to JPEG, the
+EXIF orientation applied to the pixels, both sides capped at
+``IMAGE_ORIGINAL_MAX_DIMENSION`` and EXIF/XMP metadata dropped (the colour
+profile is kept). Originals that already fit are left alone, which only
+takes reading their header, so running this again is cheap.
+
+``normalise_images`` is what both the upload task and the
+``normalise_images`` management command run; the command fans it out over a
+process pool the way ``generate_renditions`` does.
+"""
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from PIL import Image as PILImage
+from PIL import ImageOps
+from wagtail.images.models import Image
+
+from .renditions import _init_worker
+from .signal_handlers import purge_images
+
+try:
+    import pillow_heif
+except ImportError:  # HEIC uploads are then rejected as unsupported
+    pillow_heif = None
+else:
+    pillow_heif.register_heif_opener()
+
+HEIF_FORMATS = {"HEIF", "HEIC"}
+# Pillow format -> (format to save as, file extension)
+OUTPUT_FORMATS = {
+    "JPEG": ("JPEG", "jpg"),
+    "MPO": ("JPEG", "jpg"),  # phone JPEGs with an embedded preview
+    "PNG": ("PNG", "png"),
+    "WEBP": ("WEBP", "webp"),
+    "HEIF": ("JPEG", "jpg"),
+    "HEIC": ("JPEG", "jpg"),
+}
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp")
+ORIENTATION_TAG = 0x0112
+
+
+class Normalised(NamedTuple):
+    data: bytes
+    extension: str
+    size: tuple
+    # the factor both sides were shrunk by
+    scale: float
+    # whether the EXIF orientation turned or flipped the pixels
+    reoriented: bool
+
+
+def heif_available():
+    return pillow_heif is not None
+
+
+def needs_normalising(img, max_dimension):
+    """Whether the opened (not yet decoded) ``img`` has to be rewritten."""
+    if img.format not in OUTPUT_FORMATS or getattr(img, "n_frames", 1) > 1:
+        # GIFs, animations and anything unusual are kept as uploaded
+        return False
+    return (
+        img.format in HEIF_FORMATS
+        or max(img.size) > max_dimension
+        or any(img.info.get(key) for key in METADATA_KEYS)
+    )
+
+
+def _decode_time(data):
+    started = time.perf_counter()
+    with PILImage.open(io.BytesIO(data)) as img:
+        img.load()
+    return time.perf_counter() - started
+
+
+def normalise_bytes(data, max_dimension=None, quality=None):
+    """The normalised version of the image file ``data``, or None if it is fine as it is."""
+    max_dimension = max_dimension or settings.IMAGE_ORIGINAL_MAX_DIMENSION
+    quality = quality or settings.IMAGE_ORIGINAL_QUALITY
+    with PILImage.open(io.BytesIO(data)) as img:
+        if not needs_normalising(img, max_dimension):
+            return None
+        output_format, extension = OUTPUT_FORMATS[img.format]
+        icc_profile = img.info.get("icc_profile")
+        reoriented = img.getexif().get(ORIENTATION_TAG, 1) != 1
+        oriented = ImageOps.exif_transpose(img)
+        width = oriented.width
+        # in place, keeping the aspect ratio; never upscales
+        oriented.thumbnail((max_dimension, max_dimension), PILImage.Resampling.LANCZOS)
+        scale = oriented.width / width
+
+        if output_format == "JPEG" and oriented.mode not in ("RGB", "L", "CMYK"):
+            if "A" in oriented.getbands():
+                # HEICs with transparency would lose it as JPEG
+                output_format, extension = "PNG", "png"
+            else:
+                oriented = oriented.convert("RGB")
+        options = {"icc_profile": icc_profile} if icc_profile else {}
+        if output_format in ("JPEG", "WEBP"):
+            options["quality"] = quality
+        if output_format in ("JPEG", "PNG"):
+            options["optimize"] = True
+
+        buffer = io.BytesIO()
+        # no exif= or xmp=: the metadata is not carried over
+        oriented.save(buffer, output_format, **options)
+    return Normalised(buffer.getvalue(), extension, oriented.size, scale, reoriented)
+
+
+def _scaled_focal_point(image, scale, reoriented):
+    if reoriented:
+        # a rotated image's focal point no longer matches; let editors reset it
+        return {"focal_point_x": None, "focal_point_y": None,
+                "focal_point_width": None, "focal_point_height": None}
+    return {
+        "focal_point_x": round(image.focal_point_x * scale),
+        "focal_point_y": round(image.focal_point_y * scale),
+        "focal_point_width": max(1, round(image.focal_point_width * scale)),
+        "focal_point_height": max(1, round(image.focal_point_height * scale)),
+    }
+
+
+def normalise_image(image, write=True):
+    """
+    Normalise ``image``'s original. Returns None if it was already fine,
+    otherwise ``(bytes_before, bytes_after, decode_before, decode_after)``;
+    with ``write=False`` nothing is changed, for reporting.
+    """
+    with image.open_file() as f:
+        data = f.read()
+    result = normalise_bytes(data)
+    if result is None:
+        return None
+    stats = (len(data), len(result.data), _decode_time(data), _decode_time(result.data))
+    if not write:
+        return stats
+
+    old_name = image.file.name
+    base = os.path.splitext(os.path.basename(old_name))[0]
+    # the file is saved under a new name, so cached URLs of the old one go stale
+    image.file.save(f"{base}.{result.extension}", ContentFile(result.data), save=False)
+    image._set_image_file_metadata()
+    image.width, image.height = result.size
+    fields = {
+        "file": image.file.name,
+        "width": image.width,
+        "height": image.height,
+        "file_size": image.file_size,
+        "file_hash": image.file_hash,
+    }
+    if image.focal_point_x is not None:
+        fields.update(_scaled_focal_point(image, result.scale, result.reoriented))
+    # update(), not save(): no upload signals for our own rewrite
+    Image.objects.filter(pk=image.pk).update(**fields)
+
+    # renditions of the old original (the admin's thumbnail, usually)
+    image.renditions.all().delete()
+    if not Image.objects.filter(file=old_name).exists():
+        image.file.storage.delete(old_name)
+    return stats
+
+
+def normalise_images(image_ids, write=True):
+    """
+    Normalise the originals of the given images. Returns ``(totals, errors)``
+    where ``totals`` sums the stats of the images that changed.
+    """
+    totals = {
+        "images": 0, "normalised": 0,
+        "bytes_before": 0, "bytes_after": 0,
+        "decode_before": 0.0, "decode_after": 0.0,
+    }
+    errors = []
+    normalised = []
+    for image in Image.objects.filter(id__in=image_ids):
+        totals["images"] += 1
+        try:
+            stats = normalise_image(image, write=write)
+        except Exception as exc:  # missing, corrupt or unsupported originals
+            errors.append((image.id, repr(exc)))
+            continue
+        if stats is None:
+            continue
+        totals["normalised"] += 1
+        normalised.append(image.id)
+        for key, value in zip(("bytes_before", "bytes_after", "decode_before", "decode_after"), stats):
+            totals[key] += value
+    if write and normalised:
+        # what saving the images would have done (see purge_image_fragments)
+        purge_images(normalised)
+    return totals, errors
+
+
+def normalise_images_in_pool(image_ids, workers=None, batch_size=20, write=True, on_batch=None):
+    """
+    Split ``image_ids`` into batches and run ``normalise_images`` on each in
+    a pool of ``workers`` processes (default: one per core).
+    """
+    batches = [
+        image_ids[i:i + batch_size] for i in range(0, len(image_ids), batch_size)
+    ]
+    totals = {}
+    errors = []
+    # forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), initializer=_init_worker
+    ) as pool:
+        futures = [pool.submit(normalise_images, batch, write) for batch in batches]
+        for future in as_completed(futures):
+            batch_totals, batch_errors = future.result()
+            for key, value in batch_totals.items():
+                totals[key] = totals.get(key, 0) + value
+            errors += batch_errors
+            if on_batch:
+                on_batch(batch_totals, batch_errors)
+    return totals, errors
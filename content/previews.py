@@ -0,0 +1,221 @@
+"""
+Previews of uploaded PDF documents.
+
+For every PDF document a ``DocumentPreview`` row keeps the page count, the
+text (searchable through the GR/RTI pages, and the start of it shown as an
+excerpt) and a JPEG of the first page, so the listings can show what a
+document is without the browser downloading it.
+
+Previews are made in the background: saving a document enqueues
+``generate_document_previews`` (see tasks.py), and the
+``generate_document_previews`` command processes the existing backlog in a
+process pool. A preview records the hash of the file it was made from, so
+both skip documents that are already done and a stopped run resumes where
+it left off.
+
+Text and page count come from ``pypdf`` (in requirements.txt), the thumbnail
+from the optional ``pdftoppm`` binary of poppler-utils; with neither nothing
+is recorded, so the documents are picked up once one is installed.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+from wagtail.documents.models import Document
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+from .renditions import _init_worker
+
+EXCERPT_LENGTH = 300
+
+
+def pdftoppm_path():
+    return shutil.which(settings.DOCUMENT_PREVIEW_PDFTOPPM)
+
+
+def previews_available():
+    return pypdf is not None or pdftoppm_path() is not None
+
+
+def pending_documents(retry_failed=False):
+    """PDF documents without a preview of their current file."""
+    pending = ~Q(preview__file_hash=F("file_hash"))
+    if retry_failed:
+        pending |= ~Q(preview__error="")
+    return Document.objects.filter(pending, file__iendswith=".pdf")
+
+
+def extract_text(path):
+    """``(page_count, text)`` of the PDF at ``path``, or ``(None, "")``."""
+    if pypdf is None:
+        return None, ""
+    reader = pypdf.PdfReader(path)
+    texts = []
+    length = 0
+    for page in reader.pages[: settings.DOCUMENT_PREVIEW_MAX_PAGES]:
+        text = page.extract_text() or ""
+        texts.append(text)
+        length += len(text)
+        if length >= settings.DOCUMENT_PREVIEW_MAX_TEXT:
+            break
+    text = " ".join(" ".join(texts).split())
+    return len(reader.pages), text[: settings.DOCUMENT_PREVIEW_MAX_TEXT]
+
+
+def render_thumbnail(path):
+    """JPEG bytes of the first page of the PDF at ``path``, or None."""
+    pdftoppm = pdftoppm_path()
+    if pdftoppm is None:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "thumbnail")
+        subprocess.run(
+            [
+                pdftoppm, "-jpeg", "-jpegopt", "quality=80", "-singlefile",
+                "-f", "1", "-l", "1",
+                "-scale-to-x", str(settings.DOCUMENT_PREVIEW_THUMBNAIL_WIDTH),
+                "-scale-to-y", "-1",
+                path, output,
+            ],
+            check=True,
+            capture_output=True,
+            timeout=settings.DOCUMENT_PREVIEW_TIMEOUT,
+        )
+        with open(output + ".jpg", "rb") as f:
+            return f.read()
+
+
+def _local_copy(document, tmp):
+    try:
+        return document.file.path
+    except NotImplementedError:
+        # remote storage
+        path = os.path.join(tmp, "document.pdf")
+        with document.file.open("rb") as src, open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return path
+
+
+def make_preview(document):
+    """Create or replace the preview of ``document``'s current file."""
+    from .models import DocumentPreview
+
+    preview = DocumentPreview.objects.filter(document=document).first()
+    if preview is None:
+        preview = DocumentPreview(document=document)
+    old_thumbnail = preview.thumbnail.name
+    preview.file_hash = document.file_hash
+    preview.processed_at = timezone.now()
+    preview.page_count = None
+    preview.text = preview.excerpt = preview.error = ""
+    preview.thumbnail = ""
+
+    thumbnail = None
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = _local_copy(document, tmp)
+            preview.page_count, preview.text = extract_text(path)
+            thumbnail = render_thumbnail(path)
+    except Exception as exc:  # missing, corrupt or encrypted files
+        preview.error = repr(exc)
+
+    preview.excerpt = preview.text[:EXCERPT_LENGTH]
+    if thumbnail:
+        # named after the file hash, so it can be cached as immutable
+        preview.thumbnail.save(
+            f"{document.id}-{document.file_hash[:12]}.jpg",
+            ContentFile(thumbnail),
+            save=False,
+        )
+    preview.save()
+    if old_thumbnail and old_thumbnail != preview.thumbnail.name:
+        preview.thumbnail.storage.delete(old_thumbnail)
+    return preview
+
+
+def _refresh_pages(document_ids):
+    from wagtail.search import index
+
+    from .cache import purge_page
+    from .models import GRDocument, RTIDocument
+    from .snapshot import refresh_snapshot_on_commit
+
+    page_ids = []
+    for model in (GRDocument, RTIDocument):
+        pages = model._meta.get_field("page").related_model.objects.filter(
+            id__in=model.objects.filter(document_id__in=document_ids).values("page_id")
+        )
+        for page in pages:
+            purge_page(page.id)
+            page_ids.append(page.id)
+            # the index holds the documents' text
+            index.insert_or_update_object(page)
+    refresh_snapshot_on_commit(page_ids)
+
+
+def generate_previews(document_ids, force=False):
+    """
+    Make the previews of the given documents that are missing or out of
+    date (all of them with ``force``). Returns ``(created, errors)``.
+    """
+    if not previews_available():
+        return 0, []
+    documents = Document.objects.filter(file__iendswith=".pdf") if force else pending_documents()
+    documents = documents.filter(id__in=document_ids)
+
+    created = 0
+    errors = []
+    done = []
+    for document in documents:
+        if not document.file_hash:
+            try:
+                document._set_document_file_metadata()
+            except FileNotFoundError as exc:
+                errors.append((document.id, repr(exc)))
+                continue
+            document.save(update_fields=["file_hash", "file_size"])
+        preview = make_preview(document)
+        if preview.error:
+            errors.append((document.id, preview.error))
+        else:
+            created += 1
+        done.append(document.id)
+    if done:
+        _refresh_pages(done)
+    return created, errors
+
+
+def generate_previews_in_pool(document_ids, workers=None, batch_size=10, force=False, on_batch=None):
+    """
+    Split ``document_ids`` into batches and run ``generate_previews`` on each
+    in a pool of ``workers`` processes (default: one per core).
+    """
+    batches = [
+        document_ids[i:i + batch_size] for i in range(0, len(document_ids), batch_size)
+    ]
+    created = 0
+    errors = []
+    # forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), initializer=_init_worker
+    ) as pool:
+        futures = [pool.submit(generate_previews, batch, force) for batch in batches]
+        for future in as_completed(futures):
+            batch_created, batch_errors = future.result()
+            created += batch_created
+            errors += batch_errors
+            if on_batch:
+                on_batch(batch_created, batch_errors)
+    return created, errors
@@ -0,0 +1,220 @@
+"""
+reCAPTCHA verification for the contact form.
+
+A single verifier is shared by the whole process so submissions reuse
+keep-alive connections instead of opening a fresh TLS connection each time.
+Tokens that have already been checked are remembered for a short while so a
+replayed token is rejected without a round trip, and a circuit breaker stops
+us from waiting on the verifier while it is slow or down.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures and lets a single trial
+    request through once ``reset_after`` seconds have passed.
+    """
+
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # half-open: let one request through, re-open if it fails
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class RecaptchaVerifier:
+    def __init__(self, url, secret, timeout, fail_open, verdict_ttl, breaker):
+        self.url = url
+        self.secret = secret
+        self.timeout = timeout
+        self.fail_open = fail_open
+        self.verdict_ttl = verdict_ttl
+        self.breaker = breaker
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            url=settings.RECAPTCHA_VERIFY_URL,
+            secret=settings.RECAPTCHA_PRIVATE_KEY,
+            timeout=settings.RECAPTCHA_TIMEOUT,
+            fail_open=settings.RECAPTCHA_FAIL_OPEN,
+            verdict_ttl=settings.RECAPTCHA_VERDICT_TTL,
+            breaker=CircuitBreaker(
+                threshold=settings.RECAPTCHA_BREAKER_THRESHOLD,
+                reset_after=settings.RECAPTCHA_BREAKER_RESET,
+            ),
+        )
+
+    # --- clients -----------------------------------------------------------
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=settings.RECAPTCHA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.RECAPTCHA_MAX_CONNECTIONS,
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        timeout=self.timeout, limits=self._limits()
+                    )
+        return self._client
+
+    @asynccontextmanager
+    async def async_client(self):
+        """
+        An ``httpx.AsyncClient`` for the running loop, which it is bound to.
+        Under ASGI the worker's loop lasts as long as the process, so its
+        client is kept; elsewhere (``async_to_sync`` under WSGI) every call
+        runs on a new loop, so the client is closed after the call.
+        """
+        if settings.SERVER_MODE != "asgi":
+            async with httpx.AsyncClient(timeout=self.timeout, limits=self._limits()) as client:
+                yield client
+            return
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(timeout=self.timeout, limits=self._limits())
+            self._async_clients[loop] = client
+        yield client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        for client in list(self._async_clients.values()):
+            await client.aclose()
+        self._async_clients.clear()
+
+    # --- verification ------------------------------------------------------
+
+    def _token_key(self, token):
+        return "recaptcha:%s" % hashlib.sha256(token.encode()).hexdigest()
+
+    def _claim_token(self, token):
+        """
+        Returns False if ``token`` was already presented within the TTL.
+        ``cache.add`` is atomic, so two concurrent replays cannot both win.
+        """
+        return cache.add(self._token_key(token), True, self.verdict_ttl)
+
+    async def _aclaim_token(self, token):
+        return await cache.aadd(self._token_key(token), True, self.verdict_ttl)
+
+    def _payload(self, token, remoteip):
+        return {"secret": self.secret, "response": token, "remoteip": remoteip}
+
+    def _unavailable(self, exc):
+        self.breaker.record_failure()
+        logger.warning("reCAPTCHA verifier unavailable: %s", exc)
+        return self.fail_open
+
+    def _verdict(self, response):
+        if response.status_code >= 500:
+            return self._unavailable("HTTP %s" % response.status_code)
+        try:
+            data = response.json()
+        except ValueError:
+            # e.g. an HTML error page from a proxy in between
+            return self._unavailable("invalid JSON (HTTP %s)" % response.status_code)
+        if not isinstance(data, dict):
+            return self._unavailable("unexpected JSON (HTTP %s)" % response.status_code)
+        self.breaker.record_success()
+        return bool(data.get("success"))
+
+    def verify(self, token, remoteip=None):
+        if not token or not self._claim_token(token):
+            return False
+        if not self.breaker.allow():
+            return self.fail_open
+        try:
+            with timed("http"):
+                response = self.client.post(self.url, data=self._payload(token, remoteip))
+        except httpx.HTTPError as exc:
+            return self._unavailable(exc)
+        return self._verdict(response)
+
+    async def averify(self, token, remoteip=None):
+        if not token or not await self._aclaim_token(token):
+            return False
+        if not self.breaker.allow():
+            return self.fail_open
+        try:
+            with timed("http"):
+                async with self.async_client() as client:
+                    response = await client.post(self.url, data=self._payload(token, remoteip))
+        except httpx.HTTPError as exc:
+            return self._unavailable(exc)
+        return self._verdict(response)
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = RecaptchaVerifier.from_settings()
+    return _verifier
+
+
+def reset_verifier():
+    """Drop the shared verifier, e.g. after overriding settings in tests."""
+    global _verifier
+    with _verifier_lock:
+        if _verifier is not None:
+            _verifier.close()
+        _verifier = None
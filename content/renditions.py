@@ -0,0 +1,150 @@
+"""
+Ahead-of-time rendition generation.
+
+Every uploaded image gets the renditions the templates ask for (see
+``rendition_filters``) generated in the background, so the first visitor after
+an upload does not wait for Pillow. ``generate_renditions`` is what both the
+upload hook and the ``generate_renditions`` management command run; the
+command fans it out over a process pool.
+"""
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from wagtail.images.models import Filter, Image
+
+
+def width_filters():
+    return [f"width-{width}" for width in settings.RESPONSIVE_IMAGE_WIDTHS]
+
+
+def with_format(filters, image_format):
+    return [f"{spec}|format-{image_format}" for spec in filters]
+
+
+def responsive_filters():
+    """The renditions ``{% responsive_image %}`` uses."""
+    base = width_filters()
+    filters = list(base)
+    for image_format in settings.RESPONSIVE_IMAGE_FORMATS:
+        filters += with_format(base, image_format)
+    return filters
+
+
+def rendition_filters():
+    """
+    The full pre-generated set: ``width-*`` for achievement and media images,
+    the gallery's 4:3 crops, each also in every extra format (WebP, AVIF).
+    """
+    from .gallery import srcset_filters
+
+    base = width_filters() + srcset_filters()
+    filters = list(base)
+    for image_format in settings.RESPONSIVE_IMAGE_FORMATS:
+        filters += with_format(base, image_format)
+    return filters
+
+
+def srcset(renditions):
+    # small originals are never upscaled, so several filters can give the
+    # same width; list each width once
+    by_width = {}
+    for rendition in renditions:
+        by_width.setdefault(rendition.width, rendition)
+    return ", ".join(f"{r.url} {r.width}w" for r in by_width.values())
+
+
+def reuse_renditions(images, filters):
+    """
+    Give ``images`` (with their renditions prefetched) the renditions that
+    other images sharing their file already have: duplicate uploads share
+    one file (see core.storage), so their renditions would be the same too.
+    The new rows point at the existing rendition files. Returns how many
+    were added.
+    """
+    Rendition = Image.get_rendition_model()
+    filters = [Filter(spec) for spec in filters]
+    missing = defaultdict(list)
+    for image in images:
+        have = {(r.filter_spec, r.focal_point_key) for r in image.prefetched_renditions}
+        for spec_filter in filters:
+            key = (spec_filter.spec, spec_filter.get_cache_key(image))
+            if key not in have:
+                missing[(image.file.name, *key)].append(image)
+    if not missing:
+        return 0
+
+    shared = Rendition.objects.filter(
+        image__file__in={file for file, *_ in missing},
+        filter_spec__in={spec for _, spec, _ in missing},
+    ).annotate(source=F("image__file"))
+    copies = []
+    for rendition in shared:
+        for image in missing.pop((rendition.source, rendition.filter_spec, rendition.focal_point_key), []):
+            copies.append(Rendition(
+                image=image,
+                filter_spec=rendition.filter_spec,
+                focal_point_key=rendition.focal_point_key,
+                file=rendition.file.name,
+                width=rendition.width,
+                height=rendition.height,
+            ))
+    Rendition.objects.bulk_create(copies, ignore_conflicts=True)
+    return len(copies)
+
+
+def generate_renditions(image_ids):
+    """
+    Create the missing renditions of the given images, copying those of
+    images with the same file where possible. Existing ones are found
+    through the prefetch and skipped. Returns ``(created, errors)``.
+    """
+    filters = rendition_filters()
+    images = Image.objects.filter(id__in=image_ids).prefetch_renditions(*filters)
+    created = reuse_renditions(images, filters)
+    if created:
+        images = images.all()
+    errors = []
+    for image in images:
+        existing = len(image.prefetched_renditions)
+        try:
+            image.get_renditions(*filters)
+        except Exception as exc:  # missing or corrupt originals
+            errors.append((image.id, repr(exc)))
+            continue
+        created += len(image.prefetched_renditions) - existing
+    return created, errors
+
+
+def _init_worker():
+    # needed with the "spawn" start method; a no-op after fork
+    django.setup()
+
+
+def generate_renditions_in_pool(image_ids, workers=None, batch_size=20, on_batch=None):
+    """
+    Split ``image_ids`` into batches and run ``generate_renditions`` on each in
+    a pool of ``workers`` processes (default: one per core).
+    """
+    batches = [
+        image_ids[i:i + batch_size] for i in range(0, len(image_ids), batch_size)
+    ]
+    created = 0
+    errors = []
+    # forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), initializer=_init_worker
+    ) as pool:
+        futures = [pool.submit(generate_renditions, batch) for batch in batches]
+        for future in as_completed(futures):
+            batch_created, batch_errors = future.result()
+            created += batch_created
+            errors += batch_errors
+            if on_batch:
+                on_batch(batch_created, batch_errors)
+    return created, errors
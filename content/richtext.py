@@ -0,0 +1,227 @@
+"""
+Batched, cached expansion of rich text.
+
+Wagtail expands each rich text value on its own: the links, documents and
+images it references are looked up one value at a time, so a page with many
+rich text blocks runs the same kind of query over and over. Here every rich
+text value of a page is collected first (see ``RichTextPrefetchMixin``) and
+expanded together, with one query per kind of reference for all of them.
+
+Expanded HTML is cached under a hash of the source and of the versions of
+the objects it references. Publishing, moving or deleting a page, or
+changing a document or an image, bumps that object's version (see
+``signal_handlers.py``), so only the rich text that refers to it is expanded
+again; the pages showing it are purged from the page cache too, found
+through wagtail's reference index. Resolving media embeds re-expands
+everything, as embeds are not tracked by reference.
+
+Values without links or embeds need no expansion and skip all of this.
+"""
+import contextvars
+import hashlib
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from wagtail.fields import RichTextField, StreamField
+from wagtail.models import Page, ReferenceIndex
+from wagtail.rich_text import extract_references_from_rich_text, get_rewriter
+
+from .cache import get_cache, purge_page
+from .embeds import has_placeholder
+
+# bumped when images or embeds change (see fragments.purge_block_fragments)
+ALL_VERSION_KEY = "richtext:v:all"
+
+# expanded HTML by source, while blocks are rendered (see render_stream)
+_prefetched = contextvars.ContextVar("prefetched_richtext", default=None)
+
+
+def has_entities(source):
+    return "linktype=" in source or "embedtype=" in source
+
+
+def rich_strings(value):
+    """The strings in raw StreamField data that need expanding."""
+    if isinstance(value, str):
+        if has_entities(value):
+            yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from rich_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from rich_strings(item)
+
+
+def page_sources(page):
+    """Every rich text source on ``page`` that needs expanding."""
+    sources = []
+    for field in page._meta.get_fields():
+        if isinstance(field, RichTextField):
+            value = getattr(page, field.name)
+            if value and has_entities(value):
+                sources.append(value)
+        elif isinstance(field, StreamField):
+            sources.extend(rich_strings(list(getattr(page, field.name).raw_data)))
+    return sources
+
+
+def _version_key(model, object_id):
+    return f"richtext:v:{model._meta.label_lower}:{object_id}"
+
+
+def references(sources):
+    """The ``(model, object_id)`` pairs ``sources`` refer to, sorted."""
+    refs = {
+        (model, str(object_id))
+        for source in sources
+        for model, object_id, *_ in extract_references_from_rich_text(source)
+    }
+    return sorted(refs, key=lambda ref: (ref[0]._meta.label_lower, ref[1]))
+
+
+def references_digest(refs, versions):
+    """A hash of the versions of ``refs`` (and the global one), for cache keys."""
+    parts = [str(versions.get(ALL_VERSION_KEY, 0))] + [
+        f"{model._meta.label_lower}:{object_id}:{versions.get(_version_key(model, object_id), 0)}"
+        for model, object_id in refs
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def reference_versions(refs, extra_keys=()):
+    """
+    The current versions of the ``(model, object_id)`` pairs, and the values
+    of ``extra_keys``, in one cache call.
+    """
+    keys = {_version_key(model, object_id) for model, object_id in refs}
+    return get_cache().get_many(keys | {ALL_VERSION_KEY, *extra_keys})
+
+
+def purge_all_richtext():
+    get_cache().set(ALL_VERSION_KEY, time.time(), None)
+
+
+def _rewrite_all(rewriter, htmls):
+    """
+    One of wagtail's tag rewriters applied to all of ``htmls`` at once: the
+    tags of each type from every string go to its handler in a single call.
+    """
+    matches = [rewriter.extract_tags(html) for html in htmls]
+    by_type = defaultdict(list)
+    for found in matches:
+        for tag_type, tag_matches in found.items():
+            by_type[tag_type].extend(tag_matches)
+    for tag_type, tag_matches in by_type.items():
+        replacements = rewriter.get_tag_replacements(tag_type, [m.attrs for m in tag_matches])
+        for match, replacement in zip(tag_matches, replacements):
+            match.replacement = replacement
+
+    results = []
+    for html, found in zip(htmls, matches):
+        replaced = sorted(
+            (m for tag_matches in found.values() for m in tag_matches if hasattr(m, "replacement")),
+            key=lambda m: m.start,
+        )
+        # same splicing as wagtail's TagRewriter
+        offset = 0
+        for match in replaced:
+            html = html[: match.start + offset] + match.replacement + html[match.end + offset:]
+            offset += len(match.replacement) - match.end + match.start
+        results.append(html)
+    return results
+
+
+def expand_all(sources):
+    """``expand_db_html`` of every source, with one lookup per entity type."""
+    htmls = list(sources)
+    for rewriter in get_rewriter().rewriters:
+        htmls = _rewrite_all(rewriter, htmls)
+    return htmls
+
+
+def _cache_key(source, digest):
+    return "richtext:%s:%s" % (hashlib.sha1(source.encode()).hexdigest(), digest)
+
+
+def expand_richtext(sources):
+    """``{source: html}`` for ``sources``, from the cache where possible."""
+    sources = list(dict.fromkeys(s for s in sources if has_entities(s)))
+    if not sources:
+        return {}
+    if not settings.RICHTEXT_CACHE_ENABLED:
+        return dict(zip(sources, expand_all(sources)))
+
+    refs = {source: references([source]) for source in sources}
+    versions = reference_versions(ref for source_refs in refs.values() for ref in source_refs)
+    keys = {source: _cache_key(source, references_digest(refs[source], versions)) for source in sources}
+    cache = get_cache()
+    cached = cache.get_many(keys.values())
+
+    expanded = {source: cached[key] for source, key in keys.items() if key in cached}
+    missing = [source for source in sources if source not in expanded]
+    if missing:
+        fresh = dict(zip(missing, expand_all(missing)))
+        cache.set_many(
+            {keys[source]: html for source, html in fresh.items() if not has_placeholder(html)},
+            settings.RICHTEXT_CACHE_TIMEOUT,
+        )
+        expanded.update(fresh)
+    return expanded
+
+
+@contextmanager
+def prefetched(expanded):
+    """Make ``expanded`` (``{source: html}``) available to ``render_richtext``."""
+    outer = _prefetched.get()
+    token = _prefetched.set({**outer, **expanded} if outer else expanded)
+    try:
+        yield
+    finally:
+        _prefetched.reset(token)
+
+
+def render_richtext(source, expanded=None):
+    """The front-end HTML of ``source``, taken from ``expanded`` if it is there."""
+    source = source or ""
+    if not has_entities(source):
+        return source
+    for known in (expanded, _prefetched.get()):
+        if known and source in known:
+            return known[source]
+    return expand_richtext([source])[source]
+
+
+def purge_references(model, object_ids):
+    """
+    Expand rich text referring to these objects again, and purge the pages
+    that show it from the page cache. Returns the ids of those pages.
+    """
+    object_ids = [str(object_id) for object_id in object_ids]
+    now = time.time()
+    get_cache().set_many({_version_key(model, object_id): now for object_id in object_ids}, None)
+    page_ids = ReferenceIndex.objects.filter(
+        base_content_type=ContentType.objects.get_for_model(Page),
+        to_content_type=ReferenceIndex._get_base_content_type(model),
+        to_object_id__in=object_ids,
+    ).values_list("object_id", flat=True).distinct()
+    page_ids = list(page_ids)
+    for page_id in page_ids:
+        purge_page(page_id)
+    return page_ids
+
+
+class RichTextPrefetchMixin:
+    """
+    Expand all of a page's rich text (fields and StreamField blocks) in one
+    batch before its template renders, for ``{% cached_richtext %}`` and
+    ``{% cached_stream %}``.
+    """
+
+    def get_context(self, request, *args, **kwargs):
+        context = super().get_context(request, *args, **kwargs)
+        context["expanded_richtext"] = expand_richtext(page_sources(self))
+        return context
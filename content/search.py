@@ -0,0 +1,94 @@
+"""
+Site search over live pages.
+
+Pages are indexed by wagtail's database search backend. On PostgreSQL it
+keeps each object's text as ``tsvector`` columns of
+``wagtailsearch_indexentry`` behind GIN indexes and ranks with ``ts_rank``,
+so a query never scans page content. The indexed text includes the
+StreamField blocks, GR/RTI document titles and gallery captions (see the
+``search_fields`` in models.py).
+
+Wagtail reindexes a saved object in a task, so publishing only enqueues the
+update; ``manage.py reindex_search`` rebuilds everything in the worker.
+
+Every search adds its latency to counters in the cache, bucketed, so
+``manage.py search_stats`` can report percentiles without a metrics service.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from wagtail.models import Page
+
+from .cache import _incr, get_cache
+
+logger = logging.getLogger(__name__)
+
+COUNT_KEY = "search:count"
+TOTAL_MS_KEY = "search:total_ms"
+# upper bounds in milliseconds; slower searches go in the last bucket
+LATENCY_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+def _bucket_key(bound):
+    return f"search:le:{bound}"
+
+
+def record_search(query, elapsed_ms):
+    _incr(COUNT_KEY)
+    _incr(TOTAL_MS_KEY, round(elapsed_ms))
+    bound = next((b for b in LATENCY_BUCKETS if elapsed_ms <= b), "inf")
+    _incr(_bucket_key(bound))
+    if elapsed_ms > settings.SEARCH_SLOW_MS:
+        logger.warning("Slow search %r: %.0fms", query, elapsed_ms)
+
+
+def search_stats():
+    """Number of searches, mean latency and bucket-bound percentiles (ms)."""
+    bounds = LATENCY_BUCKETS + ["inf"]
+    values = get_cache().get_many(
+        [COUNT_KEY, TOTAL_MS_KEY] + [_bucket_key(bound) for bound in bounds]
+    )
+    count = values.get(COUNT_KEY, 0)
+    buckets = {bound: values.get(_bucket_key(bound), 0) for bound in bounds}
+
+    def percentile(fraction):
+        seen = 0
+        for bound, n in buckets.items():
+            seen += n
+            if count and seen >= fraction * count:
+                return bound
+        return None
+
+    return {
+        "count": count,
+        "mean_ms": values.get(TOTAL_MS_KEY, 0) / count if count else 0.0,
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "buckets": buckets,
+    }
+
+
+def reset_search_stats():
+    get_cache().delete_many(
+        [COUNT_KEY, TOTAL_MS_KEY]
+        + [_bucket_key(bound) for bound in LATENCY_BUCKETS + ["inf"]]
+    )
+
+
+def search_pages(query, page_number=None):
+    """
+    One page of live, public pages matching ``query``, best match first.
+    Returns ``(page, elapsed_ms)``; the results are already fetched.
+    """
+    started = time.perf_counter()
+    query = query[: settings.SEARCH_MAX_QUERY_LENGTH]
+    results = Page.objects.live().public().search(query)
+    page = Paginator(results, settings.SEARCH_PAGE_SIZE).get_page(page_number)
+    # the count and the ranked slice are the two index queries
+    page.object_list = list(page.object_list)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    record_search(query, elapsed_ms)
+    return page, elapsed_ms
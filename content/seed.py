@@ -0,0 +1,249 @@
+"""
+Synthetic content for the benchmarks (``seed_content``, ``bench_site``).
+
+Each scale gets its own subtree under the default site's root page,
+``/bench-<scale>/``, with one page of every ``content`` type sized by
+``SCALES``. Images and documents share a single small file each: only the
+first of each is saved normally, the rest are inserted with ``bulk_create``,
+so no upload signals (renditions, previews) fire for them.
+"""
+import io
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image as PILImage
+from wagtail.documents.models import Document
+from wagtail.images.models import Image
+from wagtail.models import Collection, Site
+from wagtail.rich_text import RichText
+
+from .models import (
+    AchievementPage,
+    ContactFormField,
+    ContactPage,
+    GRDocument,
+    GRPage,
+    MediaUpdatesPage,
+    ObjectivesPage,
+    PhotoGalleryEventPage,
+    PhotoGalleryImage,
+    PhotoGalleryIndexPage,
+    RTIDocument,
+    RTIPage,
+    SimplePage,
+)
+
+SCALES = {
+    "small": {
+        "gallery_images": 10,
+        "documents": 10,
+        "blocks": 5,
+        "events": 5,
+        "form_fields": 3,
+    },
+    "large": {
+        "gallery_images": 1000,
+        "documents": 5000,
+        "blocks": 200,
+        "events": 200,
+        "form_fields": 10,
+    },
+}
+
+LOREM = (
+    "Parents and teachers met to discuss fee regulation, admissions under the "
+    "RTE quota and the implementation of the latest government resolutions."
+)
+
+
+def root_slug(scale):
+    return f"bench-{scale}"
+
+
+def seeded_root(scale):
+    site = Site.objects.get(is_default_site=True)
+    return site.root_page.get_children().filter(slug=root_slug(scale)).first()
+
+
+def _collection(scale):
+    root = Collection.get_first_root_node()
+    name = f"Benchmark ({scale})"
+    collection = root.get_children().filter(name=name).first()
+    return collection or root.add_child(name=name)
+
+
+def _images(collection, count):
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (800, 600), "steelblue").save(buffer, "JPEG")
+    first = Image.objects.create(
+        title="Benchmark image 0",
+        collection=collection,
+        file=ContentFile(buffer.getvalue(), name="benchmark.jpg"),
+    )
+    # the rest share the first one's file; renditions are still per image
+    Image.objects.bulk_create(
+        Image(
+            title=f"Benchmark image {i}",
+            collection=collection,
+            file=first.file.name,
+            width=first.width,
+            height=first.height,
+            file_size=first.file_size,
+            file_hash=first.file_hash,
+        )
+        for i in range(1, count)
+    )
+    return list(Image.objects.filter(collection=collection).order_by("id"))
+
+
+def _documents(collection, count):
+    data = b"%PDF-1.4\n% benchmark document\n" + b"0" * 20_000
+    first = Document.objects.create(
+        title="Benchmark document 0",
+        collection=collection,
+        file=ContentFile(data, name="benchmark.pdf"),
+    )
+    Document.objects.bulk_create(
+        Document(
+            title=f"Benchmark document {i}",
+            collection=collection,
+            file=first.file.name,
+            file_size=first.file_size,
+            file_hash=first.file_hash,
+        )
+        for i in range(1, count)
+    )
+    return list(Document.objects.filter(collection=collection).order_by("id"))
+
+
+def _listed(model, page, documents):
+    rows = []
+    for i, document in enumerate(documents):
+        row = model(page=page, title=f"Circular {i}: {LOREM[:60]}", document=document, sort_order=i)
+        row.copy_document_fields(document)
+        rows.append(row)
+    model.objects.bulk_create(rows, batch_size=1000)
+
+
+@transaction.atomic
+def seed_site(scale):
+    """Create the ``scale`` benchmark subtree. Returns ``{label: page}``."""
+    sizes = SCALES[scale]
+    delete_seeded(scale)
+    collection = _collection(scale)
+    images = _images(collection, sizes["gallery_images"])
+    documents = _documents(collection, sizes["documents"])
+
+    site_root = Site.objects.get(is_default_site=True).root_page
+    root = site_root.add_child(instance=SimplePage(
+        title=f"Benchmark ({scale})", slug=root_slug(scale), body=f"<p>{LOREM}</p>",
+    ))
+    pages = {"simple": root}
+
+    blocks = range(sizes["blocks"])
+    pages["achievements"] = root.add_child(instance=AchievementPage(
+        title="Achievements", slug="achievements", intro=f"<p>{LOREM}</p>",
+        achievements=[
+            ("achievement", {
+                "title": f"Achievement {i}",
+                "description": RichText(
+                    f"<h3>Outcome {i}</h3><p>{LOREM}</p><ul><li>{LOREM}</li></ul>"
+                    f'<p><a linktype="page" id="{root.id}">Overview</a>, '
+                    f'<a linktype="document" id="{documents[i % len(documents)].id}">order</a></p>'
+                ),
+                "image": images[i % len(images)],
+            })
+            for i in blocks
+        ],
+    ))
+    pages["media_updates"] = root.add_child(instance=MediaUpdatesPage(
+        title="Media updates", slug="media-updates", intro=f"<p>{LOREM}</p>",
+        media_updates=[
+            ("media", {
+                "title": f"Press coverage {i}",
+                "media_link": f"https://news.example/{i}",
+                "video_embed": RichText(""),
+                "thumbnail": images[i % len(images)],
+            })
+            for i in blocks
+        ],
+    ))
+    pages["objectives"] = root.add_child(instance=ObjectivesPage(
+        title="Objectives", slug="objectives", intro=f"<p>{LOREM}</p>",
+        objectives=[
+            ("objective", {
+                "title": f"Objective {i}",
+                "description": LOREM,
+                "icon": "fa-solid fa-seedling",
+            })
+            for i in blocks
+        ],
+    ))
+
+    pages["gr"] = root.add_child(instance=GRPage(title="GR", slug="gr", custom_title="GR"))
+    _listed(GRDocument, pages["gr"], documents)
+    pages["rti"] = root.add_child(instance=RTIPage(title="RTI", slug="rti", custom_title="RTI"))
+    _listed(RTIDocument, pages["rti"], documents)
+
+    pages["gallery_index"] = gallery = root.add_child(instance=PhotoGalleryIndexPage(
+        title="Photo gallery", slug="photo-gallery", intro=LOREM,
+    ))
+    for i in range(sizes["events"]):
+        event = gallery.add_child(instance=PhotoGalleryEventPage(
+            title=f"Event {i}", slug=f"event-{i}", description=LOREM,
+        ))
+        # the first event has every photo, the others one cover each
+        event_images = images if i == 0 else [images[i % len(images)]]
+        PhotoGalleryImage.objects.bulk_create(
+            PhotoGalleryImage(page=event, image=image, caption=f"Photo {n}")
+            for n, image in enumerate(event_images)
+        )
+        if i == 0:
+            pages["gallery_event"] = event
+
+    pages["contact"] = contact = root.add_child(instance=ContactPage(
+        title="Contact", slug="contact",
+        to_address="office@example.com", from_address="site@example.com",
+        subject="Benchmark message",
+    ))
+    for i in range(sizes["form_fields"]):
+        # save() derives clean_name
+        ContactFormField.objects.create(
+            page=contact, label=f"Field {i}", field_type="singleline", required=False
+        )
+    pages["document"] = documents[0]
+    return pages
+
+
+def seeded_pages(scale):
+    """``{label: page}`` of an already seeded scale, or None."""
+    root = seeded_root(scale)
+    if root is None:
+        return None
+    children = {page.slug: page for page in root.get_children().specific()}
+    gallery = children["photo-gallery"]
+    return {
+        "simple": root.specific,
+        "achievements": children["achievements"],
+        "media_updates": children["media-updates"],
+        "objectives": children["objectives"],
+        "gr": children["gr"],
+        "rti": children["rti"],
+        "gallery_index": gallery,
+        "gallery_event": gallery.get_children().specific().get(slug="event-0"),
+        "contact": children["contact"],
+        "document": Document.objects.filter(collection__name=f"Benchmark ({scale})")
+        .order_by("id").first(),
+    }
+
+
+@transaction.atomic
+def delete_seeded(scale):
+    root = seeded_root(scale)
+    if root is not None:
+        root.delete()
+    collection = Collection.objects.filter(name=f"Benchmark ({scale})").first()
+    if collection is not None:
+        Image.objects.filter(collection=collection).delete()
+        Document.objects.filter(collection=collection).delete()
+        collection.delete()
@@ -0,0 +1,213 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.conf import settings
+from wagtail.contrib.frontend_cache.utils import PurgeBatch
+from wagtail.documents.models import Document
+from wagtail.images.models import Image
+from wagtail.models import Page
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from .cache import purge_page
+from .fragments import purge_block_fragments
+from .highlights import highlight_page_types, purge_home
+from .richtext import purge_references
+from .snapshot import refresh_snapshot_on_commit
+
+
+def _purge_home_for(page):
+    if issubclass(page.specific_class or type(page), highlight_page_types()):
+        purge_home()
+
+
+def purge_proxy(pages):
+    if settings.WAGTAILFRONTENDCACHE:
+        batch = PurgeBatch()
+        batch.add_pages(pages)
+        batch.purge()
+
+
+def purge_page_and_parent(sender, instance, **kwargs):
+    # index pages (e.g. the photo gallery index) list their children
+    purge_page(instance.id)
+    # rich text linking to it
+    purge_references(Page, [instance.id])
+    parent = instance.get_parent()
+    if parent is not None:
+        purge_page(parent.id)
+    _purge_home_for(instance)
+    purge_proxy([page for page in (instance, parent) if page is not None])
+
+
+def purge_moved_page(sender, instance, parent_page_before, parent_page_after, **kwargs):
+    pages = list(instance.get_descendants(inclusive=True))
+    for page in pages:
+        purge_page(page.id)
+    purge_page(parent_page_before.id)
+    purge_page(parent_page_after.id)
+    purge_references(Page, [page.id for page in pages])
+    # the URLs of any highlighted descendant changed
+    purge_home()
+    purge_proxy(pages + [parent_page_before, parent_page_after])
+
+
+def purge_deleted_page(sender, instance, **kwargs):
+    purge_page(instance.id)
+    purge_references(Page, [instance.id])
+    _purge_home_for(instance)
+    if instance.depth > 1:
+        parent_path = instance.path[: -Page.steplen]
+        parent_id = Page.objects.filter(path=parent_path).values_list("id", flat=True).first()
+        if parent_id:
+            purge_page(parent_id)
+
+
+def resolve_embeds_on_publish(sender, instance, **kwargs):
+    from .embeds import missing_embed_urls, page_embed_urls
+    from .tasks import resolve_page_embeds
+
+    if missing_embed_urls(page_embed_urls(instance.specific)):
+        transaction.on_commit(lambda: resolve_page_embeds.enqueue(instance.id))
+
+
+# what an image's rendition URLs depend on
+RENDERING_FIELDS = (
+    "file", "focal_point_x", "focal_point_y", "focal_point_width", "focal_point_height",
+)
+
+
+def _rendering_fields(image):
+    # FieldFiles compare by name
+    return tuple(getattr(image, name) for name in RENDERING_FIELDS)
+
+
+def purge_images(image_ids):
+    """
+    Purge what shows these images once their renditions changed: rendered
+    blocks, the pages referring to them (blocks, gallery photos, rich
+    text), the pages listing those and the home page if one is
+    highlighted. Returns the ids of the pages referring to them.
+    """
+    purge_block_fragments()
+    page_ids = {int(page_id) for page_id in purge_references(Image, image_ids)}
+    pages = list(Page.objects.filter(id__in=page_ids).only("path", "depth", "content_type"))
+    # index pages show their events' cover photos
+    parent_paths = {page.path[: -Page.steplen] for page in pages if page.depth > 1}
+    for parent_id in Page.objects.filter(path__in=parent_paths).values_list("id", flat=True):
+        purge_page(parent_id)
+    for page in pages:
+        _purge_home_for(page)
+    refresh_snapshot_on_commit(page_ids)
+    return page_ids
+
+
+def remember_image_rendering(sender, instance, **kwargs):
+    if instance.pk:
+        before = sender.objects.only(*RENDERING_FIELDS).filter(pk=instance.pk).first()
+        instance._rendering_before = before and _rendering_fields(before)
+
+
+def purge_image_fragments(sender, instance, created=False, **kwargs):
+    if created:
+        # nothing shows it yet
+        return
+    if getattr(instance, "_rendering_before", None) == _rendering_fields(instance):
+        # title, tags or collection: renditions are unchanged
+        return
+    purge_images([instance.id])
+
+
+def purge_deleted_image(sender, instance, **kwargs):
+    purge_images([instance.id])
+
+
+def pregenerate_renditions(sender, instance, **kwargs):
+    from .tasks import generate_image_renditions
+
+    transaction.on_commit(lambda: generate_image_renditions.enqueue(instance.id))
+
+
+def set_document_metadata(sender, instance, **kwargs):
+    # the admin upload views already do this; cover imports and scripts too,
+    # so document responses can always use the stored hash as ETag
+    if instance.file and (not instance.file_hash or instance.file_size is None):
+        try:
+            instance._set_document_file_metadata()
+        except FileNotFoundError:
+            pass
+
+
+def refresh_document_listings(sender, instance, **kwargs):
+    from .models import GRDocument, RTIDocument
+
+    for model in (GRDocument, RTIDocument):
+        rows = list(model.objects.filter(document=instance))
+        if not rows:
+            continue
+        for row in rows:
+            row.copy_document_fields(instance)
+        model.objects.bulk_update(rows, model.listing_fields)
+        page_ids = {row.page_id for row in rows}
+        for page_id in page_ids:
+            purge_page(page_id)
+        refresh_snapshot_on_commit(page_ids)
+
+
+def purge_document_references(sender, instance, **kwargs):
+    # its URL is in any rich text linking to it
+    refresh_snapshot_on_commit(purge_references(Document, [instance.id]))
+
+
+def make_document_preview(sender, instance, **kwargs):
+    from .models import DocumentPreview
+    from .previews import previews_available
+    from .tasks import generate_document_previews
+
+    if not instance.file.name.lower().endswith(".pdf") or not previews_available():
+        return
+    if not DocumentPreview.objects.filter(document=instance, file_hash=instance.file_hash).exists():
+        transaction.on_commit(lambda: generate_document_previews.enqueue([instance.id]))
+
+
+def refresh_snapshot_on_publish(sender, instance, **kwargs):
+    refresh_snapshot_on_commit([instance.id])
+
+
+def remove_deleted_from_snapshot(sender, instance, **kwargs):
+    from .snapshot import page_target
+
+    if not settings.SNAPSHOT_ON_PUBLISH:
+        return
+    # its URL is only known now; the parent re-renders without it
+    target = page_target(instance)
+    parent_path = instance.path[: -Page.steplen]
+    parent_ids = list(Page.objects.filter(path=parent_path).values_list("id", flat=True))
+    refresh_snapshot_on_commit(parent_ids, [target[:2]] if target else [])
+
+
+def rebuild_snapshot_on_move(sender, **kwargs):
+    from .tasks import rebuild_snapshot
+
+    if settings.SNAPSHOT_ON_PUBLISH:
+        # every URL under the moved page changed
+        transaction.on_commit(rebuild_snapshot.enqueue)
+
+
+def register_signal_handlers():
+    page_published.connect(purge_page_and_parent)
+    page_unpublished.connect(purge_page_and_parent)
+    page_published.connect(resolve_embeds_on_publish)
+    post_page_move.connect(purge_moved_page)
+    page_published.connect(refresh_snapshot_on_publish)
+    page_unpublished.connect(refresh_snapshot_on_publish)
+    post_delete.connect(remove_deleted_from_snapshot, sender=Page)
+    post_page_move.connect(rebuild_snapshot_on_move)
+    post_delete.connect(purge_deleted_page, sender=Page)
+    post_save.connect(pregenerate_renditions, sender=Image)
+    pre_save.connect(remember_image_rendering, sender=Image)
+    post_save.connect(purge_image_fragments, sender=Image)
+    post_delete.connect(purge_deleted_image, sender=Image)
+    pre_save.connect(set_document_metadata, sender=Document)
+    post_save.connect(refresh_document_listings, sender=Document)
+    post_save.connect(make_document_preview, sender=Document)
+    post_save.connect(purge_document_references, sender=Document)
+    post_delete.connect(purge_document_references, sender=Document)
@@ -0,0 +1,293 @@
+"""
+Static snapshot of the public site.
+
+``snapshot_site`` renders the home page and every live, public page to
+``SNAPSHOT_ROOT/builds/<build>/<hostname>/<path>/index.html`` in a pool of
+worker processes, then points the ``SNAPSHOT_ROOT/current`` symlink at the
+new build in one atomic rename, so the front proxy never sees a half-written
+tree. Point the proxy at ``current/$host`` and fall back to Django for
+anything not there (query strings, POSTs, JSON endpoints, media), e.g. for
+nginx::
+
+    location / {
+        root /srv/ffe/snapshot/current/$host;
+        if ($args) { proxy_pass http://django; }
+        try_files $uri/index.html @django;
+    }
+
+Pages are rendered through the whole request handler as an anonymous
+visitor, so middleware and the block cache apply; the page cache does not,
+so a copy cached before a purge is never written out. Responses that
+are not the same for everyone (they set a cookie or use a CSRF token) are
+left out, and keep being served by Django.
+
+With ``SNAPSHOT_ON_PUBLISH``, publishing or unpublishing a page, and
+anything else that purges pages from the page cache (document changes, new
+previews, resolved embeds), re-renders only those pages and the pages that
+list them (their parents, pages linking to them, the home page for
+highlighted types) into the current build, each file replaced atomically;
+deleting a page removes its file and moving one rebuilds the snapshot.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from wagtail.models import Page, ReferenceIndex, Site
+
+from .cache import is_shareable
+from .highlights import highlight_page_types
+from .renditions import _init_worker
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+def snapshot_root():
+    return Path(settings.SNAPSHOT_ROOT)
+
+
+def current_build():
+    """The directory the proxy serves, or None before the first build."""
+    current = snapshot_root() / "current"
+    return current.resolve() if current.is_symlink() else None
+
+
+def page_target(page):
+    """``(hostname, path, page_id)`` of a routable page, or None."""
+    url_parts = page.get_url_parts()
+    if url_parts is None:
+        return None
+    _, root_url, page_path = url_parts
+    return (urlsplit(root_url).hostname, page_path, page.id)
+
+
+def home_targets():
+    return [(site.hostname, "/", None) for site in Site.objects.all()]
+
+
+def snapshot_targets(pages=None):
+    """
+    What a snapshot holds: the home page of each site and ``pages`` (default:
+    every live, public page).
+    """
+    if pages is None:
+        pages = Page.objects.live().public().filter(depth__gt=1).specific()
+        targets = home_targets()
+    else:
+        targets = []
+    for page in pages:
+        target = page_target(page)
+        if target is not None:
+            targets.append(target)
+    return targets
+
+
+def output_path(build, hostname, path):
+    return Path(build) / hostname / path.lstrip("/") / "index.html"
+
+
+def write_atomic(path, data):
+    """Write ``data`` next to ``path`` and rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False) as f:
+        f.write(data)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+def render_targets(targets, build):
+    """
+    Render ``targets`` into ``build``. Returns ``(results, errors)``:
+    ``results`` has ``{url, page_id, file, bytes, ms}`` per page written,
+    or ``skipped`` for pages that cannot be shared.
+    """
+    results = []
+    errors = []
+    for hostname, path, page_id in targets:
+        url = f"//{hostname}{path}"
+        # the full handler, as a visitor's request would go
+        client = Client(HTTP_HOST=hostname)
+        started = time.perf_counter()
+        try:
+            with override_settings(PAGE_CACHE_ENABLED=False):
+                response = client.get(path)
+        except Exception as exc:
+            errors.append((url, repr(exc)))
+            continue
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            errors.append((url, f"status {response.status_code}"))
+            continue
+        if not is_shareable(response.wsgi_request, response):
+            results.append({"url": url, "page_id": page_id, "skipped": True, "ms": elapsed_ms})
+            continue
+        target = output_path(build, hostname, path)
+        write_atomic(target, response.content)
+        results.append({
+            "url": url,
+            "page_id": page_id,
+            "file": str(target.relative_to(build)),
+            "bytes": len(response.content),
+            "ms": elapsed_ms,
+        })
+    return results, errors
+
+
+def render_targets_in_pool(targets, build, workers=None, batch_size=20, on_batch=None):
+    """
+    Split ``targets`` into batches and run ``render_targets`` on each in a
+    pool of ``workers`` processes (default: one per core; 0 renders in this
+    process).
+    """
+    batches = [targets[i:i + batch_size] for i in range(0, len(targets), batch_size)]
+    results = []
+    errors = []
+    if workers == 0:
+        for batch in batches:
+            batch_results, batch_errors = render_targets(batch, build)
+            results += batch_results
+            errors += batch_errors
+            if on_batch:
+                on_batch(batch_results, batch_errors)
+        return results, errors
+
+    # forked workers must not share the parent's database connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), initializer=_init_worker
+    ) as pool:
+        futures = [pool.submit(render_targets, batch, build) for batch in batches]
+        for future in as_completed(futures):
+            batch_results, batch_errors = future.result()
+            results += batch_results
+            errors += batch_errors
+            if on_batch:
+                on_batch(batch_results, batch_errors)
+    return results, errors
+
+
+def _write_manifest(build, results):
+    manifest = {result["url"]: result for result in results}
+    write_atomic(Path(build) / MANIFEST, json.dumps(manifest, indent=1).encode())
+
+
+def _read_manifest(build):
+    try:
+        return json.loads((Path(build) / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _publish(build):
+    """Point ``current`` at ``build`` and drop builds beyond SNAPSHOT_KEEP_BUILDS."""
+    root = snapshot_root()
+    link = root / f".current-{os.getpid()}"
+    link.unlink(missing_ok=True)
+    link.symlink_to(Path(build).relative_to(root))
+    os.replace(link, root / "current")
+
+    builds = sorted((root / "builds").iterdir(), key=lambda path: path.name)
+    for old in builds[:-settings.SNAPSHOT_KEEP_BUILDS]:
+        if old != Path(build):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def snapshot_site(workers=None, batch_size=20, on_batch=None):
+    """
+    Render the whole site into a new build and switch the proxy to it.
+    Returns ``(build, results, errors)``.
+    """
+    build = snapshot_root() / "builds" / timezone.now().strftime("%Y%m%d-%H%M%S-%f")
+    build.mkdir(parents=True)
+    results, errors = render_targets_in_pool(
+        snapshot_targets(), build, workers=workers, batch_size=batch_size, on_batch=on_batch
+    )
+    _write_manifest(build, results)
+    _publish(build)
+    return build, results, errors
+
+
+def listing_pages(page):
+    """
+    Live pages whose output shows ``page``: its parent (index pages list
+    their children) and pages linking to it in rich text.
+    """
+    ids = set(
+        ReferenceIndex.objects.filter(
+            base_content_type=ContentType.objects.get_for_model(Page),
+            to_content_type=ReferenceIndex._get_base_content_type(Page),
+            to_object_id=str(page.id),
+        ).values_list("object_id", flat=True)
+    )
+    parent = page.get_parent()
+    if parent is not None:
+        ids.add(str(parent.id))
+    ids.discard(str(page.id))
+    return Page.objects.live().public().filter(id__in=ids, depth__gt=1).specific()
+
+
+def refresh_snapshot(page_ids, removed=()):
+    """
+    Re-render the given pages and the pages listing them into the current
+    build, and delete the files of ``removed`` ``(hostname, path)`` pairs.
+    Pages that are no longer live or public are removed too. Returns
+    ``(results, errors)``; does nothing before the first full build.
+    """
+    build = current_build()
+    if build is None:
+        return [], []
+
+    removed = [tuple(target) for target in removed]
+    render = {}
+    home = False
+    for page in Page.objects.filter(id__in=page_ids).specific():
+        target = page_target(page)
+        if page.live and not page.get_view_restrictions().exists():
+            render[page.id] = page
+        elif target is not None:
+            removed.append(target[:2])
+        for listing in listing_pages(page):
+            render[listing.id] = listing
+        home = home or isinstance(page, highlight_page_types())
+
+    manifest = _read_manifest(build)
+    for hostname, path in removed:
+        output_path(build, hostname, path).unlink(missing_ok=True)
+        manifest.pop(f"//{hostname}{path}", None)
+
+    targets = snapshot_targets(render.values())
+    if home:
+        targets += home_targets()
+    results, errors = render_targets(targets, build)
+    for result in results:
+        manifest[result["url"]] = result
+        logger.info("Snapshot %s: %.1fms", result["url"], result["ms"])
+    for url, error in errors:
+        logger.warning("Snapshot of %s failed: %s", url, error)
+    _write_manifest(build, manifest.values())
+    return results, errors
+
+
+def refresh_snapshot_on_commit(page_ids, removed=()):
+    """
+    With ``SNAPSHOT_ON_PUBLISH``, queue ``refresh_snapshot`` for ``page_ids``
+    once the current transaction commits. Call it next to ``purge_page``.
+    """
+    from .tasks import refresh_snapshot_pages
+
+    page_ids = sorted({int(page_id) for page_id in page_ids})
+    removed = [list(target) for target in removed]
+    if settings.SNAPSHOT_ON_PUBLISH and (page_ids or removed):
+        transaction.on_commit(lambda: refresh_snapshot_pages.enqueue(page_ids, removed))
@@ -0,0 +1,294 @@
+"""
+Background pipeline for contact form submissions.
+
+``ContactPage.serve`` only records the validated payload in
+``QueuedSubmission`` and enqueues ``flush_submissions``; the worker then stores
+the ``FormSubmission`` rows in bulk, commits them, and sends the notification
+emails over a single SMTP connection. Failed rows (the connection included)
+are retried with a growing delay and end up in ``DeadLetterSubmission`` after
+``CONTACT_PIPELINE_MAX_ATTEMPTS``.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.formats import date_format
+from django.utils.dateparse import parse_date, parse_datetime
+from django_tasks import task
+from wagtail.admin.mail import send_mail
+from wagtail.contrib.forms.models import FormSubmission
+
+from .models import DeadLetterSubmission, QueuedSubmission
+
+logger = logging.getLogger(__name__)
+
+
+def queue_submission(page, form_data):
+    queued = QueuedSubmission.objects.create(page=page, form_data=form_data)
+    transaction.on_commit(flush_submissions.enqueue)
+    return queued
+
+
+def render_email(page, form_data):
+    """
+    ``EmailFormMixin.render_email`` without a bound form: the worker only has
+    the JSON-serialised ``cleaned_data``.
+    """
+    content = []
+    for field in page.get_form(page=page, user=None):
+        if field.name not in form_data:
+            continue
+
+        value = form_data[field.name]
+
+        if isinstance(value, list):
+            value = ", ".join(value)
+        elif isinstance(value, str) and value:
+            # dates come back from JSON as ISO strings
+            as_datetime = parse_datetime(value) if "T" in value else None
+            if as_datetime:
+                value = date_format(as_datetime, "SHORT_DATETIME_FORMAT")
+            else:
+                try:
+                    as_date = parse_date(value)
+                except ValueError:
+                    as_date = None
+                if as_date:
+                    value = date_format(as_date, "SHORT_DATE_FORMAT")
+
+        content.append(f"{field.label}: {value}")
+
+    return "\n".join(content)
+
+
+def _retry_delay(attempts):
+    base = settings.CONTACT_PIPELINE_RETRY_DELAY
+    return datetime.timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def _store(batch, now):
+    pending = [item for item in batch if item.submission_id is None]
+    submissions = FormSubmission.objects.bulk_create(
+        FormSubmission(page_id=item.page_id, form_data=item.form_data)
+        for item in pending
+    )
+    for item, submission in zip(pending, submissions):
+        item.submission = submission
+        item.stored_at = now
+
+
+def _deliver(batch, now):
+    failed = {}
+    pending = []
+    for item in batch:
+        if item.page.to_address:
+            pending.append(item)
+        else:
+            item.delivered_at = now
+    if not pending:
+        return failed
+
+    try:
+        with get_connection() as connection:
+            for item in pending:
+                page = item.page
+                try:
+                    send_mail(
+                        page.subject,
+                        render_email(page, item.form_data),
+                        [x.strip() for x in page.to_address.split(",")],
+                        page.from_address,
+                        connection=connection,
+                    )
+                except Exception as exc:
+                    logger.warning("Contact email for %s failed: %s", item.pk, exc)
+                    failed[item.pk] = exc
+                else:
+                    item.delivered_at = timezone.now()
+    except Exception as exc:
+        # opening or closing the SMTP connection
+        logger.warning("Contact email connection failed: %s", exc)
+        for item in pending:
+            if item.delivered_at is None:
+                failed.setdefault(item.pk, exc)
+    return failed
+
+
+def _reschedule(item, exc, now):
+    item.attempts += 1
+    item.last_error = repr(exc)
+    if item.attempts < settings.CONTACT_PIPELINE_MAX_ATTEMPTS:
+        item.next_attempt_at = now + _retry_delay(item.attempts)
+        return True
+
+    DeadLetterSubmission.objects.create(
+        page_id=item.page_id,
+        form_data=item.form_data,
+        submission=item.submission,
+        accepted_at=item.accepted_at,
+        attempts=item.attempts,
+        error=item.last_error,
+    )
+    item.delete()
+    return False
+
+
+def _record(batch, failed, now):
+    """Save the outcome of ``batch``. Returns the earliest retry, if any."""
+    retry_at = None
+    for item in batch:
+        if item.pk not in failed:
+            item.save()
+        elif _reschedule(item, failed[item.pk], now):
+            item.save()
+            if retry_at is None or item.next_attempt_at < retry_at:
+                retry_at = item.next_attempt_at
+    return retry_at
+
+
+@task()
+def flush_submissions():
+    """
+    Store and email every due submission, ``CONTACT_PIPELINE_BATCH_SIZE`` at a
+    time. Safe to run concurrently: rows are claimed with SKIP LOCKED.
+    """
+    processed = 0
+    retry_ats = []
+
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                QueuedSubmission.objects.select_for_update(skip_locked=True, of=("self",))
+                .select_related("page")
+                .filter(delivered_at__isnull=True, next_attempt_at__lte=now)
+                .order_by("accepted_at")[: settings.CONTACT_PIPELINE_BATCH_SIZE]
+            )
+            if not batch:
+                break
+
+            try:
+                with transaction.atomic():
+                    _store(batch, now)
+                    for item in batch:
+                        # claimed while emailed outside this transaction; due
+                        # again after the retry delay if this worker dies
+                        item.next_attempt_at = now + _retry_delay(item.attempts + 1)
+                        item.save()
+                stored = True
+            except Exception as exc:
+                logger.exception("Storing contact submissions failed")
+                retry_ats.append(_record(batch, {item.pk: exc for item in batch}, now))
+                stored = False
+
+        # the submissions are committed before any email is sent, so a
+        # failing delivery can no longer roll them back
+        if stored:
+            failed = _deliver(batch, now)
+            with transaction.atomic():
+                retry_ats.append(_record(batch, failed, now))
+
+        processed += len(batch)
+        if len(batch) < settings.CONTACT_PIPELINE_BATCH_SIZE:
+            break
+
+    retry_at = min(filter(None, retry_ats), default=None)
+    if retry_at and flush_submissions.get_backend().supports_defer:
+        flush_submissions.using(run_after=retry_at).enqueue()
+
+    return processed
+
+
+@task()
+def generate_image_renditions(image_id):
+    """
+    Normalise a newly saved image's original (see ``originals.py``), then
+    pre-generate its responsive rendition set from the result.
+    """
+    from .originals import normalise_images
+    from .renditions import generate_renditions
+
+    if settings.IMAGE_NORMALISE_ON_UPLOAD:
+        _, errors = normalise_images([image_id])
+        for _, error in errors:
+            logger.warning("Normalising image %s failed: %s", image_id, error)
+    created, errors = generate_renditions([image_id])
+    for _, error in errors:
+        logger.warning("Renditions for image %s failed: %s", image_id, error)
+    return created
+
+
+@task()
+def resolve_page_embeds(page_id):
+    """
+    Fetch and store the embeds of a published page that are not stored yet,
+    then drop the cached page that shows their placeholders. Blocks and rich
+    text with a placeholder are never cached (see embeds.py).
+    """
+    from wagtail.models import Page
+
+    from .cache import purge_page
+    from .embeds import page_embed_urls, resolve_embeds
+    from .snapshot import refresh_snapshot_on_commit
+
+    page = Page.objects.filter(id=page_id).first()
+    if page is None:
+        return 0
+    resolved, errors = resolve_embeds(page_embed_urls(page.specific), workers=1)
+    for url, error in errors:
+        logger.warning("Embed %s on page %s failed: %s", url, page_id, error)
+    if resolved:
+        purge_page(page_id)
+        refresh_snapshot_on_commit([page_id])
+    return len(resolved)
+
+
+@task()
+def rebuild_search_index():
+    """
+    Rebuild the search index (``manage.py reindex_search``). On PostgreSQL
+    entries are upserted in place and stale ones deleted, so search keeps
+    answering while this runs.
+    """
+    from django.core.management import call_command
+
+    call_command(
+        "update_index", chunk_size=settings.SEARCH_REINDEX_CHUNK_SIZE, verbosity=0
+    )
+
+
+@task()
+def generate_document_previews(document_ids):
+    """Make the missing previews of newly uploaded or replaced documents."""
+    from .previews import generate_previews
+
+    created, errors = generate_previews(document_ids)
+    for document_id, error in errors:
+        logger.warning("Preview of document %s failed: %s", document_id, error)
+    return created
+
+
+@task()
+def refresh_snapshot_pages(page_ids, removed=()):
+    """
+    Re-render published pages, and the pages that list them, into the static
+    snapshot; ``removed`` are ``[hostname, path]`` pairs of deleted pages.
+    """
+    from .snapshot import refresh_snapshot
+
+    results, errors = refresh_snapshot(page_ids, removed)
+    return len(results)
+
+
+@task()
+def rebuild_snapshot():
+    """Render a new snapshot of the whole site, e.g. after a page moved."""
+    from .snapshot import snapshot_site
+
+    _, results, errors = snapshot_site()
+    for url, error in errors:
+        logger.warning("Snapshot of %s failed: %s", url, error)
+    return len(results)
@@ -0,0 +1,67 @@
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+from wagtail.rich_text import RichText
+
+from content.fragments import render_stream
+from content.renditions import responsive_filters, srcset, width_filters, with_format
+from content.richtext import render_richtext
+
+register = template.Library()
+
+
+@register.inclusion_tag("content/tags/responsive_image.html")
+def responsive_image(image, sizes="100vw", alt=None, css_class=""):
+    """
+    Render ``image`` as a <picture> whose srcsets come from the pre-generated
+    ``width-*`` renditions (see content/renditions.py), with a <source> per
+    extra format in RESPONSIVE_IMAGE_FORMATS.
+
+        {% responsive_image block.value.image sizes="(max-width: 600px) 100vw, 400px" %}
+    """
+    if not image:
+        return {"image": None}
+
+    base = width_filters()
+    renditions = image.get_renditions(*responsive_filters())
+
+    fallback = [renditions[spec] for spec in base]
+    sources = [
+        {
+            "type": f"image/{image_format}",
+            "srcset": srcset(renditions[spec] for spec in with_format(base, image_format)),
+        }
+        for image_format in settings.RESPONSIVE_IMAGE_FORMATS
+    ]
+    return {
+        "image": fallback[0],
+        "srcset": srcset(fallback),
+        "sources": sources,
+        "sizes": sizes,
+        "alt": image.default_alt_text if alt is None else alt,
+        "css_class": css_class,
+    }
+
+
+@register.simple_tag(takes_context=True)
+def cached_stream(context, stream_value):
+    """
+    Render a StreamField block by block through the fragment cache (see
+    content/fragments.py). Block templates only get ``value``.
+
+        {% cached_stream page.achievements %}
+    """
+    return render_stream(stream_value, context.get("expanded_richtext"))
+
+
+@register.simple_tag(takes_context=True)
+def cached_richtext(context, value):
+    """
+    Wagtail's ``|richtext`` with links and embeds expanded in batches and
+    cached (see content/richtext.py). Takes a rich text field's value or a
+    RichTextBlock's.
+
+        {% cached_richtext page.intro %}
+    """
+    source = value.source if isinstance(value, RichText) else value
+    return mark_safe(render_richtext(source, context.get("expanded_richtext")))
@@ -1,3 +1,1334 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image as PILImage
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.cache import cache
+from django.http import Http404
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.contrib.forms.models import FormSubmission
+from wagtail.documents.models import Document
+from wagtail.embeds.finders import get_finders
+from wagtail.images.models import Image
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Collection, CollectionViewRestriction, Page, PageViewRestriction, Site
+from wagtail.rich_text import RichText, expand_db_html
+
+from core.concurrency import run_sync, shutdown_pools
+
+from .cache import cache_stats, purge_page
+from .dumps import export_objects, import_objects, iter_json_array, resolve_models
+from .embeds import resolve_embeds
+from .fragments import render_stream
+from .gallery import srcset_filters
+from .previews import generate_previews, pending_documents, pypdf
+from .originals import heif_available, normalise_images
+from .renditions import generate_renditions, rendition_filters
+from .models import (
+    AchievementBlock,
+    AchievementPage,
+    ContactFormField,
+    ContactPage,
+    DeadLetterSubmission,
+    DocumentPreview,
+    GRDocument,
+    GRPage,
+    MediaUpdatesPage,
+    PhotoGalleryEventPage,
+    PhotoGalleryImage,
+    PhotoGalleryIndexPage,
+    QueuedSubmission,
+    SimplePage,
+)
+from .recaptcha import CircuitBreaker, RecaptchaVerifier
+from .search import reset_search_stats, search_stats
+from .views import serve_page
+from .tasks import flush_submissions, queue_submission
+
+
+class StubVerifierHandler(BaseHTTPRequestHandler):
+    """Stand-in for the siteverify endpoint: accepts the token "good"."""
+
+    delay = 0
+    body = None
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        length = int(self.headers["Content-Length"])
+        data = parse_qs(self.rfile.read(length).decode())
+        body = self.body or json.dumps({"success": data.get("response") == ["good"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            pass  # the client gave up waiting
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class RecaptchaVerifierTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubVerifierHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:%s/siteverify" % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubVerifierHandler.delay = 0
+        StubVerifierHandler.body = None
+
+    def make_verifier(self, fail_open=False, timeout=1):
+        return RecaptchaVerifier(
+            url=self.url,
+            secret="secret",
+            timeout=timeout,
+            fail_open=fail_open,
+            verdict_ttl=60,
+            breaker=CircuitBreaker(threshold=1, reset_after=60),
+        )
+
+    def test_verify(self):
+        verifier = self.make_verifier()
+        self.assertTrue(verifier.verify("good"))
+        self.assertFalse(verifier.verify("bad"))
+        self.assertFalse(verifier.verify(""))
+
+    def test_replayed_token_is_rejected(self):
+        verifier = self.make_verifier()
+        self.assertTrue(verifier.verify("good"))
+        self.assertFalse(verifier.verify("good"))
+
+    def test_averify(self):
+        verifier = self.make_verifier()
+        self.assertTrue(async_to_sync(verifier.averify)("good"))
+        self.assertFalse(async_to_sync(verifier.averify)("good"))
+        # every async_to_sync call has its own loop; no client is kept for it
+        self.assertEqual(len(verifier._async_clients), 0)
+
+    @override_settings(SERVER_MODE="asgi")
+    def test_averify_keeps_client_under_asgi(self):
+        verifier = self.make_verifier()
+
+        async def verify_twice():
+            results = [await verifier.averify("good"), await verifier.averify("bad")]
+            self.assertEqual(len(verifier._async_clients), 1)
+            await verifier.aclose()
+            return results
+
+        self.assertEqual(asyncio.run(verify_twice()), [True, False])
+
+    def test_invalid_json_counts_as_unavailable(self):
+        StubVerifierHandler.body = b"<html>Bad gateway</html>"
+        for fail_open in (False, True):
+            cache.clear()
+            verifier = self.make_verifier(fail_open=fail_open)
+            with self.assertLogs("content.recaptcha", "WARNING"):
+                self.assertIs(verifier.verify("good"), fail_open)
+            self.assertTrue(verifier.breaker.is_open)
+
+    def test_breaker_fail_closed_and_open(self):
+        StubVerifierHandler.delay = 0.3
+        for fail_open in (False, True):
+            cache.clear()
+            verifier = self.make_verifier(fail_open=fail_open, timeout=0.1)
+            self.assertIs(verifier.verify("good"), fail_open)
+            self.assertTrue(verifier.breaker.is_open)
+            # open breaker answers without contacting the verifier
+            started = time.monotonic()
+            self.assertIs(verifier.verify("other"), fail_open)
+            self.assertLess(time.monotonic() - started, 0.1)
+
+
+@override_settings(
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+    CONTACT_PIPELINE_MAX_ATTEMPTS=2,
+)
+class ContactPipelineTests(TestCase):
+    def setUp(self):
+        self.page = Page.get_first_root_node().add_child(
+            instance=ContactPage(
+                title="Contact",
+                slug="contact",
+                to_address="office@example.com",
+                from_address="site@example.com",
+                subject="New message",
+            )
+        )
+        ContactFormField.objects.create(
+            page=self.page, label="Message", field_type="multiline"
+        )
+
+    def test_form_posts_to_async_endpoint(self):
+        request = RequestFactory().get("/contact/")
+        request.user = AnonymousUser()
+        response = self.page.serve(request)
+        self.assertContains(
+            response, 'action="%s"' % reverse("contact_submit", args=[self.page.id])
+        )
+        self.assertContains(response, 'name="message"')
+
+    def test_submission_is_stored_and_emailed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_submission(self.page, {"message": "Hello"})
+
+        self.assertEqual(FormSubmission.objects.get().form_data, {"message": "Hello"})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body, "Message: Hello")
+        queued = QueuedSubmission.objects.get()
+        self.assertIsNotNone(queued.stored_at)
+        self.assertIsNotNone(queued.delivered_at)
+
+    def test_failed_email_is_retried_then_dead_lettered(self):
+        queue_submission(self.page, {"message": "Hello"})
+        with mock.patch("content.tasks.send_mail", side_effect=OSError("smtp down")):
+            flush_submissions.call()
+            queued = QueuedSubmission.objects.get()
+            self.assertEqual(queued.attempts, 1)
+            self.assertIsNone(queued.delivered_at)
+
+            QueuedSubmission.objects.update(next_attempt_at=queued.accepted_at)
+            flush_submissions.call()
+
+        self.assertFalse(QueuedSubmission.objects.exists())
+        dead = DeadLetterSubmission.objects.get()
+        self.assertEqual(dead.attempts, 2)
+        # the submission itself was stored before the email failed
+        self.assertEqual(dead.submission, FormSubmission.objects.get())
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_HOST="127.0.0.1",
+        EMAIL_PORT=1,
+    )
+    def test_unreachable_smtp_server_is_retried(self):
+        queue_submission(self.page, {"message": "Hello"})
+        with self.assertLogs("content.tasks", "WARNING"):
+            flush_submissions.call()
+        queued = QueuedSubmission.objects.get()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("ConnectionRefusedError", queued.last_error)
+        self.assertGreater(queued.next_attempt_at, queued.accepted_at)
+        self.assertEqual(queued.submission, FormSubmission.objects.get())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    PAGE_CACHE_ENABLED=True,
+)
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = Site.objects.get(is_default_site=True).root_page
+        self.page = root.add_child(
+            instance=AchievementPage(title="Achievements", slug="achievements")
+        )
+        self.gallery = root.add_child(
+            instance=PhotoGalleryIndexPage(title="Gallery", slug="gallery")
+        )
+        self.event = self.gallery.add_child(
+            instance=PhotoGalleryEventPage(title="Event", slug="event")
+        )
+
+    def test_anonymous_get_is_cached(self):
+        first = self.client.get(self.page.url)
+        second = self.client.get(self.page.url)
+        self.assertEqual(first["X-Page-Cache"], "MISS")
+        self.assertEqual(second["X-Page-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(cache_stats()["hit_ratio"], 0.5)
+
+    def test_unread_query_params_share_a_copy(self):
+        self.client.get(self.page.url)
+        response = self.client.get(self.page.url + "?utm_source=x&fbclid=y")
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+
+        self.client.get(self.gallery.url + "?after=2&utm_source=x")
+        response = self.client.get(self.gallery.url + "?after=2")
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        response = self.client.get(self.gallery.url + "?after=3")
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+
+    @override_settings(
+        MEDIA_ROOT=tempfile.mkdtemp(),
+        TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+    )
+    def test_image_changes_purge_only_pages_showing_it(self):
+        image = Image.objects.create(title="Photo", file=get_test_image_file())
+        PhotoGalleryImage.objects.create(page=self.event, image=image)
+        # the reference index is updated by a task
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.save_revision().publish()
+        pages = (self.page, self.gallery, self.event)
+        for page in pages:
+            self.client.get(page.url)
+
+        image.title = "Renamed"
+        image.save()
+        self.assertEqual([self.client.get(p.url)["X-Page-Cache"] for p in pages], ["HIT"] * 3)
+
+        image.focal_point_x = image.focal_point_y = 10
+        image.focal_point_width = image.focal_point_height = 5
+        image.save()
+        self.assertEqual(
+            [self.client.get(p.url)["X-Page-Cache"] for p in pages], ["HIT", "MISS", "MISS"]
+        )
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    def test_validators_without_page_cache(self):
+        self.page.save_revision().publish()
+        response = self.client.get(self.page.url)
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertTrue(response["Last-Modified"])
+
+        # the locmem version is not folded in: another process could not see it
+        purge_page(self.page.id)
+        revalidated = self.client.get(
+            self.page.url, headers={"if-none-match": response["ETag"]}
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+        self.page.save_revision().publish()
+        response = self.client.get(
+            self.page.url, headers={"if-none-match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.force_login(User.objects.create_user("editor"))
+        self.client.get(self.page.url)
+        response = self.client.get(self.page.url)
+        self.assertNotIn("X-Page-Cache", response)
+
+    def test_publish_purges_page_and_parent(self):
+        self.client.get(self.gallery.url)
+        self.assertEqual(self.client.get(self.gallery.url)["X-Page-Cache"], "HIT")
+
+        self.event.title = "Renamed event"
+        self.event.save_revision().publish()
+
+        response = self.client.get(self.gallery.url)
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "Renamed event")
+
+
+    def test_conditional_get(self):
+        self.page.save_revision().publish()
+        response = self.client.get(self.page.url)
+        self.assertIn("s-maxage=300", response["Cache-Control"])
+        self.assertIn("stale-while-revalidate=60", response["Cache-Control"])
+        self.assertIn("public", response["Cache-Control"])
+
+        revalidated = self.client.get(
+            self.page.url, headers={"if-none-match": response["ETag"]}
+        )
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertNotIn("X-Page-Cache", revalidated)
+        self.assertEqual(revalidated["ETag"], response["ETag"])
+
+        self.page.save_revision().publish()
+        response = self.client.get(
+            self.page.url,
+            headers={
+                "if-none-match": response["ETag"],
+                "if-modified-since": response["Last-Modified"],
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_editors_get_no_store(self):
+        self.client.force_login(User.objects.create_user("editor"))
+        response = self.client.get(self.page.url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-store", response["Cache-Control"])
+        self.assertNotIn("ETag", response)
+
+    @override_settings(
+        TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+        WAGTAILFRONTENDCACHE={"proxy": {
+            "BACKEND": "wagtail.contrib.frontend_cache.backends.HTTPBackend",
+            "LOCATION": "http://proxy.internal:6081",
+        }},
+    )
+    def test_publish_purges_proxy(self):
+        with mock.patch(
+            "wagtail.contrib.frontend_cache.backends.http.HTTPBackend.purge"
+        ) as purge, self.captureOnCommitCallbacks(execute=True):
+            self.event.save_revision().publish()
+        self.assertEqual(
+            sorted(call.args[0] for call in purge.call_args_list),
+            [self.gallery.full_url, self.event.full_url],
+        )
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, MEDIA_ROOT=tempfile.mkdtemp())
+class GalleryQueryCountTests(TestCase):
+    def setUp(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        self.gallery = root.add_child(
+            instance=PhotoGalleryIndexPage(title="Gallery", slug="gallery")
+        )
+        self.image = Image.objects.create(title="Photo", file=get_test_image_file())
+
+    def add_event(self, slug, photos):
+        event = self.gallery.add_child(
+            instance=PhotoGalleryEventPage(title=slug, slug=slug)
+        )
+        for i in range(photos):
+            image = Image.objects.create(
+                title=f"{slug} {i}", file=get_test_image_file(size=(40, 30))
+            )
+            image.get_renditions(*srcset_filters())
+            PhotoGalleryImage.objects.create(page=event, image=image)
+        return event
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_event_page_query_count_is_independent_of_gallery_size(self):
+        small = self.add_event("small", 2)
+        large = self.add_event("large", 12)
+        self.assertEqual(self.count_queries(small.url), self.count_queries(large.url))
+
+    def test_index_page_query_count_is_independent_of_event_count(self):
+        self.add_event("one", 0)
+        few = self.count_queries(self.gallery.url)
+        for i in range(5):
+            self.add_event(f"more-{i}", 0)
+        self.assertEqual(self.count_queries(self.gallery.url), few)
+
+    @override_settings(GALLERY_PAGE_SIZE=2)
+    def test_gallery_pagination(self):
+        event = self.add_event("paged", 5)
+        response = self.client.get(event.url)
+        self.assertEqual(len(response.context["gallery"]["items"]), 2)
+
+        seen = [item["id"] for item in response.context["gallery"]["items"]]
+        next_url = response.context["gallery"]["next_url"]
+        while next_url:
+            data = self.client.get(next_url).json()
+            seen += [item["id"] for item in data["items"]]
+            next_url = data["next_url"]
+        self.assertEqual(
+            seen, [item.image_id for item in event.gallery_images.order_by("pk")]
+        )
+        self.assertEqual(data["items"][0]["srcset"].count(" 40w"), 1)
+
+        events = self.client.get(reverse("gallery_events", args=[self.gallery.id])).json()
+        self.assertEqual(events["items"][0]["cover"]["id"], seen[0])
+
+    def test_restricted_events_are_not_served(self):
+        public = self.add_event("public", 1)
+        private = self.add_event("private", 1)
+        PageViewRestriction.objects.create(
+            page=private, restriction_type=PageViewRestriction.LOGIN
+        )
+        response = self.client.get(reverse("gallery_images", args=[private.id]))
+        self.assertEqual(response.status_code, 404)
+
+        events = self.client.get(reverse("gallery_events", args=[self.gallery.id])).json()
+        self.assertEqual([item["id"] for item in events["items"]], [public.id])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RESPONSIVE_IMAGE_FORMATS=["webp"])
+class RenditionTests(TestCase):
+    def setUp(self):
+        # wagtail caches renditions by image id and file hash, which the
+        # duplicate upload test reuses
+        cache.clear()
+        self.image = Image.objects.create(
+            title="Photo", file=get_test_image_file(size=(1600, 1200))
+        )
+
+    def test_generate_renditions_skips_existing(self):
+        self.image.get_rendition("width-400")
+        created, errors = generate_renditions([self.image.id])
+        self.assertEqual(errors, [])
+        self.assertEqual(created, len(rendition_filters()) - 1)
+        self.assertEqual(generate_renditions([self.image.id]), (0, []))
+
+    def test_duplicate_uploads_reuse_renditions(self):
+        self.image.file.open()
+        data = self.image.file.read()
+        copy = Image.objects.create(title="Copy", file=ContentFile(data, name="copy.png"))
+        self.assertEqual(copy.file.name, self.image.file.name)
+
+        created, _ = generate_renditions([self.image.id])
+        with mock.patch.object(Image, "generate_rendition_file") as generate:
+            self.assertEqual(generate_renditions([copy.id]), (created, []))
+        generate.assert_not_called()
+        self.assertEqual(
+            set(copy.renditions.values_list("file", flat=True)),
+            set(self.image.renditions.values_list("file", flat=True)),
+        )
+
+    def test_responsive_image_tag(self):
+        html = Template(
+            "{% load content_tags %}{% responsive_image image alt='A photo' %}"
+        ).render(Context({"image": self.image}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn("800w", html)
+        self.assertIn('alt="A photo"', html)
+
+
+def photo_file(size, name="photo.jpg", image_format="JPEG", orientation=1):
+    """A phone-style photo: EXIF with a camera, a GPS position and an orientation."""
+    exif = PILImage.Exif()
+    exif[0x010F] = "PhoneMaker"
+    exif[0x0112] = orientation
+    exif[0x8825] = {2: (19.0, 4.0, 33.0)}
+    buffer = io.BytesIO()
+    PILImage.new("RGB", size, "olive").save(buffer, image_format, exif=exif)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    RESPONSIVE_IMAGE_FORMATS=["webp"],
+    IMAGE_ORIGINAL_MAX_DIMENSION=200,
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+)
+class OriginalNormalisationTests(TestCase):
+    def test_downscales_and_strips_exif(self):
+        image = Image.objects.create(title="Photo", file=photo_file((800, 400)))
+        image.focal_point_x, image.focal_point_y = 400, 200
+        image.focal_point_width = image.focal_point_height = 100
+        image.save()
+        image.get_rendition("width-100")
+        old_name = image.file.name
+
+        totals, errors = normalise_images([image.id])
+        self.assertEqual(errors, [])
+        self.assertEqual(totals["normalised"], 1)
+        self.assertGreater(totals["bytes_before"], totals["bytes_after"])
+
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (200, 100))
+        self.assertEqual((image.focal_point_x, image.focal_point_width), (100, 25))
+        self.assertEqual(image.file_size, image.file.size)
+        self.assertFalse(image.renditions.exists())
+        self.assertFalse(image.file.storage.exists(old_name))
+        with image.open_file() as f, PILImage.open(f) as stored:
+            self.assertEqual(len(stored.getexif()), 0)
+
+        # a second pass finds nothing to do
+        self.assertEqual(normalise_images([image.id])[0]["normalised"], 0)
+
+    def test_orientation_is_applied(self):
+        image = Image.objects.create(title="Portrait", file=photo_file((60, 40), orientation=6))
+        normalise_images([image.id])
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (40, 60))
+
+    def test_fitting_originals_are_untouched(self):
+        image = Image.objects.create(title="Small", file=get_test_image_file(size=(40, 30)))
+        name = image.file.name
+        self.assertEqual(normalise_images([image.id])[0]["normalised"], 0)
+        image.refresh_from_db()
+        self.assertEqual(image.file.name, name)
+
+    @skipUnless(heif_available(), "pillow_heif is not installed")
+    def test_upload_converts_heic(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(
+                title="HEIC", file=photo_file((400, 300), name="photo.heic", image_format="HEIF")
+            )
+        image.refresh_from_db()
+        self.assertTrue(image.file.name.endswith(".jpg"))
+        self.assertEqual((image.width, image.height), (200, 150))
+        # renditions were made from the converted original
+        self.assertTrue(image.renditions.filter(filter_spec="width-400").exists())
+
+    def test_command_reports_savings(self):
+        image = Image.objects.create(title="Photo", file=photo_file((800, 400)))
+        out = io.StringIO()
+        command = "content.management.commands.normalise_images"
+        # the pools' workers would not see this test's transaction
+        with (
+            mock.patch(
+                f"{command}.normalise_images_in_pool",
+                side_effect=lambda ids, write, **kwargs: normalise_images(ids, write),
+            ),
+            mock.patch(
+                f"{command}.generate_renditions_in_pool",
+                side_effect=lambda ids, **kwargs: generate_renditions(ids),
+            ),
+        ):
+            call_command("normalise_images", "--dry-run", stdout=out)
+            self.assertIn("would normalise 1 originals", out.getvalue())
+            self.assertIn("saved", out.getvalue())
+            image.refresh_from_db()
+            self.assertEqual(image.width, 800)
+
+            call_command("normalise_images", stdout=out)
+        image.refresh_from_db()
+        self.assertEqual(image.width, 200)
+        self.assertTrue(image.renditions.exists())
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), RESPONSIVE_IMAGE_FORMATS=["webp"], BLOCK_CACHE_ENABLED=True
+)
+class BlockCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Site.objects.get(is_default_site=True).root_page
+
+    def make_page(self, slug, count):
+        blocks = []
+        for i in range(count):
+            image = Image.objects.create(
+                title=f"{slug} {i}", file=get_test_image_file(size=(40, 30))
+            )
+            blocks.append(("achievement", {
+                "title": f"{slug} achievement {i}",
+                "description": RichText(f"<p>Description {i}</p>"),
+                "image": image,
+            }))
+        page = self.root.add_child(
+            instance=AchievementPage(title=slug, slug=slug, achievements=blocks)
+        )
+        # render once so the renditions exist
+        render_stream(page.achievements)
+        cache.clear()
+        return AchievementPage.objects.get(id=page.id)
+
+    def render(self, page):
+        with CaptureQueriesContext(connection) as queries:
+            html = render_stream(AchievementPage.objects.get(id=page.id).achievements)
+        # the page lookup itself
+        return html, len(queries) - 1
+
+    def test_unchanged_blocks_are_cached(self):
+        page = self.make_page("cached", 3)
+        html, queries = self.render(page)
+        self.assertIn("cached achievement 2", html)
+        self.assertIn("achievement-card", html)
+        self.assertEqual(self.render(page), (html, 0))
+        self.assertContains(self.client.get(page.url), "cached achievement 0")
+
+    def test_miss_query_count_is_independent_of_block_count(self):
+        self.assertEqual(
+            self.render(self.make_page("small", 1))[1],
+            self.render(self.make_page("large", 6))[1],
+        )
+
+    def test_edited_block_is_rerendered_alone(self):
+        page = self.make_page("edited", 3)
+        self.render(page)
+
+        page.achievements[1].value["title"] = "Renamed"
+        page.save_revision().publish()
+        with mock.patch.object(
+            AchievementBlock, "render", autospec=True, side_effect=AchievementBlock.render
+        ) as render:
+            html, _ = self.render(page)
+        self.assertEqual(render.call_count, 1)
+        self.assertIn("Renamed", html)
+        self.assertNotIn("edited achievement 1", html)
+
+    def test_image_change_invalidates_blocks(self):
+        page = self.make_page("image", 1)
+        self.render(page)
+        image = Image.objects.get(title="image 0")
+        image.focal_point_x = 10
+        image.save()
+        self.assertGreater(self.render(page)[1], 0)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), PAGE_CACHE_ENABLED=False, RICHTEXT_CACHE_ENABLED=True
+)
+class RichTextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Site.objects.get(is_default_site=True).root_page
+        self.targets = [
+            self.root.add_child(instance=SimplePage(title=f"Target {i}", slug=f"target-{i}", body="<p>x</p>"))
+            for i in range(4)
+        ]
+        self.doc = Document.objects.create(title="Order", file=ContentFile(b"%PDF-1", name="order.pdf"))
+
+    def source(self, target):
+        return (
+            f'<p><a linktype="page" id="{target.id}">{target.title}</a> and '
+            f'<a linktype="document" id="{self.doc.id}">the order</a></p>'
+        )
+
+    def test_batched_and_cached(self):
+        from .richtext import expand_richtext
+
+        sources = [self.source(target) for target in self.targets]
+        expand_richtext(sources[:1])  # site root paths
+        cache.clear()
+        Site.get_site_root_paths()
+        # the pages (then their specific type) and the document, however
+        # many values link to them
+        with self.assertNumQueries(3):
+            expanded = expand_richtext(sources)
+        for source, target in zip(sources, self.targets):
+            self.assertEqual(expanded[source], expand_db_html(source))
+            self.assertIn(f'href="{target.url}"', expanded[source])
+        with self.assertNumQueries(0):
+            self.assertEqual(expand_richtext(sources), expanded)
+
+    def test_moved_target_is_expanded_again(self):
+        from .richtext import expand_richtext
+
+        source = self.source(self.targets[0])
+        expand_richtext([source])
+        self.targets[0].slug = "renamed"
+        self.targets[0].save_revision().publish()
+        self.assertIn('href="/pages/renamed/"', expand_richtext([source])[source])
+
+    def test_page_renders_expanded_richtext(self):
+        blocks = [
+            ("achievement", {"title": f"Done {i}", "description": RichText(self.source(target))})
+            for i, target in enumerate(self.targets)
+        ]
+        page = self.root.add_child(instance=AchievementPage(
+            title="Achievements", slug="achievements", intro=self.source(self.targets[0]),
+            achievements=blocks,
+        ))
+        response = self.client.get(page.url)
+        for target in self.targets:
+            self.assertContains(response, f'href="{target.url}"')
+        self.assertContains(response, f'href="{self.doc.url}"', count=len(self.targets) + 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), MEDIA_SERVE_METHOD="django")
+class DocumentServingTests(TestCase):
+    def setUp(self):
+        self.data = b"%PDF-" + bytes(range(256)) * 100
+        self.doc = Document.objects.create(
+            title="GR", file=ContentFile(self.data, name="gr.pdf")
+        )
+
+    def test_metadata_is_stored_on_save(self):
+        self.assertEqual(self.doc.file_size, len(self.data))
+        self.assertTrue(self.doc.file_hash)
+
+    def test_serve_document(self):
+        response = self.client.get(self.doc.url)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["ETag"], '"%s"' % self.doc.file_hash)
+        self.assertEqual(response["Content-Disposition"], "inline")
+
+        response = self.client.get(self.doc.url, headers={"range": "bytes=5-9"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.data[5:10])
+
+        response = self.client.get(
+            self.doc.url, headers={"if-none-match": '"%s"' % self.doc.file_hash}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_restricted_document_is_not_cached_publicly(self):
+        self.assertIn("public", self.client.get(self.doc.url)["Cache-Control"])
+
+        collection = Collection.get_first_root_node().add_child(name="Staff")
+        CollectionViewRestriction.objects.create(
+            collection=collection, restriction_type=CollectionViewRestriction.LOGIN
+        )
+        self.doc.collection = collection
+        self.doc.save()
+        self.client.force_login(User.objects.create_user("staff", password="x"))
+        response = self.client.get(self.doc.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("public", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), PAGE_CACHE_ENABLED=False, DOCUMENT_LIST_PAGE_SIZE=3
+)
+class DocumentListingTests(TestCase):
+    def setUp(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        self.page = root.add_child(instance=GRPage(title="GR", slug="gr", custom_title="GR"))
+        for i, title in enumerate(["Fees circular", "Admissions", "Fees refund", "RTE quota", "Exams"]):
+            doc = Document.objects.create(
+                title=title, file=ContentFile(b"x" * (i + 1), name=f"doc{i}.pdf")
+            )
+            GRDocument.objects.create(page=self.page, title=title, document=doc, sort_order=i)
+
+    def titles(self, response):
+        return [item.title for item in response.context["documents"]]
+
+    def test_listing_fields_are_denormalised(self):
+        row = GRDocument.objects.get(title="Admissions")
+        self.assertEqual(row.document_url, row.document.url)
+        self.assertEqual(row.file_size, 2)
+        self.assertEqual(row.file_extension, "pdf")
+        self.assertEqual(row.year, row.document.created_at.year)
+
+        row.document.file_size = 99
+        row.document.save()
+        row.refresh_from_db()
+        self.assertEqual(row.file_size, 99)
+
+    def test_filter_sort_and_paginate(self):
+        response = self.client.get(self.page.url)
+        self.assertEqual(self.titles(response), ["Fees circular", "Admissions", "Fees refund"])
+
+        response = self.client.get(self.page.url, {"page": 2})
+        self.assertEqual(self.titles(response), ["RTE quota", "Exams"])
+
+        response = self.client.get(self.page.url, {"q": "fees", "sort": "-title"})
+        self.assertEqual(self.titles(response), ["Fees refund", "Fees circular"])
+
+        year = GRDocument.objects.first().year
+        response = self.client.get(self.page.url, {"year": year + 1})
+        self.assertEqual(self.titles(response), [])
+
+        # a junk year is not a filter, but it is kept, encoded, in the links
+        response = self.client.get(self.page.url, {"year": "x&sort=title"})
+        self.assertContains(response, "&year=x%26sort%3Dtitle&")
+
+    def test_listing_does_not_query_documents(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.page.url)
+        self.assertFalse(
+            any("wagtaildocs_document" in q["sql"] for q in queries.captured_queries)
+        )
+
+    def test_indexing_does_not_query_each_preview(self):
+        for row in GRDocument.objects.all():
+            DocumentPreview.objects.create(document_id=row.document_id, text=f"Text of {row.title}")
+        with self.assertNumQueries(2):
+            texts = [
+                row.document_text
+                for page in GRPage.get_indexed_objects()
+                for row in page.gr_documents.all()
+            ]
+        self.assertIn("Text of Admissions", texts)
+
+    def test_listing_query_count(self):
+        self.client.get(self.page.url)
+        # site, page routing and restrictions, then count, rows, previews, years
+        with self.assertNumQueries(9):
+            self.client.get(self.page.url)
+
+
+class StubOEmbedHandler(BaseHTTPRequestHandler):
+    """Stand-in oEmbed provider that counts its calls."""
+
+    calls = []
+
+    def do_GET(self):
+        url = parse_qs(self.path.partition("?")[2])["url"][0]
+        self.calls.append(url)
+        body = json.dumps({
+            "type": "video",
+            "title": "Video",
+            "html": f'<iframe src="{url}/player"></iframe>',
+            "width": 640,
+            "height": 360,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+    PAGE_CACHE_ENABLED=False,
+)
+class EmbedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOEmbedHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.finders = override_settings(WAGTAILEMBEDS_FINDERS=[{
+            "class": "wagtail.embeds.finders.oembed",
+            "providers": [{
+                "endpoint": "http://127.0.0.1:%s/oembed" % cls.server.server_port,
+                "urls": [r"^https://video\.example/"],
+            }],
+        }])
+        cls.finders.enable()
+        get_finders.cache_clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.finders.disable()
+        get_finders.cache_clear()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubOEmbedHandler.calls = []
+        self.root = Site.objects.get(is_default_site=True).root_page
+
+    def add_page(self, slug, *urls):
+        blocks = [
+            ("media", {
+                "title": f"Video {i}",
+                "video_embed": RichText(f'<embed embedtype="media" url="{url}"/>'),
+            })
+            for i, url in enumerate(urls)
+        ]
+        page = MediaUpdatesPage(title=slug, slug=slug, media_updates=blocks, live=False)
+        self.root.add_child(instance=page)
+        return page
+
+    def test_rendering_never_fetches(self):
+        page = self.add_page("cold", "https://video.example/1")
+        page.save_revision()
+        MediaUpdatesPage.objects.filter(id=page.id).update(live=True)
+        response = self.client.get(page.url)
+        self.assertContains(response, "embed-placeholder")
+        self.assertEqual(StubOEmbedHandler.calls, [])
+
+    def test_publish_resolves_embeds(self):
+        page = self.add_page("published", "https://video.example/1")
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save_revision().publish()
+        self.assertEqual(StubOEmbedHandler.calls, ["https://video.example/1"])
+
+        response = self.client.get(page.url)
+        self.assertContains(response, 'src="https://video.example/1/player"')
+        self.assertNotContains(response, "embed-placeholder")
+
+        # already stored: the next publish does not call the provider
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save_revision().publish()
+        self.assertEqual(len(StubOEmbedHandler.calls), 1)
+
+    @override_settings(BLOCK_CACHE_ENABLED=True, RICHTEXT_CACHE_ENABLED=True)
+    def test_placeholders_are_not_cached(self):
+        page = self.add_page("late", "https://video.example/1")
+        page.save_revision()
+        MediaUpdatesPage.objects.filter(id=page.id).update(live=True)
+        self.assertContains(self.client.get(page.url), "embed-placeholder")
+
+        # stored by another process: nothing is purged here
+        resolve_embeds(["https://video.example/1"], workers=1)
+        response = self.client.get(page.url)
+        self.assertContains(response, 'src="https://video.example/1/player"')
+        self.assertNotContains(response, "embed-placeholder")
+
+    def test_resolve_command_is_rate_limited(self):
+        urls = [f"https://video.example/{i}" for i in range(4)]
+        page = self.add_page("bulk", *urls[:2])
+        page.save_revision()
+        other = self.add_page("other", *urls[2:])
+        other.save_revision()
+        Page.objects.filter(id__in=[page.id, other.id]).update(live=True)
+
+        started = time.monotonic()
+        call_command("resolve_embeds", workers=4, rate=20, stdout=io.StringIO())
+        self.assertGreaterEqual(time.monotonic() - started, 3 / 20)
+        self.assertEqual(sorted(StubOEmbedHandler.calls), urls)
+
+        call_command("resolve_embeds", stdout=io.StringIO())
+        self.assertEqual(len(StubOEmbedHandler.calls), 4)
+        call_command("resolve_embeds", refresh=True, rate=0, stdout=io.StringIO())
+        self.assertEqual(len(StubOEmbedHandler.calls), 8)
+
+
+class ContentTransferTests(TestCase):
+    def setUp(self):
+        self.root = Site.objects.get(is_default_site=True).root_page
+
+    def test_iter_json_array_reads_across_chunks(self):
+        items = [{"model": "content.simplepage", "pk": i, "fields": {"body": "[]" * i}}
+                 for i in range(20)]
+        text = json.dumps(items, indent=2)
+        for chunk_size in (1, 7, 1024 * 1024):
+            self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size)), items)
+        self.assertEqual(list(iter_json_array(io.StringIO("[]"))), [])
+
+    def test_round_trip(self):
+        gallery = self.root.add_child(
+            instance=PhotoGalleryIndexPage(title="Gallery", slug="gallery")
+        )
+        for slug in ("first", "second"):
+            gallery.add_child(instance=PhotoGalleryEventPage(title=slug, slug=slug))
+        achievements = self.root.add_child(instance=AchievementPage(
+            title="Achievements", slug="achievements",
+            achievements=[("achievement", {
+                "title": "Award", "description": RichText("<p>Won</p>"), "image": None,
+            })],
+        ))
+
+        out = io.StringIO()
+        counts = export_objects(out, resolve_models(["wagtailcore.page", "content"]), batch_size=2)
+        self.assertEqual(counts["content.photogalleryeventpage"], 2)
+
+        Page.objects.filter(id__in=[gallery.id, achievements.id]).delete()
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.numchild, 0)
+
+        out.seek(0)
+        counts = import_objects(iter_json_array(out), batch_size=2)
+        self.assertEqual(counts["content.achievementpage"], 1)
+
+        self.assertEqual(Page.find_problems(), ([], [], [], [], []))
+        restored = AchievementPage.objects.get(id=achievements.id)
+        self.assertEqual(restored.achievements[0].value["title"], "Award")
+        self.assertEqual(
+            [page.slug for page in PhotoGalleryIndexPage.objects.get().get_children()],
+            ["first", "second"],
+        )
+        self.assertEqual(Page.objects.get(id=self.root.id).numchild, 2)
+
+
+@override_settings(
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+    SEARCH_PAGE_SIZE=2,
+    MEDIA_ROOT=tempfile.mkdtemp(),
+)
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Site.objects.get(is_default_site=True).root_page
+
+    def publish(self, page):
+        # wagtail indexes in a task enqueued when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save_revision().publish()
+        return page
+
+    def test_indexes_blocks_documents_and_captions_on_publish(self):
+        achievements = self.root.add_child(instance=AchievementPage(
+            title="Achievements", slug="achievements",
+            achievements=[("achievement", {
+                "title": "Fee regulation", "description": RichText("<p>Tribunal</p>"),
+                "image": None,
+            })],
+            live=False,
+        ))
+        gr = self.root.add_child(
+            instance=GRPage(title="GR", slug="gr", custom_title="GR", live=False)
+        )
+        document = Document.objects.create(title="doc", file=ContentFile(b"%PDF", "gr.pdf"))
+        gr.gr_documents.add(GRDocument(title="Admission circular", document=document))
+        gallery = self.root.add_child(
+            instance=PhotoGalleryIndexPage(title="Gallery", slug="gallery")
+        )
+        event = gallery.add_child(
+            instance=PhotoGalleryEventPage(title="Meet", slug="meet", live=False)
+        )
+        image = Image.objects.create(title="photo", file=get_test_image_file())
+        event.gallery_images.add(PhotoGalleryImage(image=image, caption="Parents rally"))
+        for page in (achievements, gr, event):
+            self.publish(page)
+
+        for query, page in [("tribunal", achievements), ("circular", gr), ("rally", event)]:
+            response = self.client.get(reverse("search"), {"q": query})
+            self.assertEqual(
+                [result.id for result in response.context["search_results"]], [page.id]
+            )
+            self.assertIn("search;dur=", response["Server-Timing"])
+        self.assertContains(response, event.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PhotoGalleryEventPage.objects.get(id=event.id).unpublish()
+        response = self.client.get(reverse("search"), {"q": "rally"})
+        self.assertEqual(list(response.context["search_results"]), [])
+
+    def test_pagination_and_stats(self):
+        reset_search_stats()
+        for i in range(3):
+            self.root.add_child(instance=SimplePage(
+                title=f"Notice {i}", slug=f"notice-{i}", body="<p>Scholarship</p>",
+            ))
+        call_command("reindex_search", "--now", stdout=io.StringIO())
+
+        first = self.client.get(reverse("search"), {"q": "scholarship"})
+        second = self.client.get(reverse("search"), {"q": "scholarship", "page": 2})
+        self.assertEqual(len(first.context["search_results"]), 2)
+        self.assertEqual(len(second.context["search_results"]), 1)
+        self.assertContains(first, "Page 1 of 2")
+
+        stats = search_stats()
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(sum(stats["buckets"].values()), 2)
+        self.assertIsNotNone(stats["p95_ms"])
+
+        # an empty query does not touch the index
+        self.assertNotIn("Server-Timing", self.client.get(reverse("search")))
+
+
+# a one-page PDF whose only text is "Fee refund order"
+MINIMAL_PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 200 200]"
+    b"/Contents 4 0 R/Resources<</Font<</F1 5 0 R>>>>>>endobj\n"
+    b"4 0 obj<</Length 47>>stream\nBT /F1 12 Tf 10 100 Td (Fee refund order) Tj ET\nendstream endobj\n"
+    b"5 0 obj<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+    PAGE_CACHE_ENABLED=False,
+)
+class DocumentPreviewTests(TestCase):
+    def setUp(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        self.page = root.add_child(instance=GRPage(title="GR", slug="gr", custom_title="GR"))
+        self.doc = Document.objects.create(title="Order", file=ContentFile(b"%PDF-1", name="order.pdf"))
+        GRDocument.objects.create(page=self.page, title="Order", document=self.doc)
+        patches = [
+            mock.patch("content.previews.previews_available", return_value=True),
+            mock.patch("content.previews.extract_text", return_value=(3, "Fee refund order")),
+            mock.patch("content.previews.render_thumbnail", return_value=b"jpeg"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_previews_are_idempotent_and_follow_the_file(self):
+        self.assertEqual(generate_previews([self.doc.id]), (1, []))
+        self.assertEqual(generate_previews([self.doc.id]), (0, []))
+        self.assertFalse(pending_documents().exists())
+
+        preview = DocumentPreview.objects.get(document=self.doc)
+        self.assertEqual(preview.page_count, 3)
+        self.assertEqual(preview.thumbnail.read(), b"jpeg")
+
+        self.doc.file = ContentFile(b"%PDF-2", name="order.pdf")
+        self.doc.file_hash = ""
+        self.doc.save()
+        self.assertEqual(list(pending_documents()), [self.doc])
+        # a thumbnail with the same content would share the old file
+        with mock.patch("content.previews.render_thumbnail", return_value=b"jpeg 2"):
+            self.assertEqual(generate_previews([self.doc.id]), (1, []))
+        self.assertFalse(preview.thumbnail.storage.exists(preview.thumbnail.name))
+
+    def test_listing_shows_preview_and_search_finds_text(self):
+        generate_previews([self.doc.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.page.url)
+        self.assertContains(response, "3 pages")
+        self.assertContains(response, "Fee refund order")
+        self.assertContains(response, DocumentPreview.objects.get().thumbnail.url)
+        self.assertFalse(
+            any("wagtaildocs_document" in q["sql"] for q in queries.captured_queries)
+        )
+
+        self.page.save_revision().publish()
+        response = self.client.get(reverse("search"), {"q": "refund"})
+        self.assertEqual([page.id for page in response.context["search_results"]], [self.page.id])
+
+    def test_failures_are_recorded_and_retried_on_request(self):
+        with mock.patch("content.previews.extract_text", side_effect=ValueError("encrypted")):
+            created, errors = generate_previews([self.doc.id])
+        self.assertEqual((created, errors[0][0]), (0, self.doc.id))
+        self.assertIn("encrypted", DocumentPreview.objects.get().error)
+        self.assertFalse(pending_documents().exists())
+        self.assertEqual(list(pending_documents(retry_failed=True)), [self.doc])
+
+    def test_upload_enqueues_preview(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doc = Document.objects.create(title="New", file=ContentFile(b"%PDF-3", name="new.pdf"))
+        self.assertEqual(DocumentPreview.objects.get(document=doc).excerpt, "Fee refund order")
+
+
+@skipUnless(pypdf, "pypdf is not installed")
+class PDFTextTests(SimpleTestCase):
+    def test_extract_text(self):
+        from .previews import extract_text
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+            f.write(MINIMAL_PDF)
+            f.flush()
+            self.assertEqual(extract_text(f.name), (1, "Fee refund order"))
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    TASKS={"default": {"BACKEND": "django_tasks.backends.dummy.DummyBackend"}},
+)
+class SeedTests(TestCase):
+    def test_every_seeded_page_serves(self):
+        from .seed import delete_seeded, seed_site, seeded_pages
+
+        pages = seed_site("small")
+        self.assertEqual(GRDocument.objects.filter(page=pages["gr"]).count(), 10)
+        self.assertEqual(PhotoGalleryImage.objects.filter(page=pages["gallery_event"]).count(), 10)
+        self.assertEqual(seeded_pages("small"), pages)
+        for label, page in pages.items():
+            with self.subTest(label):
+                self.assertEqual(self.client.get(page.url).status_code, 200)
+
+        seed_site("small")  # replaces the first run
+        self.assertEqual(Image.objects.filter(collection__name="Benchmark (small)").count(), 10)
+        delete_seeded("small")
+        self.assertIsNone(seeded_pages("small"))
+        self.assertFalse(Document.objects.exists())
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, ASYNC_THREAD_POOLS={"default": 2, "contact": 1})
+class AsyncServingTests(TransactionTestCase):
+    # the pool threads have their own database connections, so the data
+    # must be committed; restore the migrated pages afterwards
+    serialized_rollback = True
+
+    def setUp(self):
+        shutdown_pools()
+        self.addCleanup(shutdown_pools)
+
+    def test_run_sync_is_bounded(self):
+        def thread_name():
+            time.sleep(0.01)
+            return threading.current_thread().name
+
+        async def run():
+            return await asyncio.gather(*(run_sync("default", thread_name) for _ in range(6)))
+
+        names = set(async_to_sync(run)())
+        self.assertLessEqual(len(names), 2)
+        self.assertTrue(all(name.startswith("async-default") for name in names))
+
+    def test_serve_page(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        root.add_child(instance=SimplePage(title="About us", slug="about", body="<p>Hi</p>"))
+        request = RequestFactory().get("/pages/about/")
+        request.user = AnonymousUser()
+
+        response = async_to_sync(serve_page)(request, "about/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_rendered)
+        self.assertContains(response, "About us")
+
+        request = RequestFactory().get("/pages/missing/")
+        request.user = AnonymousUser()
+        with self.assertRaises(Http404):
+            async_to_sync(serve_page)(request, "missing/")
+
+
+@override_settings(
+    SNAPSHOT_ROOT=tempfile.mkdtemp(),
+    SNAPSHOT_ON_PUBLISH=True,
+    PAGE_CACHE_ENABLED=False,
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        self.gallery = root.add_child(
+            instance=PhotoGalleryIndexPage(title="Gallery", slug="gallery")
+        )
+        self.event = self.gallery.add_child(
+            instance=PhotoGalleryEventPage(title="Annual meet", slug="annual-meet")
+        )
+        self.other = root.add_child(instance=SimplePage(title="About", slug="about", body="<p>About us</p>"))
+        from .snapshot import snapshot_site
+
+        self.build, self.results, self.errors = snapshot_site(workers=0)
+
+    def output(self, page):
+        from .snapshot import current_build, output_path, page_target
+
+        hostname, path, _ = page_target(page)
+        return output_path(current_build(), hostname, path)
+
+    def test_site_snapshot(self):
+        from .snapshot import current_build
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(current_build(), self.build.resolve())
+        self.assertIn("Annual meet", self.output(self.gallery).read_text())
+        self.assertTrue((self.build / "localhost" / "index.html").exists())
+
+    def test_unshareable_pages_are_left_out(self):
+        from .snapshot import render_targets, snapshot_targets
+
+        with mock.patch("content.snapshot.is_shareable", return_value=False):
+            results, _ = render_targets(snapshot_targets([self.other]), self.build)
+        self.assertTrue(results[0]["skipped"])
+
+    def test_publish_refreshes_page_and_listing(self):
+        about = self.output(self.other)
+        about_mtime = about.stat().st_mtime_ns
+
+        self.event.title = "Annual meet 2026"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.save_revision().publish()
+        self.assertIn("Annual meet 2026", self.output(self.event).read_text())
+        self.assertIn("Annual meet 2026", self.output(self.gallery).read_text())
+        self.assertEqual(about.stat().st_mtime_ns, about_mtime)
+
+        event_file = self.output(self.event)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.delete()
+        self.assertFalse(event_file.exists())
+        self.assertNotIn("Annual meet", self.output(self.gallery).read_text())
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_document_change_refreshes_listing(self):
+        root = Site.objects.get(is_default_site=True).root_page
+        page = root.add_child(instance=GRPage(title="GR", slug="gr", custom_title="GR"))
+        doc = Document.objects.create(title="Circular", file=ContentFile(b"x", name="gr.pdf"))
+        GRDocument.objects.create(page=page, title="Circular", document=doc)
+        from .snapshot import refresh_snapshot
+
+        refresh_snapshot([page.id])
+        self.assertIn("1\xa0byte", self.output(page).read_text())
+
+        doc.file_size = 2048
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.save()
+        self.assertIn("2.0\xa0KB", self.output(page).read_text())
+
+    @override_settings(
+        PAGE_CACHE_ENABLED=True,
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    def test_snapshot_bypasses_page_cache(self):
+        from .snapshot import refresh_snapshot
+
+        self.client.get(self.other.url)
+        # changed without a purge, as another process's stale copy would be
+        SimplePage.objects.filter(id=self.other.id).update(body="<p>Changed</p>")
+        refresh_snapshot([self.other.id])
+        self.assertIn("Changed", self.output(self.other).read_text())
@@ -1,3 +1,144 @@
-from django.shortcuts import render
+import os
 
-# Create your views here.
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_POST, require_safe
+from wagtail import hooks
+from wagtail.documents.models import Document, document_served
+from wagtail.documents.views.serve import serve as wagtail_serve_document
+from wagtail.views import serve as wagtail_serve
+
+from core.concurrency import run_sync
+from core.files import file_response
+
+from .gallery import paginate_events, paginate_images
+from .models import ContactPage, PhotoGalleryEventPage, PhotoGalleryIndexPage
+from .search import search_pages
+
+
+@require_POST
+async def contact_submit(request, page_id):
+    """
+    Async endpoint for the contact form's AJAX post, so waiting on the
+    reCAPTCHA verifier does not tie up a worker under ASGI.
+    """
+    try:
+        page = await ContactPage.objects.live().aget(id=page_id)
+    except ContactPage.DoesNotExist:
+        raise Http404
+    return await page.aserve(request)
+
+
+def _serve_page(request, path):
+    response = wagtail_serve(request, path)
+    if hasattr(response, "render"):
+        # render here, in the pool, rather than in a thread of its own
+        response.render()
+    return response
+
+
+async def serve_page(request, path):
+    """
+    Wagtail's page view for ASYNC_VIEWS. Routing, the page cache and
+    rendering all block, so they run together in the default pool (see
+    core/concurrency.py).
+    """
+    return await run_sync("default", _serve_page, request, path)
+
+
+def _cursor_args(request):
+    size = request.GET.get("size", "")
+    return {
+        "after": request.GET.get("after") or None,
+        "size": int(size) if size.isdigit() else None,
+    }
+
+
+def gallery_images(request, page_id):
+    """Next batch of an event's photos for infinite scrolling."""
+    # no view restriction checks here, so restricted events are not served
+    event = get_object_or_404(PhotoGalleryEventPage.objects.live().public(), id=page_id)
+    args = _cursor_args(request)
+    after = args.pop("after")
+    if after is not None and not after.isdigit():
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    return JsonResponse(
+        paginate_images(event, after=int(after) if after else None, **args)
+    )
+
+
+def gallery_events(request, page_id):
+    """Next batch of a gallery index page's events for infinite scrolling."""
+    index = get_object_or_404(PhotoGalleryIndexPage.objects.live().public(), id=page_id)
+    return JsonResponse(paginate_events(index, request=request, **_cursor_args(request)))
+
+
+@require_safe
+def search(request):
+    """Site search results, ``?q=`` and ``?page=``."""
+    query = request.GET.get("q", "").strip()
+    results, elapsed_ms = search_pages(query, request.GET.get("page")) if query else (None, 0)
+    response = render(request, "content/search.html", {
+        "search_query": query,
+        "search_results": results,
+    })
+    if query:
+        response["Server-Timing"] = "search;dur=%.1f" % elapsed_ms
+    return response
+
+
+@require_safe
+def serve_document(request, document_id, document_filename):
+    """
+    Replacement for wagtail.documents' serve view (same URL, same privacy
+    hooks and ``document_served`` signal) built on core.files: streams in
+    large chunks, honours Range and conditional headers and can hand the
+    transfer to the front proxy. The ETag is the content hash stored at
+    upload, so validating a cached copy never reads the file.
+    """
+    doc = get_object_or_404(Document, id=document_id)
+    if doc.filename != document_filename:
+        raise Http404("This document does not match the given filename.")
+
+    etag = '"%s"' % doc.file_hash if doc.file_hash else None
+    if etag:
+        # like wagtail's view, a matching validator is answered before the
+        # privacy hooks run: a 304 reveals nothing
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    for fn in hooks.get_hooks("before_serve_document"):
+        result = fn(doc, request)
+        if isinstance(result, HttpResponse):
+            return result
+
+    try:
+        local_path = doc.file.path
+    except NotImplementedError:
+        # remote storage: let wagtail redirect or proxy it
+        return wagtail_serve_document(request, document_id, document_filename)
+    if not os.path.isfile(local_path):
+        raise Http404
+
+    document_served.send(sender=Document, instance=doc, request=request)
+
+    response = file_response(
+        request,
+        local_path,
+        accel_url=settings.MEDIA_ACCEL_REDIRECT_PREFIX + doc.file.name,
+        etag=etag,
+        content_type=doc.content_type,
+        # documents can be replaced under the same name
+        max_age=settings.DOCUMENT_CACHE_MAX_AGE,
+        # a proxy must not hand a restricted document to anyone else
+        private=doc.collection.get_view_restrictions().exists(),
+    )
+    if 200 <= response.status_code < 300:
+        response["Content-Disposition"] = doc.content_disposition
+    if getattr(settings, "WAGTAILDOCS_BLOCK_EMBEDDED_CONTENT", True):
+        response["Content-Security-Policy"] = "default-src 'none'"
+    response["X-Content-Type-Options"] = "nosniff"
+    return response
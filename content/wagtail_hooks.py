@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html
+from wagtail import hooks
+
+from core.metrics import set_view
+
+from .embeds import StoredMediaEmbedHandler
+
+
+@hooks.register("insert_global_admin_css")
+def admin_custom_css():
+    # through staticfiles_storage, so the admin gets the hashed, compressed
+    # copy like every other asset
+    if not settings.WAGTAIL_ADMIN_CUSTOM_CSS:
+        return ""
+    return format_html(
+        '<link rel="stylesheet" href="{}">', static(settings.WAGTAIL_ADMIN_CUSTOM_CSS)
+    )
+
+
+# after wagtail.embeds, whose handler this replaces
+@hooks.register("register_rich_text_features", order=100)
+def register_stored_embed_handler(features):
+    features.register_embed_type(StoredMediaEmbedHandler)
+
+
+@hooks.register("before_serve_page")
+def label_request_metrics(page, request, serve_args, serve_kwargs):
+    # e.g. "content.GRPage", rather than wagtail's catch-all serve view
+    set_view(page._meta.label)
@@ -0,0 +1,148 @@
+"""
+Small helpers shared by the benchmark management commands.
+"""
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = round(pct / 100 * (len(values) - 1))
+    return values[index]
+
+
+def run_concurrent(fn, requests, concurrency):
+    """
+    Call ``fn()`` ``requests`` times from ``concurrency`` threads. Returns the
+    per-call latencies in seconds and the wall-clock time of the whole run.
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def call(_):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    return latencies, time.perf_counter() - started
+
+
+def summarize(latencies, wall_time):
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / wall_time if wall_time else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label:28} {summary['requests']:>5} req  {summary['rps']:8.1f} req/s  "
+        f"mean {summary['mean_ms']:8.1f}ms  p50 {summary['p50_ms']:8.1f}ms  "
+        f"p99 {summary['p99_ms']:8.1f}ms"
+    )
+
+
+def measure(fn, requests, warmup=2):
+    """
+    Latency percentiles of ``requests`` sequential calls of ``fn()``, the SQL
+    queries of one call and the peak Python memory allocated by one call.
+    """
+    from django.db import connection
+
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        fn()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "queries": len(queries),
+        "peak_kb": round(peak / 1024),
+    }
+
+
+def regressions(results, baseline, tolerance, min_ms=5.0, min_kb=64):
+    """
+    Differences between ``results`` and ``baseline`` (both ``{label: measure()}``)
+    that count as regressions: any extra query, or latency or memory more than
+    ``tolerance`` (a fraction) above the baseline. Differences below
+    ``min_ms`` / ``min_kb`` are noise and ignored.
+    """
+    found = []
+    for label, result in results.items():
+        expected = baseline.get(label)
+        if expected is None:
+            continue
+        if result["queries"] > expected["queries"]:
+            found.append(f"{label}: {result['queries']} queries, baseline {expected['queries']}")
+        limit = expected["p50_ms"] * (1 + tolerance)
+        if result["p50_ms"] > limit and result["p50_ms"] - expected["p50_ms"] > min_ms:
+            found.append(f"{label}: p50 {result['p50_ms']}ms, baseline {expected['p50_ms']}ms")
+        limit = expected["peak_kb"] * (1 + tolerance)
+        if result["peak_kb"] > limit and result["peak_kb"] - expected["peak_kb"] > min_kb:
+            found.append(f"{label}: peak {result['peak_kb']}KB, baseline {expected['peak_kb']}KB")
+    return found
+
+
+class StubSiteverifyHandler(BaseHTTPRequestHandler):
+    """Local stand-in for reCAPTCHA's siteverify: every token passes."""
+
+    delay = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.delay)
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_siteverify_stub(delay=0.0):
+    """
+    Serve ``StubSiteverifyHandler`` on a free local port, answering after
+    ``delay`` seconds. Returns ``(server, url)``; call ``server.shutdown()``.
+    """
+    handler = type("StubSiteverify", (StubSiteverifyHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/siteverify"
@@ -0,0 +1,112 @@
+"""
+System checks for settings that only work in a single process.
+
+locmem and file caches are per process (file caches per machine), so
+anything relying on every process seeing the same cache entries gives
+stale or partial results once the site runs in several: WEB_CONCURRENCY
+web workers, or a task worker next to the web process.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, Warning, register
+
+# task backends that run tasks in the process enqueueing them
+IN_PROCESS_TASK_BACKENDS = (
+    "django_tasks.backends.immediate.ImmediateBackend",
+    "django_tasks.backends.dummy.DummyBackend",
+)
+
+
+def cache_is_shared(alias):
+    return not isinstance(caches[alias], (LocMemCache, FileBasedCache))
+
+
+def runs_in_several_processes():
+    task_backend = settings.TASKS["default"]["BACKEND"]
+    return settings.WEB_CONCURRENCY > 1 or task_backend not in IN_PROCESS_TASK_BACKENDS
+
+
+@register(Tags.caches)
+def check_page_cache(app_configs, **kwargs):
+    if (
+        settings.PAGE_CACHE_ENABLED
+        and runs_in_several_processes()
+        and not cache_is_shared(settings.PAGE_CACHE_ALIAS)
+    ):
+        return [
+            Error(
+                "PAGE_CACHE_ENABLED needs a cache shared by every process.",
+                hint=(
+                    "Pages purged in one process would keep being served, and "
+                    "answered with 304, by the others. Set CACHE_BACKEND=redis, "
+                    "or PAGE_CACHE_ENABLED=False."
+                ),
+                id="core.E001",
+            )
+        ]
+    return []
+
+
+@register(Tags.caches)
+def check_block_cache(app_configs, **kwargs):
+    if (
+        settings.BLOCK_CACHE_ENABLED
+        and runs_in_several_processes()
+        and not cache_is_shared(settings.PAGE_CACHE_ALIAS)
+    ):
+        return [
+            Error(
+                "BLOCK_CACHE_ENABLED needs a cache shared by every process.",
+                hint=(
+                    "Image saves and embed resolution only purge blocks in the "
+                    "process they happen in, so the others keep rendering stale "
+                    "blocks. Set CACHE_BACKEND=redis, or BLOCK_CACHE_ENABLED=False."
+                ),
+                id="core.E002",
+            )
+        ]
+    return []
+
+
+@register(Tags.caches)
+def check_richtext_cache(app_configs, **kwargs):
+    if (
+        settings.RICHTEXT_CACHE_ENABLED
+        and runs_in_several_processes()
+        and not cache_is_shared(settings.PAGE_CACHE_ALIAS)
+    ):
+        return [
+            Error(
+                "RICHTEXT_CACHE_ENABLED needs a cache shared by every process.",
+                hint=(
+                    "Links to pages and documents are only purged in the process "
+                    "that moved or unpublished them, so the others keep stale "
+                    "links. Set CACHE_BACKEND=redis, or RICHTEXT_CACHE_ENABLED=False."
+                ),
+                id="core.E003",
+            )
+        ]
+    return []
+
+
+@register(Tags.caches)
+def check_metrics_cache(app_configs, **kwargs):
+    if (
+        settings.METRICS_ENABLED
+        and settings.WEB_CONCURRENCY > 1
+        and not cache_is_shared(settings.METRICS_CACHE_ALIAS)
+    ):
+        return [
+            Warning(
+                "METRICS_ENABLED with WEB_CONCURRENCY > 1 needs a cache shared by "
+                "the workers.",
+                hint=(
+                    "Each worker only flushes its totals to its own cache, so /metrics "
+                    "shows whichever worker answers the scrape. Set CACHE_BACKEND=redis."
+                ),
+                id="core.W001",
+            )
+        ]
+    return []
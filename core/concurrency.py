@@ -0,0 +1,65 @@
+"""
+Bounded thread pools for the blocking work of async views.
+
+Under ASGI Django runs every ``sync_to_async`` call of a request in a thread
+of its own, and each such thread opens its own database connection, so a
+burst of requests means a burst of threads and connections. The async views
+(``ASYNC_VIEWS``) instead hand their blocking work - routing, the ORM,
+rendering - to the named pools in ``ASYNC_THREAD_POOLS``, which cap both.
+Each call releases its thread's connection when it is done (to the psycopg
+pool, or kept for ``CONN_MAX_AGE``) exactly as the end of a request would.
+
+Separate pools keep one kind of work from starving another: contact form
+submissions have their own, so a burst of them cannot hold up page views.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.db import close_old_connections
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool(name):
+    pool = _pools.get(name)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_THREAD_POOLS[name],
+                    thread_name_prefix=f"async-{name}",
+                )
+                _pools[name] = pool
+    return pool
+
+
+def shutdown_pools():
+    """Stop the pools, e.g. after overriding their sizes in tests."""
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+
+def _releasing_connections(fn):
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # what the request_finished handler does for a sync view
+            close_old_connections()
+    return call
+
+
+async def run_sync(pool, fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` in the ``pool`` thread pool and await it."""
+    call = SyncToAsync(
+        _releasing_connections(fn), thread_sensitive=False, executor=get_pool(pool)
+    )
+    return await call(*args, **kwargs)
@@ -0,0 +1,184 @@
+"""
+Efficient file responses for media and documents.
+
+``file_response`` either hands the transfer to the front proxy
+(``X-Accel-Redirect`` for nginx, ``X-Sendfile`` for Apache/lighttpd) or
+returns a ``FileResponse`` whose file object the WSGI server can send with
+``sendfile()``. Either way the response carries ETag/Last-Modified
+validators, answers conditional requests with 304/412 and single byte
+ranges with 206.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ChunkedFileResponse(FileResponse):
+    # FileResponse streams in 4 KiB reads by default; large PDFs need far
+    # fewer syscalls and Python iterations with bigger chunks
+    block_size = 64 * 1024
+
+
+class FileRange:
+    """
+    Read-only view of ``length`` bytes of an open file starting at ``start``.
+
+    It exposes ``fileno()`` so servers that use ``sendfile()`` for
+    ``wsgi.file_wrapper`` (gunicorn) still send the slice without copying:
+    they start at the current offset and stop after Content-Length bytes.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def make_etag(size, mtime):
+    return '"%x-%x"' % (int(mtime), size)
+
+
+def parse_range(header, size):
+    """
+    Returns ``(start, end)`` (inclusive) for a single satisfiable byte range,
+    ``None`` to ignore the header (multiple ranges, bad syntax) and raises
+    ``ValueError`` if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _offload_response(method, path, url):
+    response = HttpResponse()
+    if method == "x-accel-redirect":
+        response["X-Accel-Redirect"] = quote(url)
+    else:
+        response["X-Sendfile"] = path
+    # let the proxy fill these in from the file
+    del response["Content-Type"]
+    return response
+
+
+def file_response(
+    request,
+    path,
+    *,
+    accel_url=None,
+    etag=None,
+    content_type=None,
+    immutable=False,
+    max_age=None,
+    private=False,
+    method=None,
+):
+    """
+    Serve the file at ``path`` (an absolute filesystem path).
+
+    ``accel_url`` is the internal location the front proxy maps to the file
+    for ``X-Accel-Redirect``. A precomputed ``etag`` (e.g. a stored content
+    hash) avoids relying on mtime. ``immutable`` marks files whose name
+    changes whenever their content does, such as image renditions.
+    ``private`` files are never stored by shared caches, and browsers
+    revalidate them on every use.
+    """
+    method = method or settings.MEDIA_SERVE_METHOD
+    stat = os.stat(path)
+    etag = etag or make_etag(stat.st_size, stat.st_mtime)
+    last_modified = int(stat.st_mtime)
+
+    def finish(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        if private:
+            patch_cache_control(response, private=True, no_cache=True)
+        elif immutable:
+            patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+        else:
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=settings.MEDIA_CACHE_MAX_AGE if max_age is None else max_age,
+            )
+        return response
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if conditional is not None:
+        return finish(conditional)
+
+    if method in ("x-accel-redirect", "x-sendfile"):
+        # the proxy handles Range and sends the bytes
+        return finish(_offload_response(method, path, accel_url))
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.method == "GET" and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%d" % size
+            return finish(response)
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    file = open(path, "rb")
+    if byte_range is None:
+        response = ChunkedFileResponse(file, content_type=content_type)
+        response["Content-Length"] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = ChunkedFileResponse(
+            FileRange(file, start, length), status=206, content_type=content_type
+        )
+        response["Content-Length"] = length
+        response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+    response["Accept-Ranges"] = "bytes"
+    return finish(response)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
@@ -0,0 +1,75 @@
+import copy
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.utils import ConnectionHandler
+
+from core.bench import format_summary, run_concurrent, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request latency with a new database connection per request, "
+        "persistent connections and the psycopg 3 pool, against the configured "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--queries", type=int, default=5, help="Queries per simulated request."
+        )
+
+    def handle(self, *args, **options):
+        base = copy.deepcopy(settings.DATABASES["default"])
+        base["OPTIONS"].pop("pool", None)
+        base.setdefault("TIME_ZONE", None)
+        base.setdefault("AUTOCOMMIT", True)
+        base.setdefault("ATOMIC_REQUESTS", False)
+
+        modes = [
+            ("new connection per request", {"CONN_MAX_AGE": 0}),
+            ("persistent connections", {"CONN_MAX_AGE": 600}),
+        ]
+        if base["ENGINE"] == "django.db.backends.postgresql":
+            modes.append((
+                "psycopg pool",
+                {
+                    "CONN_MAX_AGE": 0,
+                    "OPTIONS": dict(
+                        base["OPTIONS"],
+                        pool={"min_size": options["concurrency"],
+                              "max_size": options["concurrency"]},
+                    ),
+                },
+            ))
+        else:
+            self.stdout.write("connection pooling needs PostgreSQL; skipping the pool run")
+
+        for index, (label, overrides) in enumerate(modes):
+            alias = f"bench_{index}"
+            database = dict(base, **overrides)
+            connections = ConnectionHandler({"default": database, alias: database})
+
+            def request():
+                connection = connections[alias]
+                with connection.cursor() as cursor:
+                    for _ in range(options["queries"]):
+                        cursor.execute("SELECT 1")
+                        cursor.fetchone()
+                # what Django's request_finished handler does
+                connection.close_if_unusable_or_obsolete()
+
+            # warm up (fills the pool / opens persistent connections)
+            run_concurrent(request, options["concurrency"], options["concurrency"])
+            latencies, wall_time = run_concurrent(
+                request, options["requests"], options["concurrency"]
+            )
+            self.stdout.write(format_summary(label, summarize(latencies, wall_time)))
+
+            # per-thread connections are closed when the worker threads exit
+            connection = connections[alias]
+            connection.close()
+            if hasattr(connection, "close_pool"):
+                connection.close_pool()
@@ -0,0 +1,400 @@
+"""
+Per-request performance metrics.
+
+``MetricsMiddleware`` keeps a ``RequestMetrics`` in a context variable for
+the duration of each request, and whatever spends time on its behalf adds
+to it:
+
+- SQL: an execute wrapper on every database connection (count and time,
+  plus the statements themselves for the slow-request log);
+- templates: Django's ``Template.render``, counting only the outermost
+  render so includes are not counted twice;
+- renditions: wagtail's ``create_rendition(s)``;
+- outbound HTTP: ``timed("http")`` around calls such as the reCAPTCHA check.
+
+These overlap (a rendition is usually generated while a template renders).
+When the response is ready the numbers are labelled with the page type, or
+the URL name for other views, and
+
+- added to per-process totals that are flushed to the cache every
+  ``METRICS_FLUSH_INTERVAL`` seconds, so ``/metrics`` can serve the sum over
+  all worker processes in the Prometheus text format. That needs a cache
+  shared by the workers (redis): with locmem each process only has its own
+  totals, and the one answering a scrape is arbitrary (see core/checks.py);
+- logged as one JSON object on the ``core.metrics`` logger (at INFO);
+- for requests slower than ``SLOW_REQUEST_MS``, logged again at WARNING
+  with their slowest statements.
+"""
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+TIMERS = ("db", "template", "rendition", "http")
+# upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = [0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SERIES_KEY = "metrics:series"
+# seconds are accumulated as integer microseconds, since cache.incr only
+# takes integers
+MICROSECONDS = 1_000_000
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = None
+        self.view = None
+        self.seconds = dict.fromkeys(TIMERS, 0.0)
+        self.db_queries = 0
+        self.queries = []
+        self._depth = dict.fromkeys(TIMERS, 0)
+
+    def add_query(self, sql, seconds):
+        self.db_queries += 1
+        self.seconds["db"] += seconds
+        if len(self.queries) < settings.METRICS_MAX_QUERIES:
+            self.queries.append((seconds, sql))
+
+    def stop(self):
+        self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            "view": self.view,
+            "total_ms": round(self.total * 1000, 1),
+            "db_queries": self.db_queries,
+            **{f"{kind}_ms": round(seconds * 1000, 1) for kind, seconds in self.seconds.items()},
+        }
+
+
+def set_view(label):
+    """Label the current request, e.g. with the page type being served."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.view = label
+
+
+@contextmanager
+def timed(kind):
+    """Add the time spent in the block to the current request's ``kind``."""
+    metrics = _current.get()
+    if metrics is None or metrics._depth[kind]:
+        yield
+        return
+    metrics._depth[kind] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._depth[kind] -= 1
+        metrics.seconds[kind] += time.perf_counter() - started
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def _add_sql_wrapper(sender=None, connection=None, **kwargs):
+    if _sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_wrapper)
+
+
+_installed = False
+
+
+def install():
+    """Hook the timers into the database layer, templates and renditions."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.template.base import Template
+    from wagtail.images.models import AbstractImage
+
+    connection_created.connect(_add_sql_wrapper)
+    for connection in connections.all(initialized_only=True):
+        _add_sql_wrapper(connection=connection)
+
+    def wrap(cls, name, kind):
+        method = getattr(cls, name)
+
+        @functools.wraps(method)
+        def timed_method(*args, **kwargs):
+            with timed(kind):
+                return method(*args, **kwargs)
+
+        setattr(cls, name, timed_method)
+
+    wrap(Template, "render", "template")
+    # create_renditions generates files in worker threads, so time the call
+    wrap(AbstractImage, "create_rendition", "rendition")
+    wrap(AbstractImage, "create_renditions", "rendition")
+
+
+def _series(name, **labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Totals:
+    """
+    This process's metric increments since the last flush to the cache.
+    The cache keeps the running totals, summed over all processes sharing
+    it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.last_flush = time.monotonic()
+
+    def record(self, metrics, status):
+        view = metrics.view
+        total = metrics.total
+        increments = Counter({
+            _series("ffe_requests_total", view=view, status=f"{status // 100}xx"): 1,
+            _series("ffe_request_duration_seconds_count", view=view): 1,
+            _series("ffe_request_duration_seconds_sum", view=view): round(total * MICROSECONDS),
+            _series("ffe_db_queries_total", view=view): metrics.db_queries,
+        })
+        for bound in DURATION_BUCKETS + ["+Inf"]:
+            if bound == "+Inf" or total <= bound:
+                increments[_series("ffe_request_duration_seconds_bucket", view=view, le=str(bound))] += 1
+        for kind, seconds in metrics.seconds.items():
+            increments[_series(f"ffe_{kind}_seconds_total", view=view)] = round(seconds * MICROSECONDS)
+        if total * 1000 > settings.SLOW_REQUEST_MS:
+            increments[_series("ffe_slow_requests_total", view=view)] = 1
+
+        with self.lock:
+            self.pending.update(increments)
+        self.flush()
+
+    def flush(self, force=False):
+        with self.lock:
+            if not force and time.monotonic() - self.last_flush < settings.METRICS_FLUSH_INTERVAL:
+                return
+            pending, self.pending = self.pending, Counter()
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+
+        cache = get_cache()
+        known = cache.get(SERIES_KEY) or {}
+        new = {series: _cache_key(series) for series in pending if series not in known}
+        if new:
+            # read-modify-write: a series lost to a concurrent update is
+            # added back on that process's next flush
+            known.update(new)
+            cache.set(SERIES_KEY, known, None)
+        for series, value in pending.items():
+            if value:
+                _incr(cache, _cache_key(series), value)
+
+
+totals = Totals()
+
+
+def get_cache():
+    return caches[settings.METRICS_CACHE_ALIAS]
+
+
+def _cache_key(series):
+    return "metrics:" + hashlib.md5(repr(series).encode()).hexdigest()
+
+
+def _incr(cache, key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+def reset():
+    cache = get_cache()
+    known = cache.get(SERIES_KEY) or {}
+    cache.delete_many(list(known.values()) + [SERIES_KEY])
+    with totals.lock:
+        totals.pending.clear()
+
+
+FAMILIES = {
+    "ffe_requests_total": ("counter", "Requests by view and status class."),
+    "ffe_request_duration_seconds": ("histogram", "Time to produce the response."),
+    "ffe_db_queries_total": ("counter", "SQL statements executed."),
+    "ffe_db_seconds_total": ("counter", "Time spent in SQL statements."),
+    "ffe_template_seconds_total": ("counter", "Time spent rendering templates."),
+    "ffe_rendition_seconds_total": ("counter", "Time spent generating image renditions."),
+    "ffe_http_seconds_total": ("counter", "Time spent in outbound HTTP calls."),
+    "ffe_slow_requests_total": ("counter", "Requests slower than SLOW_REQUEST_MS."),
+}
+
+
+def _family(name):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in FAMILIES:
+            return name[: -len(suffix)]
+    return name
+
+
+def _sort_key(series):
+    name, labels = series
+    le = dict(labels).get("le")
+    return (
+        _family(name),
+        tuple(item for item in labels if item[0] != "le"),
+        name,
+        float(le) if le is not None else 0,
+    )
+
+
+def render_prometheus():
+    """The totals of all processes sharing the cache, in the Prometheus text format."""
+    totals.flush(force=True)
+    cache = get_cache()
+    known = cache.get(SERIES_KEY) or {}
+    values = cache.get_many(list(known.values()))
+
+    lines = []
+    family = None
+    for series in sorted(known, key=_sort_key):
+        name, labels = series
+        if _family(name) != family:
+            family = _family(name)
+            kind, help_text = FAMILIES.get(family, ("untyped", ""))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+        value = values.get(known[series], 0)
+        if name.endswith("_seconds_total") or name.endswith("_seconds_sum"):
+            value = "%.6f" % (value / MICROSECONDS)
+        label_text = ",".join(
+            '%s="%s"' % (key, str(val).replace("\\", "\\\\").replace('"', '\\"'))
+            for key, val in labels
+        )
+        lines.append(f"{name}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is not None:
+        return match.view_name
+    if request.path.startswith(settings.STATIC_URL):
+        return "static"
+    return "unmatched"
+
+
+def finish(request, metrics, status):
+    metrics.stop()
+    if metrics.view is None:
+        metrics.view = _view_label(request)
+    record = {
+        "method": request.method,
+        "path": request.path,
+        "status": status,
+        **metrics.as_dict(),
+    }
+    totals.record(metrics, status)
+    logger.info("request", extra={"metrics": record})
+
+    if record["total_ms"] > settings.SLOW_REQUEST_MS:
+        slowest = sorted(metrics.queries, key=lambda query: query[0], reverse=True)
+        repeated = Counter(sql for _, sql in metrics.queries)
+        logger.warning("slow request", extra={"metrics": {
+            **record,
+            "slowest_queries": [
+                {"ms": round(seconds * 1000, 1), "sql": sql}
+                for seconds, sql in slowest[: settings.SLOW_REQUEST_QUERIES]
+            ],
+            "repeated_queries": {
+                sql: count for sql, count in repeated.most_common(5) if count > 1
+            },
+        }})
+
+
+class MetricsMiddleware:
+    """
+    Time every request; see the module docstring. Put it first. It works in
+    both sync and async chains, so it does not force async views (see
+    ``ASYNC_VIEWS``) through a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            try:
+                finish(request, metrics, status)
+            finally:
+                _current.reset(token)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            try:
+                finish(request, metrics, status)
+            finally:
+                _current.reset(token)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed as ``extra={"metrics": ...}``."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "metrics", {}),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
@@ -0,0 +1,124 @@
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+
+from .concurrency import run_sync
+from .files import file_response
+
+# best first; checked on disk rather than by what is installed here, since
+# collectstatic may have run on a build machine with brotli available
+ENCODINGS = [(".br", "br"), (".gz", "gzip")]
+# types the mimetypes module lacks on some systems; without one a compressed
+# variant would be sent as application/gzip
+CONTENT_TYPES = {
+    ".map": "application/json",
+    ".mjs": "text/javascript",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".eot": "application/vnd.ms-fontobject",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+}
+
+
+def content_type(name):
+    """The Content-Type of the uncompressed static file ``name``."""
+    return (
+        CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+        or mimetypes.guess_type(name)[0]
+        or "application/octet-stream"
+    )
+
+
+def accepts_encoding(header, coding):
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if token.strip().lower() != coding:
+            continue
+        params = params.replace(" ", "")
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+class StaticFilesMiddleware:
+    """
+    Serve STATIC_ROOT from the application when no front proxy does
+    (``STATIC_SERVE``), picking the precompressed ``.br``/``.gz`` variant
+    ``collectstatic`` wrote (see core/storage.py) that the client accepts.
+    Content-hashed names from the manifest are cached as immutable, the
+    unhashed originals for ``STATIC_CACHE_MAX_AGE``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_SERVE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        # only the manifest storage has hashed names
+        self.hashed_names = set(getattr(staticfiles_storage, "hashed_files", {}).values())
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if request.method in ("GET", "HEAD") and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method in ("GET", "HEAD") and request.path.startswith(self.prefix):
+            response = await run_sync(
+                "default", self.serve, request, request.path[len(self.prefix):]
+            )
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        served_path, encoding, has_variants = path, None, False
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+        for suffix, coding in ENCODINGS:
+            if not os.path.isfile(path + suffix):
+                continue
+            has_variants = True
+            if encoding is None and accepts_encoding(accept_encoding, coding):
+                served_path, encoding = path + suffix, coding
+
+        response = file_response(
+            request,
+            served_path,
+            content_type=content_type(name),
+            immutable=name in self.hashed_names,
+            max_age=settings.STATIC_CACHE_MAX_AGE,
+            method="django",
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+        if has_variants:
+            patch_vary_headers(response, ["Accept-Encoding"])
+        return response
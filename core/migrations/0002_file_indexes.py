@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# DeduplicatingFileSystemStorage (core/storage.py) looks up the rows
+# referring to a file before deleting it; without these every lookup scans
+# the table. The tables belong to wagtailimages and wagtaildocs, whose models
+# this project cannot change, so the indexes are created here in raw SQL and
+# stay out of those apps' migration state: IF NOT EXISTS / IF EXISTS keep
+# this safe to apply and reverse whatever those apps do to the tables.
+FILE_INDEXES = [
+    ("wagtailimages_image", "core_image_file_idx"),
+    ("wagtailimages_rendition", "core_rendition_file_idx"),
+    ("wagtaildocs_document", "core_document_file_idx"),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_blob"),
+        ("wagtailimages", "0027_image_description"),
+        ("wagtaildocs", "0014_alter_document_file_size"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=f"CREATE INDEX IF NOT EXISTS {name} ON {table} (file)",
+            reverse_sql=f"DROP INDEX IF EXISTS {name}",
+        )
+        for table, name in FILE_INDEXES
+    ]
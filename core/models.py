@@ -1,3 +1,17 @@
 from django.db import models
 
-# Create your models here.
+
+class Blob(models.Model):
+    """
+    A file in the deduplicating media storage (core/storage.py), by content:
+    a new upload whose SHA-256 and size match one of these is not written
+    again, it gets this one's name instead.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,262 @@
+"""
+File storages.
+
+``CompressedManifestStaticFilesStorage`` is Django's manifest storage (every
+file is also copied under a content-hashed name and ``{% static %}`` links to
+that copy) plus, at ``collectstatic`` time, a ``.gz`` and, when the optional
+``brotli`` package is installed, a ``.br`` variant of each text asset.
+``core.middleware.StaticFilesMiddleware`` serves those variants when there is
+no front proxy to do it.
+
+``DeduplicatingFileSystemStorage`` is the media storage: uploads are hashed
+while they are written, and one whose content is already stored (see
+``Blob``) is not kept - the caller gets the existing file's name, so the
+duplicate ``Image`` or ``Document`` row shares that file. A file is only
+deleted once no row of any model refers to it any more. ``dedupe_files``
+does the same for files stored before, or by another storage.
+"""
+import functools
+import gzip
+import hashlib
+import os
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".html", ".txt", ".xml",
+    ".ico", ".ttf", ".otf", ".eot",
+}
+# below this the headers outweigh the savings
+MIN_COMPRESS_SIZE = 256
+
+
+def compressors():
+    """``(suffix, compress)`` pairs, best first."""
+    available = []
+    if brotli is not None:
+        available.append((".br", lambda data: brotli.compress(data, quality=11)))
+    available.append((".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)))
+    return available
+
+
+def is_compressible(name):
+    return os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths)
+        names.update(self.hashed_files.get(self.hash_key(name), name) for name in paths)
+        names = sorted(name for name in names if is_compressible(name))
+        # zlib and brotli release the GIL
+        with ThreadPoolExecutor() as pool:
+            for name, written in zip(names, pool.map(self.compress, names)):
+                for compressed_name in written:
+                    yield name, compressed_name, True
+
+    def compress(self, name):
+        """
+        Write the compressed variants of ``name`` next to it, keeping only
+        those that are actually smaller. Returns their names.
+        """
+        path = self.path(name)
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return []
+
+        written = []
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            written.append(name + suffix)
+        return written
+
+
+# uploads are spooled here, inside the storage so they can be linked into place
+INCOMING_DIR = ".incoming"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@functools.cache
+def file_fields():
+    """Every model's file fields, as ``(model, field)``."""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.local_concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def file_references(name):
+    """
+    Querysets, one per file field of any model, of the rows that refer to
+    the stored file ``name``. The large tables' file columns are indexed
+    (core/migrations/0002), the rest are small.
+    """
+    for model, field in file_fields():
+        yield model._default_manager.filter(**{field.name: name}), field
+
+
+def is_referenced(name):
+    return any(rows.exists() for rows, _ in file_references(name))
+
+
+class DeduplicatingFileSystemStorage(FileSystemStorage):
+    def _save(self, name, content):
+        from .models import Blob
+
+        incoming = os.path.join(self.location, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=incoming, delete=False) as spool:
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                hasher.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+        try:
+            existing = self.find(hasher.hexdigest(), size)
+            if existing is not None:
+                return existing
+            name = self._link(spool.name, name)
+            Blob.objects.update_or_create(
+                name=name, defaults={"sha256": hasher.hexdigest(), "size": size}
+            )
+            return name
+        finally:
+            os.unlink(spool.name)
+
+    def _link(self, path, name):
+        """Hard-link the spooled ``path`` to ``name``, or the next free name."""
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        while True:
+            try:
+                # fails rather than overwrites, like FileSystemStorage's O_EXCL
+                os.link(path, full_path)
+                break
+            except FileExistsError:
+                name = self.get_available_name(name)
+                full_path = self.path(name)
+        # the spool file was created 0600
+        os.chmod(full_path, self.file_permissions_mode or 0o644)
+        return str(name).replace("\\", "/")
+
+    def find(self, sha256, size):
+        """The name of a stored file with this content, or None."""
+        from .models import Blob
+
+        for blob in Blob.objects.filter(sha256=sha256, size=size):
+            if self.exists(blob.name):
+                return blob.name
+            # removed behind our back
+            blob.delete()
+        return None
+
+    def delete(self, name):
+        from .models import Blob
+
+        if is_referenced(name):
+            # still shared with another row
+            return
+        super().delete(name)
+        Blob.objects.filter(name=name).delete()
+
+
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def dedupe_files(storage, dry_run=False, workers=None):
+    """
+    Find files in ``storage`` with the same content, point every row that
+    refers to a copy at one of them and delete the copies. Every file left
+    is indexed as a ``Blob``, so later uploads are deduplicated against it.
+
+    Returns a report: ``files``, ``duplicates`` (copies found),
+    ``bytes_reclaimed``, ``rows`` (rows repointed, by model label) and
+    ``repointed`` (their primary keys, by model label).
+    """
+    from .models import Blob
+
+    sizes = {}
+    for root, dirs, files in os.walk(storage.location):
+        dirs[:] = [d for d in dirs if d != INCOMING_DIR]
+        for filename in files:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+            sizes[name] = os.path.getsize(path)
+
+    # hashlib releases the GIL, so threads read and hash in parallel
+    names = sorted(sizes)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = dict(zip(names, pool.map(_hash_file, (storage.path(n) for n in names))))
+
+    groups = defaultdict(list)
+    for name in names:
+        groups[(digests[name], sizes[name])].append(name)
+
+    report = {
+        "files": len(names), "duplicates": 0, "bytes_reclaimed": 0,
+        "rows": defaultdict(int), "repointed": defaultdict(list),
+    }
+    kept = {}
+    for (sha256, size), copies in groups.items():
+        if len(copies) == 1:
+            kept[copies[0]] = (sha256, size)
+            continue
+        # keep a file rows already use, the shortest name otherwise
+        copies.sort(key=lambda name: (not is_referenced(name), len(name), name))
+        keep, *duplicates = copies
+        kept[keep] = (sha256, size)
+        for duplicate in duplicates:
+            report["duplicates"] += 1
+            report["bytes_reclaimed"] += size
+            for rows, field in file_references(duplicate):
+                for row in rows:
+                    report["rows"][row._meta.label] += 1
+                    report["repointed"][row._meta.label].append(row.pk)
+                    if dry_run:
+                        continue
+                    setattr(row, field.attname, keep)
+                    # save(), not update(): listings and caches follow the file
+                    row.save(update_fields=[field.name])
+                    if hasattr(row, "purge_from_cache"):
+                        # renditions are cached with their file name
+                        row.purge_from_cache()
+            if not dry_run:
+                storage.delete(duplicate)
+
+    if not dry_run:
+        indexed = set(Blob.objects.filter(name__in=kept).values_list("name", flat=True))
+        Blob.objects.bulk_create(
+            (Blob(name=name, sha256=sha256, size=size)
+             for name, (sha256, size) in kept.items() if name not in indexed),
+            batch_size=1000,
+        )
+    report["rows"] = dict(report["rows"])
+    report["repointed"] = dict(report["repointed"])
+    return report
@@ -1,3 +1,405 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from wagtail.documents.models import Document
+from wagtail.images.models import Image
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Site
+from wagtail.rich_text import RichText
+
+from content.models import AchievementPage, PhotoGalleryEventPage, PhotoGalleryIndexPage
+
+from . import checks, metrics
+from .models import Blob
+from .views import media
+
+MEDIA_ROOT = tempfile.mkdtemp()
+STATIC_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_SERVE_METHOD="django")
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(MEDIA_ROOT, "images"), exist_ok=True)
+        cls.data = bytes(range(256)) * 40
+        for name in ("original_images/doc.pdf", "images/photo.fill-400x300.jpg"):
+            os.makedirs(os.path.join(MEDIA_ROOT, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(MEDIA_ROOT, name), "wb") as f:
+                f.write(cls.data)
+
+    def get(self, path, **headers):
+        return self.client.get("/media/" + path, headers=headers)
+
+    def test_full_response(self):
+        response = self.get("original_images/doc.pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("max-age=86400", response["Cache-Control"])
+
+    def test_renditions_are_immutable(self):
+        response = self.get("images/photo.fill-400x300.jpg")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_ranges(self):
+        response = self.get("original_images/doc.pdf", range="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 100-199/10240")
+        self.assertEqual(b"".join(response.streaming_content), self.data[100:200])
+
+        response = self.get("original_images/doc.pdf", range="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.data[-10:])
+
+        response = self.get("original_images/doc.pdf", range="bytes=99999-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_get(self):
+        etag = self.get("original_images/doc.pdf")["ETag"]
+        response = self.get("original_images/doc.pdf", if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # a stale If-Range validator gets the whole file
+        response = self.get(
+            "original_images/doc.pdf", range="bytes=0-9", if_range='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_traversal(self):
+        self.assertEqual(self.get("nope.pdf").status_code, 404)
+        with self.assertRaises(Http404):
+            media(RequestFactory().get("/"), "../manage.py")
+
+    @override_settings(MEDIA_SERVE_METHOD="x-accel-redirect")
+    def test_accel_redirect(self):
+        response = self.get("original_images/doc.pdf")
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/original_images/doc.pdf")
+        self.assertEqual(response.content, b"")
+
+
+@override_settings(
+    STATIC_ROOT=STATIC_ROOT,
+    STATIC_SERVE=True,
+    STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "core.storage.CompressedManifestStaticFilesStorage"},
+    },
+)
+class StaticFilesTests(TestCase):
+    def setUp(self):
+        call_command("collectstatic", interactive=False, verbosity=0)
+        self.hashed_url = Template("{% load static %}{% static 'css/style.css' %}").render(Context())
+
+    def test_hashed_names_and_variants(self):
+        self.assertRegex(self.hashed_url, r"^/static/css/style\.[0-9a-f]{12}\.css$")
+        name = self.hashed_url[len("/static/"):]
+        with open(os.path.join(STATIC_ROOT, name), "rb") as f:
+            original = f.read()
+        with open(os.path.join(STATIC_ROOT, name + ".gz"), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+        # already a compressed format
+        self.assertFalse(staticfiles_storage.exists("images/logo.jpg.gz"))
+
+    def test_serves_compressed_variant(self):
+        response = self.client.get(self.hashed_url, headers={"accept-encoding": "gzip, br;q=0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn(b"body", gzip.decompress(b"".join(response.streaming_content)))
+
+        response = self.client.get(self.hashed_url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_compressed_variants_keep_the_original_type(self):
+        data = b'{"version": 3, "mappings": ""}' * 20
+        for name in ("js/app.js.map", "fonts/icons.unknownext"):
+            path = os.path.join(STATIC_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            with open(path + ".gz", "wb") as f:
+                f.write(gzip.compress(data))
+        response = self.client.get("/static/js/app.js.map", headers={"accept-encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "application/json")
+        response = self.client.get("/static/fonts/icons.unknownext", headers={"accept-encoding": "gzip"})
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+
+    def test_unhashed_names_are_not_immutable(self):
+        response = self.client.get("/static/css/style.css")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get("/static/css/missing.css").status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class HomeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = Site.objects.get(is_default_site=True).root_page
+        image = Image.objects.create(title="Photo", file=get_test_image_file())
+        self.achievements = root.add_child(instance=AchievementPage(
+            title="Achievements",
+            slug="achievements",
+            achievements=[("achievement", {
+                "title": "School fees capped",
+                "description": RichText("<p>The order was issued.</p>"),
+                "image": image,
+            })],
+        ))
+        self.achievements.save_revision().publish()
+        gallery = root.add_child(
+            instance=PhotoGalleryIndexPage(title="Gallery", slug="gallery")
+        )
+        gallery.add_child(instance=PhotoGalleryEventPage(title="Annual meet", slug="meet"))
+
+    def test_highlights_are_cached(self):
+        response = self.client.get("/")
+        self.assertContains(response, "School fees capped")
+        self.assertContains(response, "The order was issued.")
+        self.assertContains(response, "Annual meet")
+        self.assertIn("max-age=60", response["Cache-Control"])
+        # only the state of the highlighted pages is read (and their restrictions)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get("/").content, response.content)
+
+    def test_conditional_get(self):
+        response = self.client.get("/")
+        self.assertEqual(
+            self.client.get("/", headers={"if-none-match": response["ETag"]}).status_code,
+            304,
+        )
+        self.assertEqual(
+            self.client.get(
+                "/", headers={"if-modified-since": response["Last-Modified"]}
+            ).status_code,
+            304,
+        )
+
+    def test_publish_invalidates(self):
+        etag = self.client.get("/")["ETag"]
+        self.achievements.achievements[0].value["title"] = "Admissions reopened"
+        self.achievements.save_revision().publish()
+
+        response = self.client.get("/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Admissions reopened")
+
+    def test_unpublish_invalidates_without_purge(self):
+        self.client.get("/")
+        # as if done by another process, whose purge_home this one cannot see
+        with mock.patch("content.signal_handlers.purge_home"):
+            self.achievements.unpublish()
+        self.assertNotContains(self.client.get("/"), "School fees capped")
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    METRICS_FLUSH_INTERVAL=0,
+    METRICS_ALLOWED_IPS=["127.0.0.1"],
+    METRICS_TOKEN="secret",
+)
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        root = Site.objects.get(is_default_site=True).root_page
+        self.page = root.add_child(instance=AchievementPage(
+            title="Achievements", slug="achievements",
+            achievements=[("achievement", {
+                "title": "Award", "description": RichText("<p>Won</p>"),
+                "image": Image.objects.create(title="Photo", file=get_test_image_file()),
+            })],
+        ))
+
+    def scrape(self, **kwargs):
+        response = self.client.get("/metrics", **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return dict(
+            line.rsplit(" ", 1) for line in response.content.decode().splitlines()
+            if not line.startswith("#")
+        )
+
+    def test_requests_are_labelled_by_page_type(self):
+        self.client.get(self.page.url)
+        self.client.get(self.page.url)
+        self.client.get("/")
+        values = self.scrape()
+
+        view = 'view="content.AchievementPage"'
+        self.assertEqual(values['ffe_requests_total{status="2xx",%s}' % view], "2")
+        self.assertEqual(values['ffe_request_duration_seconds_count{%s}' % view], "2")
+        self.assertEqual(values['ffe_request_duration_seconds_bucket{le="+Inf",%s}' % view], "2")
+        self.assertGreater(int(values['ffe_db_queries_total{%s}' % view]), 0)
+        self.assertGreater(float(values['ffe_template_seconds_total{%s}' % view]), 0)
+        # the first request generated the renditions
+        self.assertGreater(float(values['ffe_rendition_seconds_total{%s}' % view]), 0)
+        self.assertEqual(values['ffe_requests_total{status="2xx",view="home"}'], "1")
+
+    def test_outbound_http_time(self):
+        def view(request):
+            with metrics.timed("http"), metrics.timed("http"):
+                time.sleep(0.01)
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        with self.assertLogs("core.metrics", "INFO") as logs:
+            metrics.MetricsMiddleware(view)(request)
+        record = logs.records[0].metrics
+        self.assertGreaterEqual(record["http_ms"], 10)
+        self.assertLess(record["http_ms"], record["total_ms"] + 1)
+        self.assertEqual(record["view"], "unmatched")
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_log_their_queries(self):
+        with self.assertLogs("core.metrics", "WARNING") as logs:
+            self.client.get(self.page.url)
+            # the scrape is a slow request too
+            values = self.scrape()
+        record = logs.records[0]
+        self.assertEqual(record.getMessage(), "slow request")
+        self.assertTrue(record.metrics["slowest_queries"])
+        self.assertTrue(record.metrics["slowest_queries"][0]["sql"])
+
+        line = json.loads(metrics.JSONFormatter().format(record))
+        self.assertEqual(line["level"], "WARNING")
+        self.assertEqual(line["view"], "content.AchievementPage")
+        self.assertEqual(values['ffe_slow_requests_total{view="content.AchievementPage"}'], "1")
+
+    def test_endpoint_needs_address_or_token(self):
+        with self.settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+            self.scrape(headers={"authorization": "Bearer secret"})
+
+
+class BenchRegressionTests(SimpleTestCase):
+    def test_regressions(self):
+        from .bench import regressions
+
+        baseline = {"gr": {"p50_ms": 10.0, "queries": 7, "peak_kb": 100}}
+        self.assertEqual(
+            regressions({"gr": {"p50_ms": 14.0, "queries": 7, "peak_kb": 140}}, baseline, 0.5), []
+        )
+        found = regressions({"gr": {"p50_ms": 30.0, "queries": 8, "peak_kb": 400}}, baseline, 0.5)
+        self.assertEqual(len(found), 3)
+        # new scenarios have nothing to compare with
+        self.assertEqual(regressions({"new": {"p50_ms": 1, "queries": 1, "peak_kb": 1}}, baseline, 0.5), [])
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    STORAGES={
+        "default": {"BACKEND": "core.storage.DeduplicatingFileSystemStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    TASKS={"default": {"BACKEND": "django_tasks.backends.immediate.ImmediateBackend"}},
+)
+class DeduplicatingStorageTests(TestCase):
+    def test_duplicate_uploads_share_one_file(self):
+        first = Document.objects.create(title="GR", file=ContentFile(b"%PDF-1 gr", name="gr.pdf"))
+        copy = Document.objects.create(title="GR again", file=ContentFile(b"%PDF-1 gr", name="gr-copy.pdf"))
+        other = Document.objects.create(title="Other", file=ContentFile(b"%PDF-1 other", name="gr.pdf"))
+        self.assertEqual(copy.file.name, first.file.name)
+        self.assertNotEqual(other.file.name, first.file.name)
+        self.assertEqual(Blob.objects.count(), 2)
+
+        storage = first.file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(copy.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertFalse(storage.exists(copy.file.name))
+        self.assertEqual(Blob.objects.count(), 1)
+
+    def test_dedupe_files(self):
+        from .storage import dedupe_files
+
+        storage = default_storage
+        data = get_test_image_file(size=(40, 30)).file.getvalue()
+        names = []
+        for filename in ("a.png", "b.png"):
+            # as a plain storage would have stored them
+            name = f"original_images/{filename}"
+            os.makedirs(os.path.dirname(storage.path(name)), exist_ok=True)
+            with open(storage.path(name), "wb") as f:
+                f.write(data)
+            names.append(name)
+        images = [
+            Image.objects.create(title=name, file=name, width=40, height=30) for name in names
+        ]
+
+        report = dedupe_files(storage, dry_run=True)
+        self.assertEqual((report["duplicates"], report["bytes_reclaimed"]), (1, len(data)))
+        self.assertTrue(storage.exists(names[1]))
+
+        report = dedupe_files(storage)
+        self.assertEqual(report["rows"], {"wagtailimages.Image": 1})
+        self.assertFalse(storage.exists(names[1]))
+        for image in images:
+            image.refresh_from_db()
+            self.assertEqual(image.file.name, names[0])
+        # indexed: a new upload of the same content shares it too
+        upload = Image.objects.create(title="c", file=ContentFile(data, name="c.png"))
+        self.assertEqual(upload.file.name, names[0])
+
+
+class SystemCheckTests(SimpleTestCase):
+    locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+    worker = {"default": {"BACKEND": "django_tasks.backends.database.DatabaseBackend"}}
+
+    def test_page_cache_needs_shared_cache_with_several_processes(self):
+        with self.settings(PAGE_CACHE_ENABLED=True, CACHES=self.locmem, TASKS=self.worker):
+            self.assertEqual(
+                [error.id for error in checks.check_page_cache(None)], ["core.E001"]
+            )
+        with self.settings(PAGE_CACHE_ENABLED=True, CACHES=self.redis, WEB_CONCURRENCY=4):
+            self.assertEqual(checks.check_page_cache(None), [])
+        with self.settings(PAGE_CACHE_ENABLED=False, CACHES=self.locmem, WEB_CONCURRENCY=4):
+            self.assertEqual(checks.check_page_cache(None), [])
+
+    def test_block_cache_needs_shared_cache_with_several_processes(self):
+        with self.settings(BLOCK_CACHE_ENABLED=True, CACHES=self.locmem, TASKS=self.worker):
+            self.assertEqual(
+                [error.id for error in checks.check_block_cache(None)], ["core.E002"]
+            )
+        with self.settings(BLOCK_CACHE_ENABLED=True, CACHES=self.redis, WEB_CONCURRENCY=4):
+            self.assertEqual(checks.check_block_cache(None), [])
+        with self.settings(BLOCK_CACHE_ENABLED=False, CACHES=self.locmem, WEB_CONCURRENCY=4):
+            self.assertEqual(checks.check_block_cache(None), [])
+
+    def test_richtext_cache_needs_shared_cache_with_several_processes(self):
+        with self.settings(RICHTEXT_CACHE_ENABLED=True, CACHES=self.locmem, WEB_CONCURRENCY=4):
+            self.assertEqual(
+                [error.id for error in checks.check_richtext_cache(None)], ["core.E003"]
+            )
+        with self.settings(RICHTEXT_CACHE_ENABLED=True, CACHES=self.redis, TASKS=self.worker):
+            self.assertEqual(checks.check_richtext_cache(None), [])
+        with self.settings(RICHTEXT_CACHE_ENABLED=False, CACHES=self.locmem, TASKS=self.worker):
+            self.assertEqual(checks.check_richtext_cache(None), [])
+
+    def test_metrics_need_shared_cache_with_several_workers(self):
+        with self.settings(METRICS_ENABLED=True, CACHES=self.locmem, WEB_CONCURRENCY=4):
+            self.assertEqual(
+                [warning.id for warning in checks.check_metrics_cache(None)], ["core.W001"]
+            )
+        with self.settings(METRICS_ENABLED=True, CACHES=self.locmem, WEB_CONCURRENCY=1):
+            self.assertEqual(checks.check_metrics_cache(None), [])
@@ -1,4 +1,106 @@
-from django.shortcuts import render
+import hashlib
+import os
 
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from content.cache import get_cache, versions_are_shared
+from content.highlights import build_highlights, home_state, home_version
+
+from .concurrency import run_sync
+from .files import file_response
+from .metrics import render_prometheus
+
+
+def _render_home():
+    """
+    ``(content, etag, last_modified)`` of the home page. It is the same for
+    every visitor, so it is rendered without a request (and so without
+    context processors) and cached until a highlighted page changes. When
+    other processes cannot see ``purge_home``, the copy is only kept for
+    HOME_CACHE_MAX_AGE, as long as browsers may keep it anyway.
+    """
+    count, last_published = home_state()
+    last_modified = int(last_published.timestamp()) if last_published else None
+    key = "home:%s:%s:%s" % (home_version(), count, last_modified)
+    cached = get_cache().get(key)
+    if cached is not None:
+        return cached
+
+    content = render_to_string("home.html", {"highlights": build_highlights()})
+    etag = '"%s"' % hashlib.md5(content.encode()).hexdigest()
+    rendered = (content, etag, last_modified)
+    timeout = (
+        settings.PAGE_CACHE_TIMEOUT if versions_are_shared() else settings.HOME_CACHE_MAX_AGE
+    )
+    get_cache().set(key, rendered, timeout)
+    return rendered
+
+
+def _home_response(request, content, etag, last_modified):
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = HttpResponse(content)
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=settings.HOME_CACHE_MAX_AGE)
+    return response
+
+
+@require_safe
 def home(request):
-    return render(request, "home.html")
+    return _home_response(request, *_render_home())
+
+
+@require_safe
+async def ahome(request):
+    """``home`` for ASYNC_VIEWS: the cache lookup and rendering run in a pool."""
+    return _home_response(request, *await run_sync("default", _render_home))
+
+
+@require_safe
+def media(request, path):
+    """
+    Serve a file from MEDIA_ROOT (see core/files.py). Renditions have
+    content-derived names, so they are cached as immutable.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    return file_response(
+        request,
+        full_path,
+        accel_url=settings.MEDIA_ACCEL_REDIRECT_PREFIX + path,
+        immutable=path.startswith(tuple(settings.MEDIA_IMMUTABLE_PREFIXES)),
+    )
+
+
+def metrics(request):
+    """Request metrics of all worker processes, in the Prometheus text format."""
+    token = settings.METRICS_TOKEN
+    allowed = request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS or (
+        token and constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+    )
+    if not allowed:
+        raise Http404
+    response = HttpResponse(
+        render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+    patch_cache_control(response, no_store=True)
+    return response
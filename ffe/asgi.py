@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ffe.settings')
+# selects the ASGI database settings (connection pool) in ffe/settings.py
+os.environ.setdefault('SERVER_MODE', 'asgi')
 
 application = get_asgi_application()
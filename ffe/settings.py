@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from django.conf import settings
 # import os
 # from datetime import timedelta
@@ -61,6 +61,8 @@ INSTALLED_APPS = [
 
     'modelcluster',
     'taggit',
+    'django_tasks',
+    'django_tasks.backends.database',
 
     # Your apps
     'core',
@@ -68,7 +70,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -121,6 +125,109 @@ DATABASES = {
 }
 }
 
+# Connection reuse. ffe/asgi.py sets SERVER_MODE=asgi.
+# WSGI: each worker thread keeps its connection for DB_CONN_MAX_AGE seconds.
+# ASGI: persistent connections are per-thread and leak under async views, so
+# a psycopg 3 connection pool is used instead (DB_POOL=True forces it for
+# WSGI too). CONN_HEALTH_CHECKS drops dead connections before reuse.
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+DB_POOL = config('DB_POOL', default=SERVER_MODE == 'asgi', cast=bool)
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if DB_POOL:
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # required with a pool
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        # seconds a request waits for a free connection before failing
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+        'max_idle': config('DB_POOL_MAX_IDLE', default=300, cast=float),
+        'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=3600, cast=float),
+        'check': ConnectionPool.check_connection,
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+
+# Async serving. With ASYNC_VIEWS (on by default under ASGI) the home page and
+# Wagtail pages are served by async views that run their blocking work in
+# the bounded thread pools below instead of a thread per request (see
+# core/concurrency.py). Every pool thread may hold a database connection, so
+# keep DB_POOL_MAX_SIZE at least the sum of the pool sizes.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=SERVER_MODE == 'asgi', cast=bool)
+ASYNC_THREAD_POOLS = {
+    'default': config('ASYNC_THREADS', default=8, cast=int),
+    'contact': config('ASYNC_CONTACT_THREADS', default=2, cast=int),
+}
+
+
+
+# Cache
+# CACHE_BACKEND is one of locmem, file or redis (Redis-compatible servers such
+# as Valkey work too; needs the `redis` package). For file and redis set
+# CACHE_LOCATION to a directory / redis:// URL respectively.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Web server processes (gunicorn reads the same variable). locmem and file
+# caches are not shared between them, which the system checks in
+# core/checks.py take into account.
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+
+# Full-page cache for anonymous visitors (see content/cache.py). Purges have
+# to reach every process, so it is off unless the cache is redis.
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=CACHE_BACKEND == 'redis', cast=bool)
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+
+# Cache-Control of anonymous page responses: browsers revalidate after
+# PAGE_BROWSER_MAX_AGE, shared caches (CDN, reverse proxy) keep them for
+# PAGE_SHARED_MAX_AGE and may serve them stale while revalidating
+PAGE_BROWSER_MAX_AGE = config('PAGE_BROWSER_MAX_AGE', default=0, cast=int)
+PAGE_SHARED_MAX_AGE = config('PAGE_SHARED_MAX_AGE', default=300, cast=int)
+PAGE_STALE_WHILE_REVALIDATE = config('PAGE_STALE_WHILE_REVALIDATE', default=60, cast=int)
+# Caching proxy (Varnish, nginx with a purge module) that is sent an HTTP
+# PURGE for a page's URLs, and its parent's, whenever the page changes
+PAGE_PURGE_URL = config('PAGE_PURGE_URL', default='')
+WAGTAILFRONTENDCACHE = {}
+if PAGE_PURGE_URL:
+    WAGTAILFRONTENDCACHE['proxy'] = {
+        'BACKEND': 'wagtail.contrib.frontend_cache.backends.HTTPBackend',
+        'LOCATION': PAGE_PURGE_URL,
+    }
+
+# Home page (core.views.home): number of each kind of highlight, and how long
+# browsers may reuse it before revalidating with ETag/Last-Modified
+HOME_HIGHLIGHTS_COUNT = config('HOME_HIGHLIGHTS_COUNT', default=3, cast=int)
+HOME_CACHE_MAX_AGE = config('HOME_CACHE_MAX_AGE', default=60, cast=int)
+
+# Per-block render cache for StreamFields (see content/fragments.py). Keys
+# follow block content and the versions of the pages and documents its rich
+# text links to, so the timeout only bounds how long unused entries stay.
+# Purges only bump versions in the cache they are made in, so like the page
+# cache it is off unless that cache is shared (core.E002).
+BLOCK_CACHE_ENABLED = config('BLOCK_CACHE_ENABLED', default=CACHE_BACKEND == 'redis', cast=bool)
+BLOCK_CACHE_TIMEOUT = config('BLOCK_CACHE_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)
+
+# Expanded rich text (links, documents, embedded images), keyed by source and
+# by the versions of what it refers to (see content/richtext.py). Those
+# versions live in the cache too, so it needs a shared one (core.E003).
+RICHTEXT_CACHE_ENABLED = config('RICHTEXT_CACHE_ENABLED', default=CACHE_BACKEND == 'redis', cast=bool)
+RICHTEXT_CACHE_TIMEOUT = config('RICHTEXT_CACHE_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)
 
 
 # Password validation
@@ -163,6 +270,32 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# "manifest" makes collectstatic also write content-hashed copies, which
+# {% static %} then links to, plus .gz (and, with the brotli package, .br)
+# variants of text assets (core/storage.py). It needs collectstatic to have
+# run, so development keeps the plain names.
+STATIC_STORAGE = config('STATIC_STORAGE', default='default')
+STATIC_STORAGE_BACKENDS = {
+    'default': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    'manifest': 'core.storage.CompressedManifestStaticFilesStorage',
+}
+# "dedupe" stores each distinct media file once: an upload with the same
+# content as a stored file shares it (core/storage.py, dedupe_media).
+MEDIA_STORAGE = config('MEDIA_STORAGE', default='dedupe')
+MEDIA_STORAGE_BACKENDS = {
+    'default': 'django.core.files.storage.FileSystemStorage',
+    'dedupe': 'core.storage.DeduplicatingFileSystemStorage',
+}
+STORAGES = {
+    'default': {'BACKEND': MEDIA_STORAGE_BACKENDS[MEDIA_STORAGE]},
+    'staticfiles': {'BACKEND': STATIC_STORAGE_BACKENDS[STATIC_STORAGE]},
+}
+# Serve STATIC_ROOT, precompressed variants included, from this process when
+# no front proxy does (core/middleware.py). Hashed names are cached as
+# immutable, anything else for STATIC_CACHE_MAX_AGE.
+STATIC_SERVE = config('STATIC_SERVE', default=False, cast=bool)
+STATIC_CACHE_MAX_AGE = config('STATIC_CACHE_MAX_AGE', default=60 * 60, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -178,9 +311,169 @@ WAGTAIL_ADMIN_CUSTOM_CSS = "css/admin-overrides.css"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
 
+# How /media/ is served (see core/files.py): "django" streams files from this
+# process (zero-copy via sendfile under gunicorn); "x-accel-redirect" (nginx)
+# and "x-sendfile" (Apache, lighttpd) hand the transfer to the front proxy.
+MEDIA_SERVE_METHOD = config('MEDIA_SERVE_METHOD', default='django')
+# internal nginx location aliased to MEDIA_ROOT, for X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=60 * 60 * 24, cast=int)
+# renditions and document thumbnails: their file names change whenever the
+# output would
+MEDIA_IMMUTABLE_PREFIXES = ['images/', 'document_previews/']
+# rows per page on GRPage / RTIPage document listings
+DOCUMENT_LIST_PAGE_SIZE = 50
+# documents keep their URL when the file is replaced, so revalidate sooner
+DOCUMENT_CACHE_MAX_AGE = config('DOCUMENT_CACHE_MAX_AGE', default=60 * 60, cast=int)
+
+# PDF previews (see content/previews.py): text and page count with pypdf,
+# first-page thumbnails with poppler's pdftoppm if it is installed
+DOCUMENT_PREVIEW_PDFTOPPM = config('DOCUMENT_PREVIEW_PDFTOPPM', default='pdftoppm')
+DOCUMENT_PREVIEW_THUMBNAIL_WIDTH = 240
+# text is read from at most this many pages, and kept up to this length
+DOCUMENT_PREVIEW_MAX_PAGES = 50
+DOCUMENT_PREVIEW_MAX_TEXT = 100_000
+# seconds before pdftoppm is killed
+DOCUMENT_PREVIEW_TIMEOUT = 60
+
+# Static snapshot of the public pages for the front proxy to serve
+# (content/snapshot.py, snapshot_site). With SNAPSHOT_ON_PUBLISH, publishing
+# re-renders the changed page and the pages listing it into the current build.
+SNAPSHOT_ROOT = config('SNAPSHOT_ROOT', default=str(BASE_DIR / 'snapshot'))
+SNAPSHOT_ON_PUBLISH = config('SNAPSHOT_ON_PUBLISH', default=False, cast=bool)
+# previous builds kept next to the current one
+SNAPSHOT_KEEP_BUILDS = config('SNAPSHOT_KEEP_BUILDS', default=2, cast=int)
+
+# Photo gallery pagination (see content/gallery.py)
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 100
+# widths of the 4:3 renditions offered in each photo's srcset
+GALLERY_SRCSET_WIDTHS = [400, 800, 1200]
+
+# Responsive images (see content/renditions.py): "width-N" renditions used by
+# {% responsive_image %}, and the extra formats generated for every filter.
+# "avif" needs a Pillow/Willow build with AVIF support.
+RESPONSIVE_IMAGE_WIDTHS = [400, 800, 1200]
+RESPONSIVE_IMAGE_FORMATS = config(
+    'RESPONSIVE_IMAGE_FORMATS', default='webp', cast=lambda v: [f for f in v.split(',') if f]
+)
+
+# Uploaded originals (see content/originals.py): HEIC is converted to JPEG,
+# EXIF is stripped and both sides are capped at IMAGE_ORIGINAL_MAX_DIMENSION
+# before renditions are made. IMAGE_ORIGINAL_QUALITY is the JPEG/WebP quality
+# of the rewritten original.
+IMAGE_NORMALISE_ON_UPLOAD = config('IMAGE_NORMALISE_ON_UPLOAD', default=True, cast=bool)
+IMAGE_ORIGINAL_MAX_DIMENSION = config('IMAGE_ORIGINAL_MAX_DIMENSION', default=3000, cast=int)
+IMAGE_ORIGINAL_QUALITY = config('IMAGE_ORIGINAL_QUALITY', default=90, cast=int)
+# phone photos: HEIC needs pillow_heif, and full-size uploads are accepted as
+# they are shrunk straight after
+WAGTAILIMAGES_EXTENSIONS = ["avif", "gif", "jpg", "jpeg", "png", "webp", "heic"]
+WAGTAILIMAGES_MAX_UPLOAD_SIZE = config(
+    'WAGTAILIMAGES_MAX_UPLOAD_SIZE', default=30 * 1024 * 1024, cast=int
+)
+
 
 INSTALLED_APPS += ['widget_tweaks']
 RECAPTCHA_PUBLIC_KEY = "6Leh0VksAAAAAGIFhTjuf_COwFAs0BD5a4Tp4aa8"
 RECAPTCHA_PRIVATE_KEY = "6Leh0VksAAAAAIXbL3ohofp_sZfH04BSJ0hqQIH3"
 
+# reCAPTCHA verification (see content/recaptcha.py)
+RECAPTCHA_VERIFY_URL = config(
+    'RECAPTCHA_VERIFY_URL',
+    default='https://www.google.com/recaptcha/api/siteverify',
+)
+RECAPTCHA_TIMEOUT = config('RECAPTCHA_TIMEOUT', default=3.0, cast=float)
+RECAPTCHA_MAX_CONNECTIONS = config('RECAPTCHA_MAX_CONNECTIONS', default=20, cast=int)
+# seconds a verified token is remembered so replays are rejected locally
+RECAPTCHA_VERDICT_TTL = config('RECAPTCHA_VERDICT_TTL', default=120, cast=int)
+# accept submissions while the verifier is unreachable (False = reject them)
+RECAPTCHA_FAIL_OPEN = config('RECAPTCHA_FAIL_OPEN', default=False, cast=bool)
+RECAPTCHA_BREAKER_THRESHOLD = config('RECAPTCHA_BREAKER_THRESHOLD', default=5, cast=int)
+RECAPTCHA_BREAKER_RESET = config('RECAPTCHA_BREAKER_RESET', default=30, cast=int)
+
+# Background tasks (django-tasks). Run workers with `manage.py db_worker`;
+# use django_tasks.backends.immediate.ImmediateBackend to run tasks inline.
+TASKS = {
+    'default': {
+        'BACKEND': config(
+            'TASKS_BACKEND',
+            default='django_tasks.backends.database.DatabaseBackend',
+        ),
+    }
+}
+
+# Contact form pipeline (see content/tasks.py)
+CONTACT_PIPELINE_BATCH_SIZE = config('CONTACT_PIPELINE_BATCH_SIZE', default=50, cast=int)
+CONTACT_PIPELINE_MAX_ATTEMPTS = config('CONTACT_PIPELINE_MAX_ATTEMPTS', default=5, cast=int)
+# seconds before the first retry; doubles on every further attempt
+CONTACT_PIPELINE_RETRY_DELAY = config('CONTACT_PIPELINE_RETRY_DELAY', default=60, cast=int)
+
+# Embeds are fetched when a page is published or by `manage.py resolve_embeds`,
+# never while rendering (see content/embeds.py). EMBED_OEMBED_ENDPOINT sends
+# every embed to one oEmbed endpoint instead of the built-in provider list,
+# e.g. a local stub or a caching proxy.
+EMBED_OEMBED_ENDPOINT = config('EMBED_OEMBED_ENDPOINT', default='')
+if EMBED_OEMBED_ENDPOINT:
+    WAGTAILEMBEDS_FINDERS = [{
+        'class': 'wagtail.embeds.finders.oembed',
+        'providers': [{'endpoint': EMBED_OEMBED_ENDPOINT, 'urls': [r'^https?://']}],
+    }]
+# default --rate of resolve_embeds, in provider calls per second
+EMBED_RESOLVE_RATE = config('EMBED_RESOLVE_RATE', default=2.0, cast=float)
+
+# Site search (see content/search.py). The database backend uses PostgreSQL
+# full-text search (tsvector columns with GIN indexes) and SQLite FTS5 in
+# development; objects are reindexed by a task after every save.
+WAGTAILSEARCH_BACKENDS = {
+    'default': {
+        'BACKEND': 'wagtail.search.backends.database',
+        # PostgreSQL text search configuration (stemming, stop words)
+        'SEARCH_CONFIG': config('SEARCH_CONFIG', default='english'),
+    }
+}
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_QUERY_LENGTH = 200
+# searches slower than this (milliseconds) are logged
+SEARCH_SLOW_MS = config('SEARCH_SLOW_MS', default=500, cast=int)
+SEARCH_REINDEX_CHUNK_SIZE = config('SEARCH_REINDEX_CHUNK_SIZE', default=500, cast=int)
+
+# Request instrumentation (see core/metrics.py): per-request time, SQL,
+# template, rendition and outbound HTTP time, labelled by page type. Totals
+# are served at /metrics (Prometheus text format) to METRICS_ALLOWED_IPS or
+# with "Authorization: Bearer <METRICS_TOKEN>". Behind a proxy every client
+# has the proxy's address, so prefer the token there. Totals are summed over
+# the web workers in METRICS_CACHE_ALIAS, so with WEB_CONCURRENCY > 1 it has
+# to be a shared cache (redis).
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_CACHE_ALIAS = 'default'
+# seconds between flushes of a process's counters to the cache
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=10, cast=int)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='', cast=Csv())
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# statements kept per request for the slow-request log
+METRICS_MAX_QUERIES = 500
+# requests slower than this (milliseconds) are logged with their slowest
+# SLOW_REQUEST_QUERIES statements
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=1000, cast=int)
+SLOW_REQUEST_QUERIES = 10
+
+# JSON lines on stderr: every request at INFO, slow requests at WARNING
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.metrics.JSONFormatter'},
+    },
+    'handlers': {
+        'metrics': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'core.metrics': {
+            'handlers': ['metrics'],
+            'level': config('METRICS_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 SILENCED_SYSTEM_CHECKS = ['captcha.recaptcha_test_key_error']
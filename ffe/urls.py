@@ -14,20 +14,31 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.auth import views as auth_views
 from core import views
+from content import views as content_views
 from wagtail.admin import urls as wagtailadmin_urls
 from wagtail import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
-from django.conf import settings
-from django.views.static import serve
+
+if settings.ASYNC_VIEWS:
+    # matched before wagtail's own page view, so it also reverses as "wagtail_serve"
+    page_urls = [
+        re_path(wagtail_urls.serve_pattern, content_views.serve_page, name="wagtail_serve"),
+        *wagtail_urls.urlpatterns,
+    ]
+else:
+    page_urls = wagtail_urls
 
 urlpatterns = [
     path("admin/", admin.site.urls),
 
-    path("", views.home, name="home"),
+    path("", views.ahome if settings.ASYNC_VIEWS else views.home, name="home"),
+
+    path("metrics", views.metrics, name="metrics"),
 
     path(
         "login/",
@@ -37,12 +48,32 @@ urlpatterns = [
 
     path("logout/", auth_views.LogoutView.as_view(), name="logout"),
 
+    path(
+        "contact/<int:page_id>/submit/",
+        content_views.contact_submit,
+        name="contact_submit",
+    ),
+
+    path(
+        "gallery/<int:page_id>/images/",
+        content_views.gallery_images,
+        name="gallery_images",
+    ),
+    path(
+        "gallery/<int:page_id>/events/",
+        content_views.gallery_events,
+        name="gallery_events",
+    ),
+
+    path("search/", content_views.search, name="search"),
+
     path("cms/", include(wagtailadmin_urls)),
-    path("pages/", include(wagtail_urls)),
-    path("documents/", include(wagtaildocs_urls)),  # 🔴 THIS LINE IS REQUIRED
+    path("pages/", include(page_urls)),
     path(
-        "media/<path:path>",
-        serve,
-        {"document_root": settings.MEDIA_ROOT},
+        "documents/<int:document_id>/<str:document_filename>",
+        content_views.serve_document,
+        name="document_serve",
     ),
+    path("documents/", include(wagtaildocs_urls)),  # 🔴 THIS LINE IS REQUIRED
+    path("media/<path:path>", views.media, name="media"),
 ]